@@ -0,0 +1,85 @@
+# benchmarks/bench_file_read.py
+"""
+Benchmark FileHandler.get_file_content (read into memory) against
+open_file_buffer (mmap + memoryview) for hashing and encrypting a file
+
+Each variant runs in its own process so peak RSS is not shared.
+
+Usage:
+    python -m benchmarks.bench_file_read [size_mb]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import resource
+import subprocess
+import tempfile
+from Crypto.PublicKey import RSA
+from server.crypto_utils import CryptoUtils
+from server.file_handler import FileHandler
+
+VARIANTS = ('read', 'mmap')
+
+
+def anon_rss_mb() -> float:
+    """Anonymous (private) resident memory in MB, or -1 if unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return -1.0
+
+
+def run_variant(variant: str, path: str):
+    """Hash and encrypt the file once, print throughput and memory"""
+    file_handler = FileHandler.__new__(FileHandler)
+    public_key = RSA.generate(2048).publickey()
+    size = os.path.getsize(path)
+    baseline = anon_rss_mb()
+    
+    start = time.perf_counter()
+    if variant == 'read':
+        file_data = file_handler.get_file_content(path)
+        hashlib.sha256(file_data).hexdigest()
+        CryptoUtils.encrypt_file_hashed(file_data, public_key)
+        held = anon_rss_mb()
+    else:
+        with file_handler.open_file_buffer(path) as file_data:
+            hashlib.sha256(file_data).hexdigest()
+            CryptoUtils.encrypt_file_hashed(file_data, public_key)
+            held = anon_rss_mb()
+    elapsed = time.perf_counter() - start
+    
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    rate = size / (1024 * 1024) / elapsed
+    print(f"{variant:<6}{rate:10.1f} MB/s{peak_mb:12.1f} MB peak RSS"
+          f"{held - baseline:12.1f} MB anon RSS growth")
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--variant':
+        run_variant(sys.argv[2], sys.argv[3])
+        return
+    
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+        path = f.name
+    
+    print(f"File size: {size_mb} MB (encrypt_file_hashed + SHA-256)")
+    try:
+        for variant in VARIANTS:
+            subprocess.run([sys.executable, '-m', 'benchmarks.bench_file_read',
+                            '--variant', variant, path], check=True)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
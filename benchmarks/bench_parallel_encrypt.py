@@ -0,0 +1,53 @@
+# benchmarks/bench_parallel_encrypt.py
+"""
+Benchmark parallel AES-GCM frame encryption against the single-core CBC path
+
+Usage:
+    python -m benchmarks.bench_parallel_encrypt [size_mb] [max_workers]
+"""
+
+import os
+import sys
+import time
+from Crypto.PublicKey import RSA
+from server.crypto_utils import CryptoUtils
+
+
+def measure(func, size: int, repeat: int = 3) -> float:
+    """Return best throughput in MB/s over a few runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return size / (1024 * 1024) / best
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+    data = os.urandom(size_mb * 1024 * 1024)
+    public_key = RSA.generate(2048).publickey()
+
+    print(f"File size: {size_mb} MB, CPUs: {os.cpu_count()}")
+
+    cbc = measure(lambda: CryptoUtils.encrypt_file(data, public_key), len(data))
+    print(f"{'AES-CBC (single core)':<28}{cbc:10.1f} MB/s")
+
+    workers = 1
+    while workers <= max_workers:
+        for use_processes in (False, True):
+            label = f"GCM {'processes' if use_processes else 'threads'} x{workers}"
+            rate = measure(
+                lambda: CryptoUtils.encrypt_file_parallel(
+                    data, public_key, workers=workers, use_processes=use_processes
+                ),
+                len(data)
+            )
+            print(f"{label:<28}{rate:10.1f} MB/s  ({rate / cbc:.2f}x)")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
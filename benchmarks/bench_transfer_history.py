@@ -0,0 +1,105 @@
+# benchmarks/bench_transfer_history.py
+"""
+Benchmark transfer history pages as the file_transfers table grows, with
+and without the (sender_id|recipient_id, created_at, id) indexes
+
+Rows are spread over 1000 users; each measurement is the best of a few
+runs of the first page and of page 20 (keyset cursor, or the last page
+if the user has fewer).
+
+Usage:
+    python -m benchmarks.bench_transfer_history [max_rows]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+from flask import Flask
+from shared.models import db, FileTransfer
+from server.transfer_history import query_transfer_history, encode_cursor
+
+USERS = 1000
+BATCH_SIZE = 50000
+
+
+def measure(func, repeat: int = 5) -> float:
+    """Return best latency in ms over a few runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def insert_rows(start: int, count: int):
+    """Insert transfers start..start+count with increasing created_at"""
+    t0 = datetime(2026, 1, 1)
+    for offset in range(start, start + count, BATCH_SIZE):
+        rows = []
+        for i in range(offset, min(offset + BATCH_SIZE, start + count)):
+            rows.append({
+                'transfer_id': f't{i}',
+                'sender_id': f'user{random.randrange(USERS)}',
+                'recipient_id': f'user{random.randrange(USERS)}',
+                'file_name': 'file.bin',
+                'file_size': 1024,
+                'file_hash': '0' * 64,
+                'status': 'completed',
+                'created_at': t0 + timedelta(seconds=i)
+            })
+        db.session.execute(FileTransfer.__table__.insert(), rows)
+        db.session.commit()
+
+
+def deep_cursor(user_id: str, depth: int = 20) -> str:
+    """Follow before cursors depth pages down (or to the last page)"""
+    cursor = None
+    for _ in range(depth):
+        page = query_transfer_history(user_id, 'sent', before=cursor, limit=50)
+        if len(page) < 50:
+            break
+        cursor = encode_cursor(page[-1])
+    return cursor
+
+
+def main():
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    sizes = [n for n in (10000, 100000, 1000000, 2000000, 5000000) if n <= max_rows]
+    
+    app = Flask(__name__)
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    db.init_app(app)
+    indexes = list(FileTransfer.__table__.indexes)
+    
+    print(f"{'rows':>10}{'first page':>14}{'page 20':>14}{'no index':>14}")
+    with app.app_context():
+        db.create_all()
+        rows = 0
+        for size in sizes:
+            insert_rows(rows, size - rows)
+            rows = size
+            
+            first = measure(lambda: query_transfer_history('user1', 'sent', limit=50))
+            cursor = deep_cursor('user1')
+            deep = measure(lambda: query_transfer_history('user1', 'sent', before=cursor,
+                                                          limit=50))
+            
+            for index in indexes:
+                index.drop(db.engine)
+            unindexed = measure(lambda: query_transfer_history('user1', 'sent', limit=50),
+                                repeat=2)
+            for index in indexes:
+                index.create(db.engine)
+            
+            print(f"{size:>10}{first:>11.2f} ms{deep:>11.2f} ms{unindexed:>11.2f} ms")
+    
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -150,8 +150,8 @@ function setupSenderSocketListeners() {
             document.getElementById('recipient-section').style.display = 'block';
             document.getElementById('history-section').style.display = 'block';
             
-            // Get online users and transfer history
-            socketManager.getOnlineUsers();
+            // Get online users (kept up to date by pushes) and transfer history
+            socketManager.subscribePresence();
             socketManager.getTransferHistory();
         }
     });
@@ -189,6 +189,11 @@ function setupSenderSocketListeners() {
         }
     });
     
+    socketManager.on('file_transfer_progress', (data) => {
+        // Upload share of the bar: 70% -> 90%
+        updateProgress(70 + Math.round(data.progress / 5), 'Đang gửi file... ' + data.progress + '%');
+    });
+    
     socketManager.on('online_users_updated', (users) => {
         updateOnlineUsersList(users);
     });
@@ -259,6 +264,8 @@ function setupReceiverSocketListeners() {
             document.getElementById('process-file-name').textContent = data.encrypted_package.file_name;
             document.getElementById('process-sender').textContent = data.sender_id;
             document.getElementById('process-time').textContent = new Date().toLocaleString('vi-VN');
+        } else if (data.message) {
+            showStatus(data.message, 'error');
         }
     });
     
@@ -350,7 +357,7 @@ async function handleEncryptAndSend() {
         // ... gửi các trường khác như cũ ...
         encryptedPackage.metadata = metadata; // vẫn gửi object để hiển thị
         updateProgress(70, 'Đang gửi file...');
-        socketManager.sendFile(recipientId, encryptedPackage);
+        await socketManager.sendFileChunked(recipientId, encryptedPackage);
         updateProgress(90, 'Đang xác nhận...');
     } catch (error) {
         console.error('Encryption error:', error);
@@ -717,19 +724,11 @@ if ('Notification' in window && Notification.permission === 'default') {
     Notification.requestPermission();
 }
 
-// Auto-refresh online users every 30 seconds
-setInterval(() => {
-    if (socketManager.connected && socketManager.userId) {
-        socketManager.getOnlineUsers();
-    }
-}, 30000);
-
 // Handle page visibility change
 document.addEventListener('visibilitychange', () => {
     if (!document.hidden && socketManager.connected) {
         // Refresh data when page becomes visible
         socketManager.getTransferHistory();
-        socketManager.getOnlineUsers();
     }
 });
 
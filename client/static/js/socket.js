@@ -11,6 +11,11 @@ class SocketManager {
         this.publicKey = null;
         this.recipientPublicKey = null;
         this.eventHandlers = {};
+        this.publicKeysCache = { etag: null, keys: {} };
+        this.onlineUsers = new Map();
+        this.presenceVersion = null;
+        this.pendingPresenceDiffs = new Map();  // version -> diff arrived early
+        this.presenceGapTimer = null;
     }
 
     /**
@@ -75,12 +80,16 @@ class SocketManager {
             this.emit('file_sent', data);
         });
 
+        this.socket.on('file_transfer_progress', (data) => {
+            this.emit('file_transfer_progress', data);
+        });
+
         this.socket.on('file_received', (data) => {
             this.emit('file_received', data);
         });
 
         this.socket.on('file_download_response', (data) => {
-            this.emit('file_download_ready', data);
+            this.fetchDownload(data);
         });
 
         this.socket.on('transfer_completed', (data) => {
@@ -88,7 +97,14 @@ class SocketManager {
         });
 
         this.socket.on('online_users_response', (data) => {
+            this.onlineUsers = new Map(data.users.map(user => [user.user_id, user]));
+            this.presenceVersion = data.version;
             this.emit('online_users_updated', data.users);
+            this.drainPresenceDiffs();
+        });
+
+        this.socket.on('presence_diff', (data) => {
+            this.applyPresenceDiff(data);
         });
 
         this.socket.on('transfer_history_response', (data) => {
@@ -116,6 +132,32 @@ class SocketManager {
         });
     }
 
+    /**
+     * Fetch public keys for many users in one request, revalidating the
+     * cached address book with its ETag
+     */
+    async getPublicKeys(userIds) {
+        const headers = { 'Content-Type': 'application/json' };
+        if (this.publicKeysCache.etag) {
+            headers['If-None-Match'] = this.publicKeysCache.etag;
+        }
+
+        const response = await fetch('/api/public_keys', {
+            method: 'POST',
+            headers: headers,
+            body: JSON.stringify({ user_ids: userIds })
+        });
+
+        if (response.status !== 304) {
+            const data = await response.json();
+            this.publicKeysCache = {
+                etag: response.headers.get('ETag'),
+                keys: data.keys || {}
+            };
+        }
+        return this.publicKeysCache.keys;
+    }
+
     /**
      * Send encrypted file
      */
@@ -126,6 +168,108 @@ class SocketManager {
         });
     }
 
+    /**
+     * Send encrypted file in binary chunks with flow control
+     *
+     * The package is announced without its ciphertext (transfer_start),
+     * the raw ciphertext follows as binary transfer_chunk events with at
+     * most `window` chunks unacknowledged, then transfer_commit stores it.
+     * Resolves when all chunks are acknowledged and the commit is sent.
+     */
+    sendFileChunked(recipientId, encryptedPackage) {
+        const { encryptedFile, ...header } = encryptedPackage;
+        const binary = atob(encryptedFile);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+
+        return new Promise((resolve, reject) => {
+            const requestId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+            let transferId = null;
+            let chunkSize = 0;
+            let window = 0;
+            let nextOffset = 0;
+            let nextIndex = 0;
+            let inFlight = 0;
+
+            const cleanup = () => {
+                this.socket.off('transfer_ready', onReady);
+                this.socket.off('transfer_ack', onAck);
+                this.socket.off('error', onError);
+            };
+
+            const sendMore = () => {
+                // The server only accepts chunks below nextIndex + window
+                while (nextOffset < bytes.length && nextOffset / chunkSize < nextIndex + window) {
+                    const chunk = bytes.slice(nextOffset, nextOffset + chunkSize);
+                    this.socket.emit('transfer_chunk', {
+                        transfer_id: transferId,
+                        offset: nextOffset,
+                        data: chunk.buffer
+                    });
+                    nextOffset += chunk.length;
+                    inFlight++;
+                }
+
+                if (inFlight === 0 && nextOffset >= bytes.length) {
+                    cleanup();
+                    this.socket.emit('transfer_commit', { transfer_id: transferId });
+                    resolve(transferId);
+                }
+            };
+
+            const onReady = (data) => {
+                if (data.request_id !== requestId) {
+                    return;
+                }
+                transferId = data.transfer_id;
+                chunkSize = data.chunk_size;
+                window = data.window;
+                sendMore();
+            };
+
+            const onAck = (data) => {
+                if (data.transfer_id !== transferId) {
+                    return;
+                }
+                inFlight--;
+                nextIndex = Math.max(nextIndex, data.next_index);
+                sendMore();
+            };
+
+            const onError = (error) => {
+                // Only errors about this transfer (or its start request)
+                if (transferId ? error.transfer_id !== transferId : error.request_id !== requestId) {
+                    return;
+                }
+                cleanup();
+                reject(new Error(error.message));
+            };
+
+            this.socket.on('transfer_ready', onReady);
+            this.socket.on('transfer_ack', onAck);
+            this.socket.on('error', onError);
+
+            this.socket.emit('transfer_start', {
+                request_id: requestId,
+                recipient_id: recipientId,
+                package: header,
+                total_size: bytes.length
+            });
+        });
+    }
+
+    /**
+     * Send an uploaded file to several recipients (encrypted once on the server)
+     */
+    sendFileMulti(recipientIds, filePath) {
+        this.socket.emit('send_file_multi', {
+            recipient_ids: recipientIds,
+            file_path: filePath
+        });
+    }
+
     /**
      * Download file by transfer ID
      */
@@ -135,6 +279,33 @@ class SocketManager {
         });
     }
 
+    /**
+     * Fetch the package behind a signed download URL
+     */
+    async fetchDownload(data) {
+        if (data.status !== 'success' || !data.download_url) {
+            this.emit('file_download_ready', data);
+            return;
+        }
+
+        try {
+            const response = await fetch(data.download_url);
+            if (!response.ok) {
+                const error = await response.json().catch(() => ({}));
+                throw new Error(error.message || `HTTP ${response.status}`);
+            }
+            const encryptedPackage = await response.json();
+            this.emit('file_download_ready', { ...data, encrypted_package: encryptedPackage });
+        } catch (error) {
+            console.error('Download failed:', error);
+            this.emit('file_download_ready', {
+                ...data,
+                status: 'error',
+                message: `Tải file thất bại: ${error.message}`
+            });
+        }
+    }
+
     /**
      * Report decryption result
      */
@@ -155,11 +326,74 @@ class SocketManager {
         this.socket.emit('get_online_users');
     }
 
+    /**
+     * Subscribe to presence pushes (also sends the current online list)
+     */
+    subscribePresence() {
+        this.socket.emit('subscribe_presence');
+    }
+
+    /**
+     * Apply a presence_diff to the online users list
+     */
+    applyPresenceDiff(diff) {
+        if (this.presenceVersion !== null && diff.version <= this.presenceVersion) {
+            return;
+        }
+        // Diffs pushed by different workers can arrive out of order: hold
+        // them until the versions before them are in
+        this.pendingPresenceDiffs.set(diff.version, diff);
+        this.drainPresenceDiffs();
+    }
+
+    /**
+     * Apply held presence diffs that follow the current version; refetch
+     * the full list if a gap doesn't fill within a few seconds
+     */
+    drainPresenceDiffs() {
+        if (this.presenceVersion === null) {
+            return;
+        }
+        let changed = false;
+        for (const version of Array.from(this.pendingPresenceDiffs.keys())) {
+            if (version <= this.presenceVersion) {
+                this.pendingPresenceDiffs.delete(version);
+            }
+        }
+        let diff;
+        while ((diff = this.pendingPresenceDiffs.get(this.presenceVersion + 1))) {
+            this.pendingPresenceDiffs.delete(diff.version);
+            diff.offline.forEach(userId => this.onlineUsers.delete(userId));
+            diff.online.forEach(user => this.onlineUsers.set(user.user_id, user));
+            this.presenceVersion = diff.version;
+            changed = true;
+        }
+        if (changed) {
+            this.emit('online_users_updated', Array.from(this.onlineUsers.values()));
+        }
+
+        if (this.pendingPresenceDiffs.size === 0) {
+            clearTimeout(this.presenceGapTimer);
+            this.presenceGapTimer = null;
+        } else if (this.presenceGapTimer === null) {
+            // Missed a diff (e.g. reconnect): fetch the full list again
+            this.presenceGapTimer = setTimeout(() => {
+                this.presenceGapTimer = null;
+                this.getOnlineUsers();
+            }, 3000);
+        }
+    }
+
     /**
      * Get transfer history
+     *
+     * options: direction, status, before/since (cursors from a previous
+     * response, with a direction), cursors ({sent: {before}, received:
+     * {since}, ...} for both directions) and limit; none returns the
+     * newest page of both directions
      */
-    getTransferHistory() {
-        this.socket.emit('get_transfer_history');
+    getTransferHistory(options = {}) {
+        this.socket.emit('get_transfer_history', options);
     }
 
     /**
@@ -4,18 +4,26 @@ Main Flask application
 """
 
 import os
-from flask import Flask, render_template, request, jsonify, send_file
+import hashlib
+from datetime import datetime
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_socketio import SocketIO
 from flask_cors import CORS
 from werkzeug.exceptions import RequestEntityTooLarge
 
 from server.config import config
 from server.key_manager import KeyManager
+from server.key_pool import KeyPool
+from server.executor import CPUExecutor
 from server.crypto_utils import CryptoUtils, SecureFileTransfer
 from server.file_handler import FileHandler
 from server.socket_events import SocketEventHandlers
-from shared.models import db
-from shared.constants import ERROR_MESSAGES
+from server.ranged_file import send_file_ranged
+from server.message_queue import socketio_queue_options
+from server.state_store import create_state_store
+from server.signed_urls import DownloadSigner, BadSignature, SignatureExpired
+from shared.models import db, PublicKeyRegistry, FileTransfer
+from shared.constants import ERROR_MESSAGES, MAX_BATCH_KEY_LOOKUP, CONTAINER_FILENAME
 
 
 def create_app(config_name='default'):
@@ -31,22 +39,89 @@ def create_app(config_name='default'):
     # Initialize extensions
     db.init_app(app)
     CORS(app, origins=app.config['CORS_ORIGINS'])
-    socketio = SocketIO(app, cors_allowed_origins="*")
+    socketio = SocketIO(app, cors_allowed_origins="*",
+                        **socketio_queue_options(app.config['SOCKETIO_MESSAGE_QUEUE'],
+                                                 app.config['SOCKETIO_CHANNEL']))
+    # Workers share connections, presence and the presence version; by
+    # default they use the message queue's Redis (or in-process store)
+    message_queue = app.config['SOCKETIO_MESSAGE_QUEUE']
+    state_url = app.config['SHARED_STATE_URL']
+    if not state_url and message_queue.startswith(('redis://', 'rediss://', 'local://')):
+        state_url = message_queue
+    if message_queue and not state_url:
+        app.logger.warning("SOCKETIO_MESSAGE_QUEUE without SHARED_STATE_URL: "
+                           "presence is not shared between workers")
+    state_store = create_state_store(state_url)
+    download_signer = DownloadSigner(app.config['SECRET_KEY'],
+                                     ttl=app.config['DOWNLOAD_URL_TTL'])
     
     # Initialize services
-    key_manager = KeyManager(app.config['SERVER_KEYS_DIR'])
+    key_manager = KeyManager(app.config['SERVER_KEYS_DIR'],
+                             cache_size=app.config['KEY_CACHE_SIZE'])
     file_handler = FileHandler(app.config['UPLOAD_FOLDER'])
     crypto_utils = CryptoUtils()
-    secure_transfer = SecureFileTransfer(key_manager)
+    secure_transfer = SecureFileTransfer(
+        key_manager,
+        workers=app.config['ENCRYPTION_WORKERS'],
+        parallel_threshold=app.config['PARALLEL_ENCRYPTION_THRESHOLD'],
+        compression=app.config['COMPRESSION_ENABLED']
+    )
+    
+    cpu_executor = CPUExecutor(socketio, max_workers=app.config['CPU_WORKERS'],
+                               lag_interval=app.config['LOOP_LAG_INTERVAL'])
+    cpu_executor.start_lag_monitor()
+    
+    key_pool = KeyPool(key_manager, cpu_executor, size=app.config['KEY_POOL_SIZE'],
+                       key_size=app.config['RSA_KEY_SIZE'])
+    key_pool.start()
+    
+    def expire_upload_sessions():
+        """Periodically delete abandoned resumable uploads"""
+        while True:
+            socketio.sleep(app.config['UPLOAD_SESSION_SWEEP_INTERVAL'])
+            file_handler.expire_upload_sessions(app.config['UPLOAD_SESSION_TTL'])
+    
+    if app.config['UPLOAD_SESSION_SWEEP_INTERVAL'] > 0:
+        socketio.start_background_task(expire_upload_sessions)
+    
+    def expire_files():
+        """Delete expired uploads and packages in batches, yielding between them"""
+        while True:
+            socketio.sleep(app.config['EXPIRY_SWEEP_INTERVAL'])
+            with app.app_context():
+                while file_handler.cleanup_old_files(
+                    app.config['FILE_RETENTION_DAYS'], app.config['EXPIRY_BATCH_SIZE']
+                ) == app.config['EXPIRY_BATCH_SIZE']:
+                    socketio.sleep(0)
+    
+    if app.config['EXPIRY_SWEEP_INTERVAL'] > 0:
+        socketio.start_background_task(expire_files)
     
     # Initialize socket handlers
     socket_handlers = SocketEventHandlers(
-        socketio, key_manager, file_handler, crypto_utils
+        socketio, key_manager, file_handler, crypto_utils, secure_transfer,
+        key_pool, cpu_executor, state_store, download_signer
     )
+    socket_handlers.start_presence_updates(app.config['PRESENCE_PUSH_INTERVAL'])
+    
+    def convert_legacy_package(transfer_id, sender_id):
+        """Convert a legacy JSON package and store the container's Merkle tree"""
+        encrypted_path = file_handler.convert_legacy_package(transfer_id)
+        if encrypted_path:
+            cpu_executor.run(socket_handlers.store_merkle_tree, transfer_id, sender_id)
+        return encrypted_path
     
     # Create database tables
     with app.app_context():
         db.create_all()
+        
+        # create_all skips tables that exist; add indexes introduced later
+        for index in FileTransfer.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        
+        # Register keys of a key store that predates the registry
+        if PublicKeyRegistry.query.first() is None:
+            key_manager.rebuild_index()
     
     # Routes
     @app.route('/')
@@ -69,7 +144,21 @@ def create_app(config_name='default'):
         """Health check endpoint"""
         return jsonify({
             'status': 'healthy',
-            'message': 'Server is running'
+            'message': 'Server is running',
+            'key_cache': key_manager.cache_stats(),
+            'key_pool': key_pool.stats()
+        })
+    
+    @app.route('/api/metrics')
+    def metrics():
+        """Runtime metrics (event-loop lag, executor and cache counters)"""
+        return jsonify({
+            'status': 'success',
+            'executor': cpu_executor.stats(),
+            'key_cache': key_manager.cache_stats(),
+            'key_pool': key_pool.stats(),
+            'blob_store': file_handler.blob_store.stats(),
+            'connections': state_store.connection_count()
         })
     
     @app.route('/api/generate_keys', methods=['POST'])
@@ -85,8 +174,10 @@ def create_app(config_name='default'):
             }), 400
         
         try:
-            # Generate keys
-            private_key, public_key = key_manager.generate_key_pair()
+            # Take pre-generated keys if available
+            key_pair = key_pool.acquire() or cpu_executor.run(key_manager.generate_key_pair,
+                                                              key_pool.key_size)
+            private_key, public_key = key_pair
             
             # Save keys
             paths = key_manager.save_key_pair(user_id, private_key, public_key)
@@ -127,6 +218,78 @@ def create_app(config_name='default'):
                 'message': str(e)
             }), 500
     
+    @app.route('/api/public_keys', methods=['GET', 'POST'])
+    def get_public_keys():
+        """
+        Get public keys and fingerprints for many users at once
+        
+        GET ?user_ids=a,b,c or POST {"user_ids": [...]}. Without user_ids the
+        whole address book is returned. Responses carry a strong ETag and
+        answer If-None-Match with 304, so clients can revalidate cheaply.
+        """
+        if request.method == 'POST':
+            user_ids = (request.get_json(silent=True) or {}).get('user_ids')
+        else:
+            user_ids = request.args.get('user_ids')
+            user_ids = user_ids.split(',') if user_ids else None
+        
+        query = PublicKeyRegistry.query
+        if user_ids is not None:
+            user_ids = sorted(set(filter(None, user_ids)))
+            if len(user_ids) > MAX_BATCH_KEY_LOOKUP:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'At most {MAX_BATCH_KEY_LOOKUP} user IDs per request'
+                }), 400
+            query = query.filter(PublicKeyRegistry.user_id.in_(user_ids))
+        entries = query.order_by(PublicKeyRegistry.user_id).all()
+        
+        # ETag covers every entry version plus the IDs that were not found
+        found = {entry.user_id for entry in entries}
+        missing = [user_id for user_id in user_ids or [] if user_id not in found]
+        etag_source = hashlib.sha256()
+        for entry in entries:
+            updated_at = entry.updated_at.isoformat() if entry.updated_at else ''
+            etag_source.update(f"{entry.user_id}|{entry.fingerprint}|{updated_at}\n".encode())
+        etag_source.update(('missing:' + ','.join(missing)).encode())
+        etag = etag_source.hexdigest()
+        
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify({
+                'status': 'success',
+                'keys': {
+                    entry.user_id: {
+                        'public_key': entry.public_key,
+                        'fingerprint': entry.fingerprint,
+                        'updated_at': entry.updated_at.isoformat() if entry.updated_at else None
+                    }
+                    for entry in entries
+                },
+                'missing': missing
+            })
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    @app.route('/api/key_registry')
+    def get_key_registry():
+        """List stored public keys one page at a time"""
+        after = request.args.get('after')
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        
+        entries = key_manager.export_public_keys_with_fingerprints(after=after, limit=limit)
+        user_ids = list(entries)
+        
+        return jsonify({
+            'status': 'success',
+            'keys': entries,
+            'next_cursor': user_ids[-1] if len(user_ids) == limit else None,
+            'total': key_manager.count_users()
+        })
+    
     @app.route('/api/upload', methods=['POST'])
     def upload_file():
         """Handle file upload"""
@@ -157,36 +320,240 @@ def create_app(config_name='default'):
                 'message': ERROR_MESSAGES['INVALID_FILE']
             }), 400
         
+        return _save_upload_stream(file.stream, file.filename, user_id)
+    
+    @app.route('/api/upload/stream', methods=['POST', 'PUT'])
+    def upload_file_stream():
+        """
+        Handle a raw (non-multipart) upload streamed from the request body
+        
+        The file name and user ID are passed as query parameters.
+        """
+        user_id = request.args.get('user_id')
+        filename = request.args.get('filename', '')
+        
+        if not user_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'User ID is required'
+            }), 400
+        
+        if not file_handler.allowed_file(filename):
+            return jsonify({
+                'status': 'error',
+                'message': ERROR_MESSAGES['INVALID_FILE']
+            }), 400
+        
+        return _save_upload_stream(request.stream, filename, user_id)
+    
+    def _save_upload_stream(stream, filename, user_id):
+        """Stream an upload to disk, hashing and size-checking as it arrives"""
         try:
-            # Read file content
-            file_data = file.read()
-            
-            # Validate file size
-            is_valid, message = file_handler.validate_file_size(len(file_data))
-            if not is_valid:
-                return jsonify({
-                    'status': 'error',
-                    'message': message
-                }), 400
-            
-            # Save file
-            file_id, file_path, file_size = file_handler.save_uploaded_file(
-                file_data, file.filename, user_id
+            file_id, file_path, file_size, file_hash = file_handler.save_uploaded_stream(
+                stream, filename, user_id
             )
-            
+        except ValueError as e:
             return jsonify({
-                'status': 'success',
-                'message': 'File uploaded successfully',
-                'file_id': file_id,
-                'file_size': file_size,
-                'file_hash': crypto_utils.hash_file(file_data)
-            })
-            
+                'status': 'error',
+                'message': str(e)
+            }), 400
         except Exception as e:
             return jsonify({
                 'status': 'error',
                 'message': str(e)
             }), 500
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'File uploaded successfully',
+            'file_id': file_id,
+            'file_size': file_size,
+            'file_hash': file_hash
+        })
+    
+    @app.route('/api/uploads', methods=['GET'])
+    def list_uploads():
+        """
+        List a user's uploads, newest first
+        
+        Query: user_id, optional since/before (ISO timestamps) and limit
+        """
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'User ID is required'
+            }), 400
+        
+        try:
+            since = request.args.get('since')
+            before = request.args.get('before')
+            since = datetime.fromisoformat(since) if since else None
+            before = datetime.fromisoformat(before) if before else None
+            limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        uploads = file_handler.list_uploads(user_id, since=since, before=before,
+                                            limit=limit)
+        
+        return jsonify({
+            'status': 'success',
+            'uploads': [upload.to_dict() for upload in uploads],
+            'next_before': uploads[-1].created_at.isoformat() if len(uploads) == limit else None
+        })
+    
+    @app.route('/api/uploads', methods=['POST'])
+    def create_upload_session():
+        """
+        Start a resumable upload
+        
+        Body: {"user_id": ..., "filename": ..., "total_size": ...}
+        """
+        data = request.get_json(silent=True) or {}
+        user_id = data.get('user_id')
+        filename = data.get('filename', '')
+        total_size = data.get('total_size')
+        
+        if not user_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'User ID is required'
+            }), 400
+        
+        if not file_handler.allowed_file(filename):
+            return jsonify({
+                'status': 'error',
+                'message': ERROR_MESSAGES['INVALID_FILE']
+            }), 400
+        
+        if not isinstance(total_size, int) or isinstance(total_size, bool):
+            return jsonify({
+                'status': 'error',
+                'message': 'total_size must be an integer'
+            }), 400
+        
+        try:
+            session = file_handler.create_upload_session(user_id, filename, total_size)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        return jsonify({
+            'status': 'success',
+            'session': session
+        }), 201
+    
+    def _check_upload_session_owner(session_id):
+        """
+        Check that the user_id query parameter owns an upload session
+        
+        Returns:
+            Error response, or None if the caller may use the session
+        """
+        session = file_handler.get_upload_session(session_id)
+        if not session:
+            return jsonify({
+                'status': 'error',
+                'message': 'Upload session not found'
+            }), 404
+        
+        if session['user_id'] != request.args.get('user_id'):
+            return jsonify({
+                'status': 'error',
+                'message': 'Not allowed to use this upload session'
+            }), 403
+        return None
+    
+    @app.route('/api/uploads/<session_id>', methods=['GET'])
+    def get_upload_session(session_id):
+        """Get received and missing byte ranges of a resumable upload (?user_id=)"""
+        error = _check_upload_session_owner(session_id)
+        if error:
+            return error
+        
+        session = file_handler.get_upload_session(session_id)
+        return jsonify({
+            'status': 'success',
+            'session': session
+        })
+    
+    @app.route('/api/uploads/<session_id>', methods=['PUT'])
+    def upload_chunk(session_id):
+        """
+        Write one chunk of a resumable upload
+        
+        The chunk is the raw request body; its position is given by the
+        offset query parameter and the session owner by user_id. Chunks may
+        arrive in any order and may be re-sent after a dropped connection.
+        """
+        error = _check_upload_session_owner(session_id)
+        if error:
+            return error
+        
+        try:
+            offset = int(request.args.get('offset', ''))
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': 'offset must be an integer'
+            }), 400
+        
+        try:
+            session = file_handler.write_upload_chunk(
+                session_id, offset, request.get_data(cache=False)
+            )
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': 'Upload session not found'
+            }), 404
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        return jsonify({
+            'status': 'success',
+            'session': session
+        })
+    
+    @app.route('/api/uploads/<session_id>/finalize', methods=['POST'])
+    def finalize_upload_session(session_id):
+        """Turn a complete resumable upload into a regular uploaded file (?user_id=)"""
+        error = _check_upload_session_owner(session_id)
+        if error:
+            return error
+        
+        try:
+            file_id, file_path, file_size, file_hash = file_handler.finalize_upload_session(
+                session_id
+            )
+        except KeyError:
+            return jsonify({
+                'status': 'error',
+                'message': 'Upload session not found'
+            }), 404
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e),
+                'missing': file_handler.get_upload_session(session_id)['missing']
+            }), 409
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'File uploaded successfully',
+            'file_id': file_id,
+            'file_size': file_size,
+            'file_hash': file_hash
+        })
     
     @app.route('/api/encrypt_and_send', methods=['POST'])
     def encrypt_and_send():
@@ -205,21 +572,22 @@ def create_app(config_name='default'):
             }), 400
         
         try:
-            # Load file
-            file_data = file_handler.get_file_content(file_path)
-            if not file_data:
-                return jsonify({
-                    'status': 'error',
-                    'message': 'File not found'
-                }), 404
-            
-            # Prepare for transfer
-            transfer_package = secure_transfer.prepare_file_for_transfer(
-                file_data,
-                os.path.basename(file_path),
-                sender_id,
-                recipient_id
-            )
+            # Map the file instead of copying it into memory
+            with file_handler.open_file_buffer(file_path) as file_data:
+                if not file_data:
+                    return jsonify({
+                        'status': 'error',
+                        'message': 'File not found'
+                    }), 404
+                
+                # Prepare for transfer
+                transfer_package = cpu_executor.run(
+                    secure_transfer.prepare_file_for_transfer,
+                    file_data,
+                    os.path.basename(file_path),
+                    sender_id,
+                    recipient_id
+                )
             
             return jsonify({
                 'status': 'success',
@@ -247,8 +615,8 @@ def create_app(config_name='default'):
         
         try:
             # Process received file
-            file_data, file_name, is_valid, message = secure_transfer.receive_and_process_file(
-                transfer_package
+            file_data, file_name, is_valid, message = cpu_executor.run(
+                secure_transfer.receive_and_process_file, transfer_package
             )
             
             # Save decrypted file
@@ -281,7 +649,7 @@ def create_app(config_name='default'):
     
     @app.route('/api/download/<path:file_path>')
     def download_file(file_path):
-        """Download decrypted file"""
+        """Download decrypted file (supports Range / If-Range)"""
         try:
             # Security check - ensure file is in allowed directory
             full_path = os.path.abspath(file_path)
@@ -294,7 +662,7 @@ def create_app(config_name='default'):
                 }), 403
             
             if os.path.exists(full_path):
-                return send_file(full_path, as_attachment=True)
+                return send_file_ranged(full_path)
             else:
                 return jsonify({
                     'status': 'error',
@@ -307,6 +675,173 @@ def create_app(config_name='default'):
                 'message': str(e)
             }), 500
     
+    @app.route('/api/transfers/<transfer_id>/package')
+    def download_package(transfer_id):
+        """
+        Download the stored binary container of a transfer
+        
+        Supports Range / If-Range so receivers can resume or fetch parts in
+        parallel. For packages shared between recipients the container holds
+        no wrapped key; the caller's key is sent in X-Encrypted-AES-Key.
+        """
+        user_id = request.args.get('user_id')
+        transfer = FileTransfer.query.filter_by(transfer_id=transfer_id).first()
+        
+        if not transfer:
+            return jsonify({
+                'status': 'error',
+                'message': 'Transfer not found'
+            }), 404
+        
+        if user_id not in (transfer.sender_id, transfer.recipient_id):
+            return jsonify({
+                'status': 'error',
+                'message': 'Not allowed to download this package'
+            }), 403
+        
+        encrypted_path = file_handler.get_encrypted_path(transfer_id)
+        if encrypted_path and not encrypted_path.endswith(CONTAINER_FILENAME):
+            encrypted_path = convert_legacy_package(transfer_id, transfer.sender_id)
+        
+        if not encrypted_path:
+            return jsonify({
+                'status': 'error',
+                'message': 'Package not available'
+            }), 404
+        
+        response = send_file_ranged(encrypted_path,
+                                    download_name=f'{transfer_id}.sftc',
+                                    mimetype='application/octet-stream')
+        
+        envelope = file_handler.load_key_envelope(transfer_id)
+        if envelope:
+            response.headers['X-Encrypted-AES-Key'] = envelope['encrypted_aes_key']
+        
+        return response
+    
+    @app.route('/api/transfers/<transfer_id>/package.json')
+    def download_package_json(transfer_id):
+        """
+        Stream the encrypted package of a transfer as JSON
+        
+        Query: token (signed URL handed out by the download_file socket
+        event). The package is generated from the stored container while
+        it is sent (packages kept as legacy JSON are sent from the file),
+        with chunked transfer encoding.
+        """
+        try:
+            token_transfer_id, user_id = download_signer.verify(request.args.get('token', ''))
+        except SignatureExpired:
+            return jsonify({
+                'status': 'error',
+                'message': 'Download link expired'
+            }), 403
+        except BadSignature:
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid download link'
+            }), 403
+        
+        transfer = FileTransfer.query.filter_by(transfer_id=transfer_id).first()
+        if token_transfer_id != transfer_id or not transfer \
+                or user_id not in (transfer.sender_id, transfer.recipient_id):
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid download link'
+            }), 403
+        
+        encrypted_path = file_handler.get_encrypted_path(transfer_id)
+        if encrypted_path and not encrypted_path.endswith(CONTAINER_FILENAME):
+            # Packages that have no container form stay JSON and are sent as is
+            encrypted_path = convert_legacy_package(transfer_id, transfer.sender_id) \
+                or encrypted_path
+        
+        opened = None
+        if encrypted_path and encrypted_path.endswith(CONTAINER_FILENAME):
+            opened = file_handler.open_encrypted_container(transfer_id)
+        elif encrypted_path:
+            f = open(encrypted_path, 'rb')
+            opened = None, f
+        
+        if not opened:
+            return jsonify({
+                'status': 'error',
+                'message': 'Encrypted file not found'
+            }), 404
+        header, f = opened
+        
+        if header:
+            chunks = CryptoUtils.iter_package_json(header, f)
+        else:
+            chunks = iter(lambda: f.read(64 * 1024), b'')
+        
+        def generate():
+            try:
+                yield from chunks
+            finally:
+                f.close()
+        
+        response = Response(stream_with_context(generate()), mimetype='application/json')
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+    
+    @app.route('/api/transfers/<transfer_id>/merkle_tree')
+    def get_merkle_tree(transfer_id):
+        """Get the signed Merkle tree of a stored package"""
+        merkle_tree = file_handler.load_merkle_tree(transfer_id)
+        
+        if not merkle_tree:
+            return jsonify({
+                'status': 'error',
+                'message': 'Merkle tree not found'
+            }), 404
+        
+        return jsonify({
+            'status': 'success',
+            'transfer_id': transfer_id,
+            'merkle_tree': merkle_tree
+        })
+    
+    @app.cli.command('convert-packages')
+    def convert_packages():
+        """Convert stored encrypted_package.json files to binary containers"""
+        converted = file_handler.convert_legacy_packages()
+        senders = dict(db.session.query(FileTransfer.transfer_id, FileTransfer.sender_id)
+                       .filter(FileTransfer.transfer_id.in_(converted)))
+        for transfer_id in converted:
+            socket_handlers.store_merkle_tree(transfer_id, senders.get(transfer_id))
+        print(f"Converted {len(converted)} package(s)")
+    
+    @app.cli.command('migrate-keys')
+    def migrate_keys():
+        """Move the key store to the sharded directory layout (safe while running)"""
+        moved = key_manager.migrate_to_sharded()
+        print(f"Moved {moved} user(s) to the sharded layout")
+    
+    @app.cli.command('gc-blobs')
+    def gc_blobs():
+        """Delete stored upload contents that no upload references"""
+        deleted = file_handler.blob_store.gc()
+        print(f"Deleted {deleted} unreferenced blob(s)")
+    
+    @app.cli.command('import-sidecars')
+    def import_sidecars():
+        """Move upload metadata.json sidecars into the uploaded_files table"""
+        imported = file_handler.import_upload_sidecars()
+        print(f"Imported {imported} upload(s)")
+    
+    @app.cli.command('index-expiry')
+    def index_expiry():
+        """Add files written before the expiry index existed to it"""
+        indexed = file_handler.rebuild_expiry_index()
+        print(f"Indexed {indexed} director(ies)")
+    
+    @app.cli.command('reset-shared-state')
+    def reset_shared_state():
+        """Drop shared connection/presence state (all workers stopped)"""
+        state_store.clear()
+        print("Cleared shared connection and presence state")
+    
     @app.errorhandler(RequestEntityTooLarge)
     def handle_file_too_large(e):
         """Handle file too large error"""
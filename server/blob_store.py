@@ -0,0 +1,174 @@
+# server/blob_store.py
+"""
+Content-addressed blob store for uploads
+Each distinct content is stored once under its SHA-256 and hardlinked into
+the upload directories that use it, so the link count of a blob is its
+reference count: a blob with no other links is garbage
+"""
+
+import os
+import re
+import uuid
+import time
+import threading
+from typing import Dict
+
+
+_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class BlobStore:
+    """Stores file contents once per SHA-256"""
+    
+    TEMP_DIRNAME = 'tmp'
+    
+    def __init__(self, root: str):
+        """
+        Initialize Blob Store
+        
+        Args:
+            root: Directory for blobs (must be on the same filesystem as the
+                  upload directories, since blobs are hardlinked)
+        """
+        self.root = root
+        self.temp_dir = os.path.join(root, self.TEMP_DIRNAME)
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.temp_dir, exist_ok=True)
+    
+    def blob_path(self, file_hash: str) -> str:
+        """
+        Get the path of a blob
+        
+        Raises:
+            ValueError: If file_hash is not a hex SHA-256
+        """
+        if not _HASH_RE.match(file_hash or ''):
+            raise ValueError("Invalid SHA-256 hash")
+        return os.path.join(self.root, file_hash[:2], file_hash)
+    
+    def exists(self, file_hash: str) -> bool:
+        """Check if content with this hash is stored"""
+        return os.path.exists(self.blob_path(file_hash))
+    
+    def temp_path(self) -> str:
+        """Get a fresh path for writing content before its hash is known"""
+        return os.path.join(self.temp_dir, f'{uuid.uuid4()}.part')
+    
+    def link(self, file_hash: str, target_path: str) -> bool:
+        """
+        Reference stored content from target_path
+        
+        Returns:
+            True if the blob exists and was linked, False otherwise
+        """
+        with self._lock:
+            try:
+                os.link(self.blob_path(file_hash), target_path)
+            except FileNotFoundError:
+                return False
+            self.deduplicated += 1
+        
+        # Links share one inode: refresh its mtime so age-based cleanup
+        # doesn't remove the new upload together with the oldest one
+        os.utime(target_path)
+        return True
+    
+    def ingest(self, temp_path: str, file_hash: str, target_path: str) -> bool:
+        """
+        Move a written temp file into the store and link it to target_path
+        
+        If the content is already stored the temp file is discarded. The
+        blob is created with os.link, which fails if it exists, so two
+        uploads of the same content can never replace each other's inode.
+        
+        Args:
+            temp_path: File holding the content (consumed)
+            file_hash: SHA-256 of the content
+            target_path: Path that should reference the content
+        
+        Returns:
+            True if the content was already stored (deduplicated)
+        """
+        blob_path = self.blob_path(file_hash)
+        with self._lock:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            while True:
+                try:
+                    os.link(temp_path, blob_path)
+                    deduplicated = False
+                except FileExistsError:
+                    deduplicated = True
+                try:
+                    os.link(blob_path, target_path)
+                    break
+                except FileNotFoundError:
+                    # Released by another worker in between: store it again
+                    continue
+            os.remove(temp_path)
+            if deduplicated:
+                self.deduplicated += 1
+        
+        if deduplicated:
+            os.utime(target_path)
+        return deduplicated
+    
+    def refcount(self, file_hash: str) -> int:
+        """Get the number of uploads referencing a blob"""
+        try:
+            return os.stat(self.blob_path(file_hash)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+    
+    def release(self, file_hash: str) -> bool:
+        """
+        Delete a blob if nothing references it any more
+        
+        Returns:
+            True if the blob was deleted
+        """
+        blob_path = self.blob_path(file_hash)
+        with self._lock:
+            try:
+                if os.stat(blob_path).st_nlink > 1:
+                    return False
+                os.remove(blob_path)
+            except FileNotFoundError:
+                return False
+        return True
+    
+    def gc(self, temp_max_age: int = 3600) -> int:
+        """
+        Delete all unreferenced blobs and abandoned temp files
+        
+        Args:
+            temp_max_age: Age in seconds after which a temp file is abandoned
+        
+        Returns:
+            Number of blobs deleted
+        """
+        deleted = 0
+        for shard in os.listdir(self.root):
+            if shard == self.TEMP_DIRNAME:
+                continue
+            shard_dir = os.path.join(self.root, shard)
+            for file_hash in os.listdir(shard_dir):
+                if _HASH_RE.match(file_hash) and self.release(file_hash):
+                    deleted += 1
+        
+        cutoff_time = time.time() - temp_max_age
+        for filename in os.listdir(self.temp_dir):
+            temp_path = os.path.join(self.temp_dir, filename)
+            try:
+                if os.path.getmtime(temp_path) < cutoff_time:
+                    os.remove(temp_path)
+            except OSError:
+                pass
+        
+        return deleted
+    
+    def stats(self) -> Dict[str, int]:
+        """Get blob counters"""
+        return {
+            'deduplicated': self.deduplicated
+        }
@@ -14,6 +14,7 @@ class Config:
     
     # Flask
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    DOWNLOAD_URL_TTL = int(os.environ.get('DOWNLOAD_URL_TTL', 300))  # seconds a signed download URL is valid
     DEBUG = False
     TESTING = False
     
@@ -29,13 +30,38 @@ class Config:
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
     ALLOWED_EXTENSIONS = set(os.environ.get('ALLOWED_EXTENSIONS', 'txt,pdf,png,jpg,jpeg,gif,doc,docx,json,xml').split(','))
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))  # seconds since last chunk
+    UPLOAD_SESSION_SWEEP_INTERVAL = int(os.environ.get('UPLOAD_SESSION_SWEEP_INTERVAL', 600))  # 0 disables
+    FILE_RETENTION_DAYS = int(os.environ.get('FILE_RETENTION_DAYS', 7))
+    EXPIRY_SWEEP_INTERVAL = int(os.environ.get('EXPIRY_SWEEP_INTERVAL', 300))  # seconds, 0 disables
+    EXPIRY_BATCH_SIZE = int(os.environ.get('EXPIRY_BATCH_SIZE', 100))
     
     # Security
     RSA_KEY_SIZE = int(os.environ.get('RSA_KEY_SIZE', 2048))
+    KEY_POOL_SIZE = int(os.environ.get('KEY_POOL_SIZE', 4))  # 0 disables the pool
     SESSION_TIMEOUT = int(os.environ.get('SESSION_TIMEOUT', 3600))
     
+    # Parallel encryption (files >= threshold bytes use AES-GCM frames on a pool)
+    ENCRYPTION_WORKERS = int(os.environ.get('ENCRYPTION_WORKERS', os.cpu_count() or 1))
+    PARALLEL_ENCRYPTION_THRESHOLD = int(os.environ.get('PARALLEL_ENCRYPTION_THRESHOLD', 4 * 1024 * 1024))
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    
+    # Off-loop CPU work (crypto in socket handlers and routes)
+    CPU_WORKERS = int(os.environ.get('CPU_WORKERS', os.cpu_count() or 1))
+    LOOP_LAG_INTERVAL = float(os.environ.get('LOOP_LAG_INTERVAL', 1.0))  # seconds, 0 disables
+    PRESENCE_PUSH_INTERVAL = float(os.environ.get('PRESENCE_PUSH_INTERVAL', 1.0))  # seconds between presence_diff pushes
+    
+    # Multiple workers: message queue for cross-worker emits ('' = single
+    # worker, 'local://' = in-process stand-in, or redis:// / amqp://) and
+    # store for connections/presence ('' = the message queue's Redis or
+    # in-process store, else per worker; or redis://)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'secure-file-transfer')
+    SHARED_STATE_URL = os.environ.get('SHARED_STATE_URL', '')
+    
     # Keys Directory
     SERVER_KEYS_DIR = os.environ.get('SERVER_KEYS_DIR', 'keys/server')
+    KEY_CACHE_SIZE = int(os.environ.get('KEY_CACHE_SIZE', 256))
     CLIENT_KEYS_DIR = os.environ.get('CLIENT_KEYS_DIR', 'keys/client')
     
     # CORS
@@ -5,13 +5,214 @@ Cryptographic utilities for file encryption, decryption, and digital signatures
 
 import hashlib
 import base64
-from typing import Tuple, Optional
+import binascii
+import io
+import json
+import math
+import struct
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from typing import Tuple, Optional, BinaryIO, List, Dict, Iterator
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_OAEP, AES
 from Crypto.Signature import pkcs1_15
 from Crypto.Hash import SHA256
 from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
+from shared.constants import (
+    CHUNK_SIZE, STREAM_MAGIC, STREAM_VERSION,
+    STREAM_NONCE_PREFIX_SIZE, GCM_TAG_SIZE,
+    CONTAINER_MAGIC, CONTAINER_VERSION,
+    CIPHER_AES_CBC, CIPHER_AES_GCM_FRAMES,
+    COMPRESSION_ZLIB, COMPRESSION_LEVEL, COMPRESSION_MIN_SIZE,
+    COMPRESSION_MAX_ENTROPY, COMPRESSION_SAMPLE_SIZE, INCOMPRESSIBLE_EXTENSIONS
+)
+
+# Stream header: magic | version | chunk size | wrapped key length
+_STREAM_HEADER = struct.Struct('>4sBIH')
+# Frame header: final flag | ciphertext length
+_FRAME_HEADER = struct.Struct('>BI')
+
+
+def _byte_entropy(sample: bytes) -> float:
+    """Shannon entropy of a byte string in bits per byte"""
+    if not sample:
+        return 0.0
+    total = len(sample)
+    return -sum(count / total * math.log2(count / total)
+                for count in Counter(sample).values())
+
+
+def _maybe_compress(file_data: bytes, compress: bool) -> Tuple[bytes, Optional[str]]:
+    """
+    Compress file data for encryption if that makes it smaller
+
+    Returns:
+        Tuple of (payload, original_hash); original_hash is None when the
+        payload is the uncompressed file data
+    """
+    if not compress:
+        return file_data, None
+
+    sha256_hash = hashlib.sha256()
+    compressed = CryptoUtils.compress_data(file_data, hasher=sha256_hash)
+    if len(compressed) >= len(file_data):
+        return file_data, None
+    return compressed, sha256_hash.hexdigest()
+
+
+def _frame_nonce(nonce_prefix: bytes, counter: int) -> bytes:
+    """Build the 96-bit GCM nonce for a frame"""
+    return nonce_prefix + struct.pack('>I', counter)
+
+
+def _seal_frame(aes_key: bytes, nonce_prefix: bytes, counter: int,
+                data: bytes, final: bool) -> bytes:
+    """
+    Encrypt one stream frame with AES-GCM
+    
+    The frame counter and the final flag are authenticated as associated
+    data, so frames cannot be reordered, dropped or truncated unnoticed.
+    
+    Returns:
+        Frame bytes (header + ciphertext + tag)
+    """
+    flag = 1 if final else 0
+    cipher = AES.new(aes_key, AES.MODE_GCM,
+                     nonce=_frame_nonce(nonce_prefix, counter),
+                     mac_len=GCM_TAG_SIZE)
+    cipher.update(struct.pack('>IB', counter, flag))
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    return _FRAME_HEADER.pack(flag, len(ciphertext)) + ciphertext + tag
+
+
+def _open_frame(aes_key: bytes, nonce_prefix: bytes, counter: int,
+                ciphertext: bytes, tag: bytes, final: bool) -> bytes:
+    """Decrypt and authenticate one stream frame (raises ValueError on tamper)"""
+    cipher = AES.new(aes_key, AES.MODE_GCM,
+                     nonce=_frame_nonce(nonce_prefix, counter),
+                     mac_len=GCM_TAG_SIZE)
+    cipher.update(struct.pack('>IB', counter, 1 if final else 0))
+    return cipher.decrypt_and_verify(ciphertext, tag)
+
+
+# Container header: magic | version | layout | wrapped key, IV, signature,
+# hash and metadata lengths. Raw ciphertext follows the variable fields.
+_CONTAINER_HEADER = struct.Struct('>4sBBHBHBI')
+
+# Package field names and text encodings for the packages we store: the
+# server-side format from encrypt_and_sign and the browser format built by
+# client/static/js/crypto.js
+CONTAINER_LAYOUTS = (
+    {
+        'encrypted_file': ('encrypted_file', 'base64'),
+        'encrypted_aes_key': ('encrypted_aes_key', 'base64'),
+        'iv': ('iv', 'base64'),
+        'signature': ('signature', 'base64'),
+        'file_hash': ('file_hash', 'hex'),
+    },
+    {
+        'encrypted_file': ('encryptedFile', 'base64'),
+        'encrypted_aes_key': ('encryptedAESKey', 'base64'),
+        'iv': ('iv', 'hex'),
+        'signature': ('signature', 'base64'),
+        'file_hash': ('fileHash', 'hex'),
+    },
+)
+
+
+def _decode_field(value, encoding: str) -> bytes:
+    """
+    Decode a text package field to raw bytes
+    
+    Raises ValueError unless encoding the result again gives back exactly
+    the same text, so containers always round-trip to the original package.
+    """
+    if not isinstance(value, str):
+        raise ValueError("Package field is not a string")
+    try:
+        if encoding == 'hex':
+            raw = bytes.fromhex(value)
+        else:
+            raw = base64.b64decode(value, validate=True)
+    except (ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid {encoding} package field: {e}")
+    if _encode_field(raw, encoding) != value:
+        raise ValueError(f"Package field is not canonical {encoding}")
+    return raw
+
+
+def _encode_field(raw: bytes, encoding: str) -> str:
+    """Encode raw bytes back to the text form used in packages"""
+    if encoding == 'hex':
+        return raw.hex()
+    return base64.b64encode(raw).decode('utf-8')
+
+
+def _merkle_leaf(chunk: bytes) -> bytes:
+    """Hash a leaf (domain-separated from inner nodes)"""
+    return hashlib.sha256(b'\x00' + chunk).digest()
+
+
+def _merkle_node(left: bytes, right: bytes) -> bytes:
+    """Hash an inner node"""
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def _merkle_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    """Build all tree levels, leaves first. An odd node is promoted as is."""
+    levels = [leaves or [_merkle_leaf(b'')]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([
+            _merkle_node(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ])
+    return levels
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    """Read exactly size bytes or raise ValueError on a truncated stream"""
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("Encrypted stream is truncated")
+    return data
+
+
+def _open_frames(in_file: BinaryIO, out_file: BinaryIO, aes_key: bytes,
+                 nonce_prefix: bytes, max_length: Optional[int] = None,
+                 hasher=None) -> int:
+    """
+    Decrypt frames up to and including the final one, feeding each
+    plaintext frame to hasher (if given) in the same pass
+    
+    Returns:
+        Number of plaintext bytes written
+    """
+    total = 0
+    counter = 0
+    while True:
+        flag, length = _FRAME_HEADER.unpack(
+            _read_exact(in_file, _FRAME_HEADER.size)
+        )
+        if max_length is not None and length > max_length:
+            raise ValueError("Encrypted frame exceeds declared chunk size")
+        
+        ciphertext = _read_exact(in_file, length)
+        tag = _read_exact(in_file, GCM_TAG_SIZE)
+        final = flag == 1
+        plaintext = _open_frame(aes_key, nonce_prefix, counter,
+                                ciphertext, tag, final)
+        if hasher is not None:
+            hasher.update(plaintext)
+        out_file.write(plaintext)
+        total += length
+        if final:
+            return total
+        counter += 1
+
 
 class CryptoUtils:
     """Handles all cryptographic operations"""
@@ -84,6 +285,590 @@ class CryptoUtils:
         
         return decrypted_file
     
+    @staticmethod
+    def encrypt_file_hashed(file_data: bytes, recipient_public_key: Optional[RSA.RsaKey],
+                            chunk_size: int = CHUNK_SIZE,
+                            aes_key: Optional[bytes] = None) -> Tuple[bytes, Optional[bytes], bytes, str]:
+        """
+        Hash and encrypt file (AES-CBC) in a single pass
+        
+        Each chunk updates the SHA-256 state and is encrypted straight into
+        a preallocated output buffer, so the plaintext is read only once.
+        
+        Args:
+            file_data: File content to encrypt
+            recipient_public_key: Recipient's RSA public key (None: the
+                caller wraps aes_key itself)
+            chunk_size: Bytes per chunk (multiple of the AES block size)
+            aes_key: AES key to use (default: a new random key)
+            
+        Returns:
+            Tuple of (encrypted_file, encrypted_aes_key or None, iv, file_hash)
+        """
+        # Generate AES key and IV
+        aes_key = aes_key or get_random_bytes(32)  # 256-bit key
+        iv = get_random_bytes(16)  # 128-bit IV
+        
+        cipher_aes = AES.new(aes_key, AES.MODE_CBC, iv)
+        sha256_hash = hashlib.sha256()
+        
+        view = memoryview(file_data)
+        body_size = len(view) - len(view) % AES.block_size
+        encrypted_file = bytearray(body_size + AES.block_size)
+        output = memoryview(encrypted_file)
+        
+        for offset in range(0, body_size, chunk_size):
+            chunk = view[offset:min(offset + chunk_size, body_size)]
+            sha256_hash.update(chunk)
+            cipher_aes.encrypt(chunk, output=output[offset:offset + len(chunk)])
+        
+        # Only the last (partial) block needs padding
+        tail = view[body_size:]
+        sha256_hash.update(tail)
+        cipher_aes.encrypt(pad(bytes(tail), AES.block_size), output=output[body_size:])
+        
+        # Encrypt AES key with RSA
+        encrypted_aes_key = None
+        if recipient_public_key is not None:
+            encrypted_aes_key = CryptoUtils.wrap_key(aes_key, recipient_public_key)
+        
+        return encrypted_file, encrypted_aes_key, iv, sha256_hash.hexdigest()
+    
+    @staticmethod
+    def decrypt_file_hashed(encrypted_file: bytes, encrypted_aes_key: bytes,
+                            iv: bytes, recipient_private_key: RSA.RsaKey,
+                            chunk_size: int = CHUNK_SIZE) -> Tuple[bytes, str]:
+        """
+        Decrypt file (AES-CBC) and hash the plaintext in a single pass
+        
+        Args:
+            encrypted_file: Encrypted file content
+            encrypted_aes_key: Encrypted AES key
+            iv: Initialization vector
+            recipient_private_key: Recipient's RSA private key
+            chunk_size: Bytes per chunk (multiple of the AES block size)
+            
+        Returns:
+            Tuple of (decrypted_file, file_hash)
+        """
+        # Decrypt AES key with RSA
+        cipher_rsa = PKCS1_OAEP.new(recipient_private_key)
+        aes_key = cipher_rsa.decrypt(encrypted_aes_key)
+        
+        view = memoryview(encrypted_file)
+        if not view or len(view) % AES.block_size:
+            raise ValueError("Encrypted data is not a whole number of AES blocks")
+        
+        cipher_aes = AES.new(aes_key, AES.MODE_CBC, iv)
+        sha256_hash = hashlib.sha256()
+        decrypted_file = bytearray(len(view))
+        output = memoryview(decrypted_file)
+        
+        # Hold back the last block: it carries the padding
+        body_size = len(view) - AES.block_size
+        for offset in range(0, len(view), chunk_size):
+            end = min(offset + chunk_size, len(view))
+            cipher_aes.decrypt(view[offset:end], output=output[offset:end])
+            sha256_hash.update(output[offset:min(end, body_size)])
+        
+        tail = unpad(bytes(output[body_size:]), AES.block_size)
+        sha256_hash.update(tail)
+        output.release()
+        del decrypted_file[body_size + len(tail):]
+        
+        return bytes(decrypted_file), sha256_hash.hexdigest()
+    
+    @staticmethod
+    def encrypt_stream(in_file: BinaryIO, out_file: BinaryIO,
+                       recipient_public_key: RSA.RsaKey,
+                       chunk_size: int = CHUNK_SIZE, hasher=None) -> int:
+        """
+        Encrypt a file-like object into framed AES-GCM stream
+        
+        Only one chunk is held in memory at a time, so memory use does not
+        depend on the file size.
+        
+        Args:
+            in_file: Readable binary file object with the plaintext
+            out_file: Writable binary file object for the encrypted stream
+            recipient_public_key: Recipient's RSA public key
+            chunk_size: Plaintext bytes per frame
+            hasher: Optional hashlib object updated with each chunk
+            
+        Returns:
+            Number of plaintext bytes encrypted
+        """
+        aes_key = get_random_bytes(32)  # 256-bit key
+        nonce_prefix = get_random_bytes(STREAM_NONCE_PREFIX_SIZE)
+        
+        # Encrypt AES key with RSA
+        cipher_rsa = PKCS1_OAEP.new(recipient_public_key)
+        encrypted_aes_key = cipher_rsa.encrypt(aes_key)
+        
+        out_file.write(_STREAM_HEADER.pack(
+            STREAM_MAGIC, STREAM_VERSION, chunk_size, len(encrypted_aes_key)
+        ))
+        out_file.write(encrypted_aes_key)
+        out_file.write(nonce_prefix)
+        
+        # Read one chunk ahead so the last frame can be flagged as final
+        total = 0
+        counter = 0
+        chunk = in_file.read(chunk_size)
+        while True:
+            next_chunk = in_file.read(chunk_size)
+            final = not next_chunk
+            if hasher is not None:
+                hasher.update(chunk)
+            out_file.write(_seal_frame(aes_key, nonce_prefix, counter, chunk, final))
+            total += len(chunk)
+            if final:
+                break
+            chunk = next_chunk
+            counter += 1
+        
+        return total
+    
+    @staticmethod
+    def decrypt_stream(in_file: BinaryIO, out_file: BinaryIO,
+                       recipient_private_key: RSA.RsaKey, hasher=None) -> int:
+        """
+        Decrypt a framed AES-GCM stream produced by encrypt_stream
+        
+        Each frame is authenticated before it is written. If a later frame
+        fails, ValueError is raised and the output must be discarded.
+        
+        Args:
+            in_file: Readable binary file object with the encrypted stream
+            out_file: Writable binary file object for the plaintext
+            recipient_private_key: Recipient's RSA private key
+            hasher: Optional hashlib object updated with each plaintext frame
+            
+        Returns:
+            Number of plaintext bytes written
+        """
+        magic, version, chunk_size, key_len = _STREAM_HEADER.unpack(
+            _read_exact(in_file, _STREAM_HEADER.size)
+        )
+        if magic != STREAM_MAGIC or version != STREAM_VERSION:
+            raise ValueError("Unsupported encrypted stream format")
+        
+        # Decrypt AES key with RSA
+        cipher_rsa = PKCS1_OAEP.new(recipient_private_key)
+        aes_key = cipher_rsa.decrypt(_read_exact(in_file, key_len))
+        nonce_prefix = _read_exact(in_file, STREAM_NONCE_PREFIX_SIZE)
+        
+        total = _open_frames(in_file, out_file, aes_key, nonce_prefix,
+                             chunk_size, hasher)
+        
+        if in_file.read(1):
+            raise ValueError("Unexpected data after final frame")
+        
+        return total
+    
+    @staticmethod
+    def encrypt_file_parallel(file_data: bytes, recipient_public_key: Optional[RSA.RsaKey],
+                              workers: Optional[int] = None,
+                              chunk_size: int = CHUNK_SIZE,
+                              use_processes: bool = False,
+                              hasher=None,
+                              aes_key: Optional[bytes] = None) -> Tuple[bytes, Optional[bytes], bytes]:
+        """
+        Encrypt file as AES-GCM frames on a pool of workers
+        
+        Every frame has its own nonce (prefix + counter), so frames are
+        encrypted independently and joined back in order. Thread workers
+        run in parallel because the cipher releases the GIL; processes can
+        be used instead at the cost of copying each chunk to the worker.
+        
+        Args:
+            file_data: File content to encrypt
+            recipient_public_key: Recipient's RSA public key (None: the
+                caller wraps aes_key itself)
+            workers: Number of workers (default: CPU count)
+            chunk_size: Plaintext bytes per frame
+            use_processes: Use a process pool instead of a thread pool
+            hasher: Optional hashlib object, updated on the calling thread
+                while the workers encrypt
+            aes_key: AES key to use (default: a new random key)
+            
+        Returns:
+            Tuple of (encrypted_frames, encrypted_aes_key or None, nonce_prefix)
+        """
+        aes_key = aes_key or get_random_bytes(32)  # 256-bit key
+        nonce_prefix = get_random_bytes(STREAM_NONCE_PREFIX_SIZE)
+        
+        view = memoryview(file_data)
+        offsets = range(0, max(len(view), 1), chunk_size)
+        last = len(offsets) - 1
+        chunks = [view[offset:offset + chunk_size] for offset in offsets]
+        if use_processes:
+            chunks = [bytes(chunk) for chunk in chunks]
+        
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_class(max_workers=workers) as executor:
+            results = executor.map(
+                _seal_frame,
+                repeat(aes_key), repeat(nonce_prefix), range(len(chunks)),
+                chunks, [i == last for i in range(len(chunks))]
+            )
+            if hasher is not None:
+                hasher.update(view)
+            frames = list(results)
+        
+        # Encrypt AES key with RSA
+        encrypted_aes_key = None
+        if recipient_public_key is not None:
+            encrypted_aes_key = CryptoUtils.wrap_key(aes_key, recipient_public_key)
+        
+        return b''.join(frames), encrypted_aes_key, nonce_prefix
+    
+    @staticmethod
+    def decrypt_file_frames(encrypted_frames: bytes, encrypted_aes_key: bytes,
+                            nonce_prefix: bytes, recipient_private_key: RSA.RsaKey,
+                            hasher=None) -> bytes:
+        """
+        Decrypt AES-GCM frames produced by encrypt_file_parallel
+        
+        Args:
+            encrypted_frames: Encrypted frames
+            encrypted_aes_key: Encrypted AES key
+            nonce_prefix: Nonce prefix shared by all frames
+            recipient_private_key: Recipient's RSA private key
+            hasher: Optional hashlib object updated with each plaintext frame
+            
+        Returns:
+            Decrypted file content
+        """
+        # Decrypt AES key with RSA
+        cipher_rsa = PKCS1_OAEP.new(recipient_private_key)
+        aes_key = cipher_rsa.decrypt(encrypted_aes_key)
+        
+        in_file = io.BytesIO(encrypted_frames)
+        out_file = io.BytesIO()
+        _open_frames(in_file, out_file, aes_key, nonce_prefix, hasher=hasher)
+        if in_file.read(1):
+            raise ValueError("Unexpected data after final frame")
+        
+        return out_file.getvalue()
+    
+    @staticmethod
+    def package_layout(package: dict) -> int:
+        """
+        Find the container layout matching a package
+        
+        Args:
+            package: Encrypted package dictionary
+            
+        Returns:
+            Index into CONTAINER_LAYOUTS
+        """
+        for index, layout in enumerate(CONTAINER_LAYOUTS):
+            if layout['encrypted_aes_key'][0] in package:
+                return index
+        raise ValueError("Unknown encrypted package format")
+    
+    @staticmethod
+    def write_container_header(out_file: BinaryIO, package: dict) -> int:
+        """
+        Write the binary container header for a package
+        
+        The raw ciphertext must be written right after the header. Fields
+        that are not part of the fixed header (file name, user IDs, ...)
+        are kept in a small JSON metadata block.
+        
+        Args:
+            out_file: Writable binary file object
+            package: Encrypted package dictionary (ciphertext is ignored)
+            
+        Returns:
+            Header size in bytes (offset of the ciphertext)
+        """
+        layout_index = CryptoUtils.package_layout(package)
+        layout = CONTAINER_LAYOUTS[layout_index]
+        
+        fields = {}
+        for field in ('encrypted_aes_key', 'iv', 'signature', 'file_hash'):
+            key, encoding = layout[field]
+            fields[field] = _decode_field(package.get(key), encoding)
+        
+        field_keys = {key for key, _ in layout.values()}
+        metadata = json.dumps(
+            {k: v for k, v in package.items() if k not in field_keys},
+            separators=(',', ':')
+        ).encode('utf-8')
+        
+        header = _CONTAINER_HEADER.pack(
+            CONTAINER_MAGIC, CONTAINER_VERSION, layout_index,
+            len(fields['encrypted_aes_key']), len(fields['iv']),
+            len(fields['signature']), len(fields['file_hash']), len(metadata)
+        )
+        out_file.write(header)
+        for field in ('encrypted_aes_key', 'iv', 'signature', 'file_hash'):
+            out_file.write(fields[field])
+        out_file.write(metadata)
+        
+        return len(header) + sum(len(v) for v in fields.values()) + len(metadata)
+    
+    @staticmethod
+    def write_container(out_file: BinaryIO, package: dict) -> int:
+        """
+        Write a package as a binary container
+        
+        Args:
+            out_file: Writable binary file object
+            package: Encrypted package dictionary
+            
+        Returns:
+            Total bytes written
+        """
+        layout = CONTAINER_LAYOUTS[CryptoUtils.package_layout(package)]
+        key, encoding = layout['encrypted_file']
+        encrypted_file = _decode_field(package.get(key), encoding)
+        
+        header_size = CryptoUtils.write_container_header(out_file, package)
+        out_file.write(encrypted_file)
+        
+        return header_size + len(encrypted_file)
+    
+    @staticmethod
+    def read_container_header(in_file: BinaryIO) -> dict:
+        """
+        Read a binary container header
+        
+        The file object is left positioned at the start of the ciphertext.
+        
+        Args:
+            in_file: Readable binary file object
+            
+        Returns:
+            Dictionary with layout, raw header fields, metadata and
+            ciphertext_offset
+        """
+        (magic, version, layout_index, key_len, iv_len,
+         sig_len, hash_len, meta_len) = _CONTAINER_HEADER.unpack(
+            _read_exact(in_file, _CONTAINER_HEADER.size)
+        )
+        if magic != CONTAINER_MAGIC or version != CONTAINER_VERSION:
+            raise ValueError("Unsupported container format")
+        if layout_index >= len(CONTAINER_LAYOUTS):
+            raise ValueError("Unknown container layout")
+        
+        header = {
+            'layout': layout_index,
+            'encrypted_aes_key': _read_exact(in_file, key_len),
+            'iv': _read_exact(in_file, iv_len),
+            'signature': _read_exact(in_file, sig_len),
+            'file_hash': _read_exact(in_file, hash_len),
+            'metadata': json.loads(_read_exact(in_file, meta_len).decode('utf-8')),
+        }
+        header['ciphertext_offset'] = (_CONTAINER_HEADER.size + key_len + iv_len
+                                       + sig_len + hash_len + meta_len)
+        return header
+    
+    @staticmethod
+    def container_to_package(header: dict, encrypted_file: bytes) -> dict:
+        """
+        Rebuild the original package dictionary from a container
+        
+        Args:
+            header: Result of read_container_header
+            encrypted_file: Raw ciphertext
+            
+        Returns:
+            Encrypted package dictionary
+        """
+        layout = CONTAINER_LAYOUTS[header['layout']]
+        package = dict(header['metadata'])
+        for field, (key, encoding) in layout.items():
+            raw = encrypted_file if field == 'encrypted_file' else header[field]
+            package[key] = _encode_field(raw, encoding)
+        return package
+    
+    @staticmethod
+    def iter_package_json(header: dict, in_file: BinaryIO,
+                          block_size: int = 192 * 1024) -> Iterator[bytes]:
+        """
+        Yield a container as package JSON without loading the ciphertext
+        
+        Produces the same package as container_to_package, with the
+        ciphertext base64-encoded block by block as it is read.
+        
+        Args:
+            header: Result of read_container_header
+            in_file: File object positioned at the ciphertext
+            block_size: Bytes read per block (rounded down to a multiple
+                        of 3 so the base64 pieces concatenate)
+            
+        Returns:
+            Iterator of JSON byte strings
+        """
+        layout = CONTAINER_LAYOUTS[header['layout']]
+        package = dict(header['metadata'])
+        for field, (key, encoding) in layout.items():
+            if field != 'encrypted_file':
+                package[key] = _encode_field(header[field], encoding)
+        
+        head = json.dumps(package)[:-1]
+        separator = ', ' if package else ''
+        yield f'{head}{separator}{json.dumps(layout["encrypted_file"][0])}: "'.encode('utf-8')
+        
+        block_size -= block_size % 3
+        block = in_file.read(block_size)
+        while block:
+            yield base64.b64encode(block)
+            block = in_file.read(block_size)
+        yield b'"}'
+    
+    @staticmethod
+    def read_container(in_file: BinaryIO) -> dict:
+        """
+        Read a whole binary container back into a package dictionary
+        
+        Args:
+            in_file: Readable binary file object
+            
+        Returns:
+            Encrypted package dictionary
+        """
+        header = CryptoUtils.read_container_header(in_file)
+        return CryptoUtils.container_to_package(header, in_file.read())
+    
+    @staticmethod
+    def build_merkle_tree(in_file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> dict:
+        """
+        Build a Merkle tree over fixed-size chunks of a file
+        
+        Args:
+            in_file: Readable binary file object
+            chunk_size: Bytes per leaf
+            
+        Returns:
+            Dictionary with chunk_size, size, hex leaf hashes and hex root
+        """
+        leaves = []
+        size = 0
+        chunk = in_file.read(chunk_size)
+        while chunk:
+            leaves.append(_merkle_leaf(chunk))
+            size += len(chunk)
+            chunk = in_file.read(chunk_size)
+        
+        return {
+            'chunk_size': chunk_size,
+            'size': size,
+            'leaves': [leaf.hex() for leaf in leaves],
+            'root': _merkle_levels(leaves)[-1][0].hex()
+        }
+    
+    @staticmethod
+    def sign_merkle_tree(tree: dict, private_key: RSA.RsaKey) -> dict:
+        """
+        Sign the Merkle root (same scheme as the file hash signature)
+        
+        Args:
+            tree: Result of build_merkle_tree
+            private_key: Signer's private key
+            
+        Returns:
+            The tree with a base64 root_signature added
+        """
+        signature = CryptoUtils.sign_data(tree['root'].encode(), private_key)
+        tree['root_signature'] = base64.b64encode(signature).decode('utf-8')
+        return tree
+    
+    @staticmethod
+    def verify_merkle_tree(tree: dict, public_key: RSA.RsaKey) -> bool:
+        """
+        Check that the leaves hash up to the root and the root is signed
+        
+        Args:
+            tree: Merkle tree dictionary with root_signature
+            public_key: Signer's public key
+            
+        Returns:
+            True if the tree is consistent and the signature is valid
+        """
+        leaves = [bytes.fromhex(leaf) for leaf in tree['leaves']]
+        if _merkle_levels(leaves)[-1][0].hex() != tree['root']:
+            return False
+        
+        signature = tree.get('root_signature')
+        if not signature:
+            return False
+        return CryptoUtils.verify_signature(
+            tree['root'].encode(), base64.b64decode(signature), public_key
+        )
+    
+    @staticmethod
+    def merkle_proof(tree: dict, index: int) -> List[str]:
+        """
+        Get the audit path for one chunk
+        
+        Args:
+            tree: Merkle tree dictionary
+            index: Chunk index
+            
+        Returns:
+            List of sibling hashes (hex, prefixed with 'L' or 'R' for the
+            sibling's side) from the leaf up to the root
+        """
+        levels = _merkle_levels([bytes.fromhex(leaf) for leaf in tree['leaves']])
+        proof = []
+        for level in levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                side = 'L' if sibling < index else 'R'
+                proof.append(side + level[sibling].hex())
+            index //= 2
+        return proof
+    
+    @staticmethod
+    def verify_merkle_chunk(chunk: bytes, proof: List[str], root: str) -> bool:
+        """
+        Verify a single chunk against the root using its audit path
+        
+        Args:
+            chunk: Chunk content
+            proof: Result of merkle_proof
+            root: Hex Merkle root
+            
+        Returns:
+            True if the chunk belongs to the tree
+        """
+        node = _merkle_leaf(chunk)
+        for step in proof:
+            sibling = bytes.fromhex(step[1:])
+            node = _merkle_node(sibling, node) if step[0] == 'L' else _merkle_node(node, sibling)
+        return node.hex() == root
+    
+    @staticmethod
+    def find_corrupt_ranges(in_file: BinaryIO, tree: dict) -> List[Tuple[int, int]]:
+        """
+        Compare a received file against the tree chunk by chunk
+        
+        Args:
+            in_file: Readable binary file object with the received data
+            tree: Merkle tree of the original data
+            
+        Returns:
+            List of (start, end) byte ranges, end exclusive, that must be
+            fetched again. Adjacent bad chunks are merged.
+        """
+        chunk_size = tree['chunk_size']
+        ranges = []
+        for index, leaf in enumerate(tree['leaves']):
+            start = index * chunk_size
+            end = min(start + chunk_size, tree['size'])
+            in_file.seek(start)
+            if _merkle_leaf(in_file.read(end - start)).hex() == leaf:
+                continue
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+    
     @staticmethod
     def sign_data(data: bytes, private_key: RSA.RsaKey) -> bytes:
         """
@@ -127,9 +912,107 @@ class CryptoUtils:
         except (ValueError, TypeError):
             return False
     
+    @staticmethod
+    def should_compress(file_data: bytes, file_name: Optional[str] = None) -> bool:
+        """
+        Decide whether compressing before encryption is worthwhile
+        
+        Known compressed formats are skipped by extension; everything else
+        by the byte entropy of samples from the start, middle and end.
+        
+        Args:
+            file_data: File content
+            file_name: Original file name
+            
+        Returns:
+            True if the data looks compressible
+        """
+        if len(file_data) < COMPRESSION_MIN_SIZE:
+            return False
+        
+        if file_name and '.' in file_name and \
+                file_name.rsplit('.', 1)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+            return False
+        
+        size = COMPRESSION_SAMPLE_SIZE
+        middle = max(0, len(file_data) // 2 - size // 2)
+        sample = b''.join((file_data[:size], file_data[middle:middle + size],
+                           file_data[-size:]))
+        return _byte_entropy(sample) < COMPRESSION_MAX_ENTROPY
+    
+    @staticmethod
+    def compress_data(file_data: bytes, hasher=None,
+                      level: int = COMPRESSION_LEVEL) -> bytes:
+        """
+        Compress data with zlib, feeding the same chunks to a hasher
+        
+        Args:
+            file_data: Data to compress
+            hasher: Optional hashlib object updated with the original data
+            level: zlib compression level
+            
+        Returns:
+            Compressed data
+        """
+        compressor = zlib.compressobj(level)
+        view = memoryview(file_data)
+        parts = []
+        for offset in range(0, len(view), CHUNK_SIZE):
+            chunk = view[offset:offset + CHUNK_SIZE]
+            if hasher is not None:
+                hasher.update(chunk)
+            parts.append(compressor.compress(chunk))
+        parts.append(compressor.flush())
+        return b''.join(parts)
+    
+    @staticmethod
+    def decompress_data(compressed: bytes, original_size: int, hasher=None) -> bytes:
+        """
+        Decompress zlib data, refusing to produce more than original_size bytes
+        
+        Args:
+            compressed: Compressed data
+            original_size: Declared size of the original data
+            hasher: Optional hashlib object updated with each decompressed chunk
+            
+        Returns:
+            Original data
+            
+        Raises:
+            ValueError: If the data is corrupt or larger than declared
+        """
+        decompressor = zlib.decompressobj()
+        view = memoryview(compressed)
+        parts = []
+        produced = 0
+        try:
+            for offset in range(0, len(view), CHUNK_SIZE):
+                # At most one byte past the declared size, so oversized data
+                # is detected without ever being expanded (the limit stays
+                # above 0, which zlib would take as "no limit")
+                chunk = decompressor.decompress(view[offset:offset + CHUNK_SIZE],
+                                                original_size + 1 - produced)
+                produced += len(chunk)
+                if produced > original_size or decompressor.unconsumed_tail:
+                    raise ValueError("Decompressed size does not match the package")
+                if hasher is not None:
+                    hasher.update(chunk)
+                parts.append(chunk)
+                if decompressor.eof:
+                    break
+        except zlib.error as e:
+            raise ValueError(f"Invalid compressed data: {e}")
+        
+        if produced != original_size or not decompressor.eof:
+            raise ValueError("Decompressed size does not match the package")
+        return b''.join(parts)
+    
     @staticmethod
     def encrypt_and_sign(file_data: bytes, sender_private_key: RSA.RsaKey, 
-                        recipient_public_key: RSA.RsaKey) -> dict:
+                        recipient_public_key: RSA.RsaKey,
+                        parallel: bool = False,
+                        workers: Optional[int] = None,
+                        compress: bool = False) -> dict:
         """
         Encrypt file and create digital signature
         
@@ -137,29 +1020,129 @@ class CryptoUtils:
             file_data: File content to encrypt
             sender_private_key: Sender's private key for signing
             recipient_public_key: Recipient's public key for encryption
+            parallel: Encrypt AES-GCM frames on a worker pool
+            workers: Number of workers for parallel mode
+            compress: Compress with zlib before encryption (kept only if smaller)
             
         Returns:
             Dictionary containing encrypted data and signature
         """
-        # Hash the original file
-        file_hash = CryptoUtils.hash_file(file_data)
+        original_size = len(file_data)
+        file_data, original_hash = _maybe_compress(file_data, compress)
         
-        # Encrypt the file
-        encrypted_file, encrypted_aes_key, iv = CryptoUtils.encrypt_file(
-            file_data, recipient_public_key
-        )
+        # Hash and encrypt the file in one pass
+        if parallel:
+            cipher_name = CIPHER_AES_GCM_FRAMES
+            sha256_hash = hashlib.sha256()
+            encrypted_file, encrypted_aes_key, iv = CryptoUtils.encrypt_file_parallel(
+                file_data, recipient_public_key, workers=workers,
+                hasher=sha256_hash
+            )
+            file_hash = sha256_hash.hexdigest()
+        else:
+            cipher_name = CIPHER_AES_CBC
+            encrypted_file, encrypted_aes_key, iv, file_hash = CryptoUtils.encrypt_file_hashed(
+                file_data, recipient_public_key
+            )
         
         # Sign the original file hash
+        file_hash = original_hash or file_hash
         signature = CryptoUtils.sign_data(file_hash.encode(), sender_private_key)
         
         # Encode everything to base64 for transmission
-        return {
+        package = {
             'encrypted_file': base64.b64encode(encrypted_file).decode('utf-8'),
             'encrypted_aes_key': base64.b64encode(encrypted_aes_key).decode('utf-8'),
             'iv': base64.b64encode(iv).decode('utf-8'),
             'signature': base64.b64encode(signature).decode('utf-8'),
-            'file_hash': file_hash
+            'file_hash': file_hash,
+            'cipher': cipher_name
+        }
+        if original_hash:
+            package['compression'] = COMPRESSION_ZLIB
+            package['original_size'] = original_size
+        return package
+    
+    @staticmethod
+    def wrap_key(aes_key: bytes, recipient_public_key: RSA.RsaKey) -> bytes:
+        """
+        Encrypt an AES key for one recipient with RSA-OAEP
+        
+        Args:
+            aes_key: AES key
+            recipient_public_key: Recipient's RSA public key
+            
+        Returns:
+            Encrypted AES key
+        """
+        cipher_rsa = PKCS1_OAEP.new(recipient_public_key)
+        return cipher_rsa.encrypt(aes_key)
+    
+    @staticmethod
+    def encrypt_and_sign_multi(file_data: bytes, sender_private_key: RSA.RsaKey,
+                               recipient_public_keys: Dict[str, RSA.RsaKey],
+                               parallel: bool = False,
+                               workers: Optional[int] = None,
+                               compress: bool = False) -> dict:
+        """
+        Encrypt file once and wrap the AES key for every recipient
+        
+        Args:
+            file_data: File content to encrypt
+            sender_private_key: Sender's private key for signing
+            recipient_public_keys: Mapping of recipient ID to public key
+            parallel: Encrypt AES-GCM frames on a worker pool
+            workers: Number of workers for parallel mode
+            compress: Compress with zlib before encryption (kept only if smaller)
+            
+        Returns:
+            Dictionary like encrypt_and_sign, with encrypted_aes_keys
+            (recipient ID -> base64 wrapped key) instead of encrypted_aes_key
+        """
+        if not recipient_public_keys:
+            raise ValueError("At least one recipient is required")
+        
+        original_size = len(file_data)
+        file_data, original_hash = _maybe_compress(file_data, compress)
+        
+        # The key is wrapped per recipient below, not by the encryption
+        aes_key = get_random_bytes(32)  # 256-bit key
+        
+        if parallel:
+            cipher_name = CIPHER_AES_GCM_FRAMES
+            sha256_hash = hashlib.sha256()
+            encrypted_file, _, iv = CryptoUtils.encrypt_file_parallel(
+                file_data, None, workers=workers,
+                hasher=sha256_hash, aes_key=aes_key
+            )
+            file_hash = sha256_hash.hexdigest()
+        else:
+            cipher_name = CIPHER_AES_CBC
+            encrypted_file, _, iv, file_hash = CryptoUtils.encrypt_file_hashed(
+                file_data, None, aes_key=aes_key
+            )
+        
+        # Sign the original file hash
+        file_hash = original_hash or file_hash
+        signature = CryptoUtils.sign_data(file_hash.encode(), sender_private_key)
+        
+        package = {
+            'encrypted_file': base64.b64encode(encrypted_file).decode('utf-8'),
+            'encrypted_aes_keys': {
+                recipient_id: base64.b64encode(
+                    CryptoUtils.wrap_key(aes_key, public_key)
+                ).decode('utf-8')
+                for recipient_id, public_key in recipient_public_keys.items()
+            },
+            'iv': base64.b64encode(iv).decode('utf-8'),
+            'signature': base64.b64encode(signature).decode('utf-8'),
+            'file_hash': file_hash,
+            'cipher': cipher_name
         }
+        if original_hash:
+            package['compression'] = COMPRESSION_ZLIB
+            package['original_size'] = original_size
+        return package
     
     @staticmethod
     def decrypt_and_verify(encrypted_data: dict, recipient_private_key: RSA.RsaKey,
@@ -183,13 +1166,36 @@ class CryptoUtils:
             signature = base64.b64decode(encrypted_data['signature'])
             original_hash = encrypted_data['file_hash']
             
-            # Decrypt the file
-            decrypted_file = CryptoUtils.decrypt_file(
-                encrypted_file, encrypted_aes_key, iv, recipient_private_key
-            )
+            # The signed hash is of the original (uncompressed) file, so
+            # it is computed in the pass that produces the original bytes:
+            # decryption, or decompression of compressed packages
+            compression = encrypted_data.get('compression')
+            if compression and compression != COMPRESSION_ZLIB:
+                raise ValueError(f"Unsupported compression: {compression}")
+            
+            sha256_hash = hashlib.sha256()
+            if encrypted_data.get('cipher') == CIPHER_AES_GCM_FRAMES:
+                decrypted_file = CryptoUtils.decrypt_file_frames(
+                    encrypted_file, encrypted_aes_key, iv, recipient_private_key,
+                    hasher=None if compression else sha256_hash
+                )
+            elif compression:
+                decrypted_file = CryptoUtils.decrypt_file(
+                    encrypted_file, encrypted_aes_key, iv, recipient_private_key
+                )
+            else:
+                decrypted_file, decrypted_hash = CryptoUtils.decrypt_file_hashed(
+                    encrypted_file, encrypted_aes_key, iv, recipient_private_key
+                )
+                sha256_hash = None
             
-            # Verify file integrity
-            decrypted_hash = CryptoUtils.hash_file(decrypted_file)
+            if compression:
+                decrypted_file = CryptoUtils.decompress_data(
+                    decrypted_file, int(encrypted_data['original_size']),
+                    hasher=sha256_hash
+                )
+            if sha256_hash is not None:
+                decrypted_hash = sha256_hash.hexdigest()
             
             # Verify signature
             is_signature_valid = CryptoUtils.verify_signature(
@@ -211,9 +1217,22 @@ class CryptoUtils:
 class SecureFileTransfer:
     """High-level interface for secure file transfer"""
     
-    def __init__(self, key_manager):
+    def __init__(self, key_manager, workers: Optional[int] = None,
+                 parallel_threshold: Optional[int] = None,
+                 compression: bool = True):
+        """
+        Args:
+            key_manager: KeyManager used to load keys
+            workers: Number of workers for parallel encryption
+            parallel_threshold: Files at least this large are encrypted in
+                parallel (None disables parallel encryption)
+            compression: Compress compressible files before encryption
+        """
         self.key_manager = key_manager
         self.crypto = CryptoUtils()
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        self.compression = compression
     
     def prepare_file_for_transfer(self, file_data: bytes, file_name: str,
                                  sender_id: str, recipient_id: str) -> dict:
@@ -240,8 +1259,12 @@ class SecureFileTransfer:
             raise ValueError(f"Public key not found for recipient: {recipient_id}")
         
         # Encrypt and sign
+        parallel = (self.parallel_threshold is not None
+                    and len(file_data) >= self.parallel_threshold)
+        compress = self.compression and self.crypto.should_compress(file_data, file_name)
         encrypted_package = self.crypto.encrypt_and_sign(
-            file_data, sender_private_key, recipient_public_key
+            file_data, sender_private_key, recipient_public_key,
+            parallel=parallel, workers=self.workers, compress=compress
         )
         
         # Add metadata
@@ -251,6 +1274,44 @@ class SecureFileTransfer:
         
         return encrypted_package
     
+    def prepare_file_for_recipients(self, file_data: bytes, file_name: str,
+                                    sender_id: str, recipient_ids: List[str]) -> dict:
+        """
+        Prepare one shared encrypted payload for several recipients
+        
+        Args:
+            file_data: File content
+            file_name: Original file name
+            sender_id: Sender's user ID
+            recipient_ids: Recipients' user IDs
+            
+        Returns:
+            Shared package dictionary with per-recipient encrypted_aes_keys
+        """
+        sender_private_key = self.key_manager.load_private_key(sender_id)
+        if not sender_private_key:
+            raise ValueError(f"Private key not found for sender: {sender_id}")
+        
+        recipient_public_keys = {}
+        for recipient_id in recipient_ids:
+            recipient_public_key = self.key_manager.load_public_key(recipient_id)
+            if not recipient_public_key:
+                raise ValueError(f"Public key not found for recipient: {recipient_id}")
+            recipient_public_keys[recipient_id] = recipient_public_key
+        
+        parallel = (self.parallel_threshold is not None
+                    and len(file_data) >= self.parallel_threshold)
+        compress = self.compression and self.crypto.should_compress(file_data, file_name)
+        shared_package = self.crypto.encrypt_and_sign_multi(
+            file_data, sender_private_key, recipient_public_keys,
+            parallel=parallel, workers=self.workers, compress=compress
+        )
+        
+        shared_package['file_name'] = file_name
+        shared_package['sender_id'] = sender_id
+        
+        return shared_package
+    
     def receive_and_process_file(self, transfer_package: dict) -> Tuple[bytes, str, bool, str]:
         """
         Receive and process transferred file
@@ -0,0 +1,119 @@
+# server/executor.py
+"""
+Off-loop execution of CPU-bound work
+Runs crypto on worker threads so the Socket.IO event loop keeps serving
+other clients, and measures how late the loop wakes up (event-loop lag)
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Dict
+
+
+class CPUExecutor:
+    """Runs CPU-bound functions off the event loop"""
+    
+    def __init__(self, socketio, max_workers: Optional[int] = None,
+                 lag_interval: float = 1.0):
+        """
+        Initialize CPU Executor
+        
+        Args:
+            socketio: SocketIO instance (decides eventlet tpool vs threads)
+            max_workers: Number of worker threads
+            lag_interval: Seconds between event-loop lag samples
+        """
+        self.socketio = socketio
+        self.max_workers = max_workers
+        self.lag_interval = lag_interval
+        self.completed = 0
+        self.failed = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self._pool = None
+        self._lock = threading.Lock()
+        self._monitor_started = False
+    
+    def _use_tpool(self) -> bool:
+        """Eventlet needs its own thread pool to hand results back to the hub"""
+        return self.socketio.async_mode == 'eventlet'
+    
+    def run(self, fn: Callable, *args, **kwargs):
+        """
+        Run fn on a worker thread and wait for the result
+        
+        Only the calling greenlet (or request thread) waits; the event loop
+        keeps running.
+        
+        Returns:
+            Return value of fn (exceptions are re-raised)
+        """
+        try:
+            if self._use_tpool():
+                from eventlet import tpool
+                result = tpool.execute(fn, *args, **kwargs)
+            else:
+                with self._lock:
+                    if self._pool is None:
+                        self._pool = ThreadPoolExecutor(
+                            max_workers=self.max_workers, thread_name_prefix='cpu'
+                        )
+                result = self._pool.submit(fn, *args, **kwargs).result()
+        except Exception:
+            self.failed += 1
+            raise
+        
+        self.completed += 1
+        return result
+    
+    def submit(self, fn: Callable, *args, callback: Optional[Callable] = None,
+               errback: Optional[Callable] = None, **kwargs):
+        """
+        Run fn off the loop without waiting for it
+        
+        callback(result) or errback(exception) is called from a background
+        task, where it is safe to emit socket events.
+        
+        Args:
+            fn: Function to run
+            callback: Called with the result
+            errback: Called with the exception if fn fails
+        """
+        def task():
+            try:
+                result = self.run(fn, *args, **kwargs)
+            except Exception as e:
+                if errback:
+                    errback(e)
+                return
+            if callback:
+                callback(result)
+        
+        self.socketio.start_background_task(task)
+    
+    def start_lag_monitor(self):
+        """Start sampling event-loop lag in a background task"""
+        if self._monitor_started or self.lag_interval <= 0:
+            return
+        self._monitor_started = True
+        self.socketio.start_background_task(self._monitor_lag)
+    
+    def _monitor_lag(self):
+        """Sleep on the loop and record how late it wakes up"""
+        while True:
+            start = time.monotonic()
+            self.socketio.sleep(self.lag_interval)
+            lag = max(0.0, time.monotonic() - start - self.lag_interval)
+            self.lag_last = lag
+            self.lag_max = max(self.lag_max, lag)
+    
+    def stats(self) -> Dict[str, float]:
+        """Get executor counters and event-loop lag in milliseconds"""
+        return {
+            'async_mode': self.socketio.async_mode,
+            'completed': self.completed,
+            'failed': self.failed,
+            'event_loop_lag_ms': round(self.lag_last * 1000, 2),
+            'event_loop_lag_max_ms': round(self.lag_max * 1000, 2)
+        }
@@ -0,0 +1,94 @@
+# server/expiry.py
+"""
+Expiry index for stored files
+Records when each upload/package directory was written, so cleanup only
+touches entries that are due instead of walking the whole store
+"""
+
+import heapq
+import sqlite3
+import threading
+from typing import List, Optional
+
+
+class ExpiryIndex:
+    """Min-heap of (created_at, path) backed by a SQLite file"""
+    
+    def __init__(self, index_path: str):
+        """
+        Initialize Expiry Index
+        
+        Args:
+            index_path: SQLite file holding the entries across restarts
+        """
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS expiry_index ("
+            " path TEXT PRIMARY KEY,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        
+        # Current creation time per path; heap entries that don't match it
+        # are stale (path removed or re-added) and skipped when popped
+        self._entries = dict(
+            self._conn.execute("SELECT path, created_at FROM expiry_index")
+        )
+        self._heap = [(created_at, path) for path, created_at in self._entries.items()]
+        heapq.heapify(self._heap)
+    
+    def add(self, path: str, created_at: float):
+        """Add or replace the entry of a path"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO expiry_index VALUES (?, ?)", (path, created_at)
+            )
+            self._conn.commit()
+            self._entries[path] = created_at
+            heapq.heappush(self._heap, (created_at, path))
+    
+    def remove(self, paths: List[str]):
+        """Remove the entries of the given paths"""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM expiry_index WHERE path = ?", [(path,) for path in paths]
+            )
+            self._conn.commit()
+            for path in paths:
+                self._entries.pop(path, None)
+    
+    def pop_due(self, cutoff: float, limit: int) -> List[str]:
+        """
+        Take up to limit paths created before cutoff, oldest first
+        
+        The entries stay in the index until remove() is called, so paths
+        whose deletion fails are retried after a restart.
+        
+        Args:
+            cutoff: Creation time before which a path is due
+            limit: Maximum number of paths
+        
+        Returns:
+            List of due paths
+        """
+        due = []
+        with self._lock:
+            while self._heap and len(due) < limit and self._heap[0][0] < cutoff:
+                created_at, path = heapq.heappop(self._heap)
+                if self._entries.get(path) == created_at:
+                    due.append(path)
+        return due
+    
+    def next_created_at(self) -> Optional[float]:
+        """Creation time of the oldest entry, or None if empty"""
+        with self._lock:
+            while self._heap and self._entries.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+    
+    def count(self) -> int:
+        """Number of tracked paths"""
+        with self._lock:
+            return len(self._entries)
@@ -4,21 +4,70 @@ File handling utilities
 """
 
 import os
+import mmap
+import fcntl
+import time
 import uuid
 import json
 import shutil
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from werkzeug.utils import secure_filename
-from typing import Optional, Tuple
-from shared.constants import ALLOWED_EXTENSIONS, MAX_FILE_SIZE
+import base64
+import hashlib
+from typing import Optional, Tuple, Dict, BinaryIO, List, Iterator, Union
+from shared.constants import (
+    ALLOWED_EXTENSIONS, MAX_FILE_SIZE, CHUNK_SIZE,
+    CONTAINER_FILENAME, LEGACY_PACKAGE_FILENAME, MERKLE_TREE_FILENAME,
+    KEY_ENVELOPE_FILENAME, SESSION_LOCK_FILENAME
+)
+from server.crypto_utils import CryptoUtils
+from server.blob_store import BlobStore
+from server.expiry import ExpiryIndex
+from shared.models import db, UploadedFile
+
+
+def _subdirs(path: str) -> List[str]:
+    """List the subdirectories of path (empty if path does not exist)"""
+    if not os.path.isdir(path):
+        return []
+    return [os.path.join(path, name) for name in os.listdir(path)
+            if os.path.isdir(os.path.join(path, name))]
+
+
+def _merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    """Merge overlapping or adjacent [start, end) byte ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
 
 
 class FileHandler:
     """Handles file operations"""
+    EXPIRY_INDEX_FILENAME = "expiry_index.sqlite3"
+    # Top-level folders that are not user upload directories
+    RESERVED_FOLDERS = ('encrypted', 'decrypted', 'sessions', 'blobs')
+    # Files at least this large are memory-mapped instead of read
+    MMAP_MIN_SIZE = 1024 * 1024
     
     def __init__(self, upload_folder: str = "uploads"):
         self.upload_folder = upload_folder
+        self.sessions_folder = os.path.join(upload_folder, 'sessions')
+        self._session_lock = threading.Lock()
+        self._session_locks = {}  # session_id -> thread lock of an existing session
         self._ensure_upload_folder()
+        self.blob_store = BlobStore(os.path.join(upload_folder, 'blobs'))
+        
+        index_path = os.path.join(upload_folder, self.EXPIRY_INDEX_FILENAME)
+        is_new_index = not os.path.exists(index_path)
+        self.expiry_index = ExpiryIndex(index_path)
+        if is_new_index:
+            self.rebuild_expiry_index()
     
     def _ensure_upload_folder(self):
         """Create upload folder if it doesn't exist"""
@@ -51,12 +100,324 @@ class FileHandler:
         Returns:
             Tuple of (file_id, file_path, file_size)
         """
+        file_hash = hashlib.sha256(file_data).hexdigest()
+        
+        # Content already stored: only link it, don't write it again
+        temp_path = None
+        if not self.blob_store.exists(file_hash):
+            temp_path = self.blob_store.temp_path()
+            with open(temp_path, 'wb') as f:
+                f.write(file_data)
+        
+        file_id, file_path = self._commit_upload(filename, user_id, len(file_data),
+                                                 file_hash, temp_path)
+        
+        return file_id, file_path, len(file_data)
+    
+    def save_uploaded_stream(self, stream: BinaryIO, filename: str, user_id: str,
+                             max_size: int = MAX_FILE_SIZE,
+                             chunk_size: int = CHUNK_SIZE) -> Tuple[str, str, int, str]:
+        """
+        Save an upload by streaming it to disk chunk by chunk
+        
+        The SHA-256 and the size limit are updated as data arrives, and the
+        file is renamed into place only when complete, so memory use does
+        not depend on the file size.
+        
+        Args:
+            stream: Readable binary stream with the file content
+            filename: Original filename
+            user_id: User who uploaded the file
+            max_size: Maximum allowed size in bytes
+            chunk_size: Bytes read per chunk
+            
+        Returns:
+            Tuple of (file_id, file_path, file_size, file_hash)
+            
+        Raises:
+            ValueError: If the file is empty or too large
+        """
+        temp_path = self.blob_store.temp_path()
+        
+        sha256_hash = hashlib.sha256()
+        file_size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                chunk = stream.read(chunk_size)
+                while chunk:
+                    file_size += len(chunk)
+                    if file_size > max_size:
+                        raise ValueError(
+                            f"File size exceeds maximum limit of {max_size // (1024*1024)}MB"
+                        )
+                    sha256_hash.update(chunk)
+                    f.write(chunk)
+                    chunk = stream.read(chunk_size)
+            
+            if file_size == 0:
+                raise ValueError("File is empty")
+        except Exception:
+            os.remove(temp_path)
+            raise
+        
+        file_hash = sha256_hash.hexdigest()
+        file_id, file_path = self._commit_upload(filename, user_id, file_size,
+                                                 file_hash, temp_path)
+        
+        return file_id, file_path, file_size, file_hash
+    
+    def create_upload_session(self, user_id: str, filename: str,
+                              total_size: int) -> dict:
+        """
+        Start a resumable upload
+        
+        Args:
+            user_id: User who uploads the file
+            filename: Original filename
+            total_size: Size of the complete file in bytes
+            
+        Returns:
+            Session dictionary
+            
+        Raises:
+            ValueError: If the declared size is not allowed
+        """
+        is_valid, message = self.validate_file_size(total_size)
+        if not is_valid:
+            raise ValueError(message)
+        
+        session_id = str(uuid.uuid4())
+        # Built under a hidden name and renamed into place, so other
+        # workers never see a session directory without session.json
+        temp_dir = os.path.join(self.sessions_folder, f'.{session_id}')
+        os.makedirs(temp_dir)
+        
+        # Preallocate the data file so chunks can be written at any offset
+        with open(os.path.join(temp_dir, 'data.part'), 'wb') as f:
+            f.truncate(total_size)
+        
+        now = time.time()
+        session = {
+            'session_id': session_id,
+            'user_id': user_id,
+            'filename': filename,
+            'total_size': total_size,
+            'received': [],
+            'created_at': now,
+            'updated_at': now
+        }
+        with open(os.path.join(temp_dir, 'session.json'), 'w') as f:
+            json.dump(session, f)
+        os.rename(temp_dir, os.path.join(self.sessions_folder, session_id))
+        
+        return session
+    
+    def _save_session(self, session: dict):
+        """Persist session state atomically"""
+        session_path = os.path.join(self.sessions_folder, session['session_id'],
+                                    'session.json')
+        temp_path = session_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(session, f)
+        os.replace(temp_path, session_path)
+    
+    @contextmanager
+    def _locked_upload_session(self, session_id: str) -> Iterator[None]:
+        """
+        Hold the lock serializing writes, finalize and expiry of a session
+        
+        A thread lock orders the threads (or greenlets) of this process and
+        an flock on the session's lock file orders the workers.
+        
+        Raises:
+            KeyError: If the session does not exist (or is deleted while
+                      waiting for the lock)
+        """
+        session_dir = os.path.join(self.sessions_folder, session_id)
+        with self._session_lock:
+            if not session_id or not os.path.isdir(session_dir):
+                raise KeyError(session_id)
+            lock = self._session_locks.setdefault(session_id, threading.Lock())
+        
+        with lock:
+            try:
+                fd = os.open(os.path.join(session_dir, SESSION_LOCK_FILENAME),
+                             os.O_RDWR | os.O_CREAT, 0o600)
+            except FileNotFoundError:
+                raise KeyError(session_id)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+    
+    def _forget_session_lock(self, session_id: str):
+        """Drop the thread lock of a deleted session"""
+        with self._session_lock:
+            self._session_locks.pop(session_id, None)
+    
+    def get_upload_session(self, session_id: str) -> Optional[dict]:
+        """
+        Load a resumable upload session
+        
+        Args:
+            session_id: Upload session ID
+            
+        Returns:
+            Session dictionary with the missing ranges added, or None
+        """
+        session_path = os.path.join(self.sessions_folder, secure_filename(session_id),
+                                    'session.json')
+        if not os.path.exists(session_path):
+            return None
+        
+        with open(session_path, 'r') as f:
+            session = json.load(f)
+        
+        missing = []
+        position = 0
+        for start, end in session['received']:
+            if start > position:
+                missing.append([position, start])
+            position = end
+        if position < session['total_size']:
+            missing.append([position, session['total_size']])
+        session['missing'] = missing
+        
+        return session
+    
+    def write_upload_chunk(self, session_id: str, offset: int, data: bytes) -> dict:
+        """
+        Write a chunk of a resumable upload at the given offset
+        
+        Args:
+            session_id: Upload session ID
+            offset: Byte offset of the chunk in the file
+            data: Chunk content
+            
+        Returns:
+            Updated session dictionary
+            
+        Raises:
+            KeyError: If the session does not exist
+            ValueError: If the chunk is outside the declared file size
+        """
+        # Under the session lock so concurrent chunks don't lose ranges and
+        # expiry can't delete the session directory mid-write
+        with self._locked_upload_session(secure_filename(session_id)):
+            session = self.get_upload_session(session_id)
+            if not session:
+                raise KeyError(session_id)
+            
+            if offset < 0 or offset + len(data) > session['total_size']:
+                raise ValueError("Chunk is outside the declared file size")
+            
+            data_path = os.path.join(self.sessions_folder, session['session_id'],
+                                     'data.part')
+            with open(data_path, 'r+b') as f:
+                f.seek(offset)
+                f.write(data)
+            
+            session['received'] = _merge_ranges(
+                session['received'] + [[offset, offset + len(data)]]
+            )
+            session['updated_at'] = time.time()
+            del session['missing']
+            self._save_session(session)
+            
+            return self.get_upload_session(session_id)
+    
+    def finalize_upload_session(self, session_id: str) -> Tuple[str, str, int, str]:
+        """
+        Turn a complete resumable upload into a normal upload
+        
+        Args:
+            session_id: Upload session ID
+            
+        Returns:
+            Tuple of (file_id, file_path, file_size, file_hash)
+            
+        Raises:
+            KeyError: If the session does not exist
+            ValueError: If parts of the file are still missing
+        """
+        session_id = secure_filename(session_id)
+        with self._locked_upload_session(session_id):
+            session = self.get_upload_session(session_id)
+            if not session:
+                raise KeyError(session_id)
+            
+            if session['missing']:
+                raise ValueError("Upload is incomplete")
+            
+            session_dir = os.path.join(self.sessions_folder, session['session_id'])
+            data_path = os.path.join(session_dir, 'data.part')
+            
+            sha256_hash = hashlib.sha256()
+            with open(data_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    sha256_hash.update(chunk)
+            file_hash = sha256_hash.hexdigest()
+            
+            file_id, file_path = self._commit_upload(session['filename'], session['user_id'],
+                                                     session['total_size'], file_hash,
+                                                     data_path)
+            
+            shutil.rmtree(session_dir, ignore_errors=True)
+        self._forget_session_lock(session_id)
+        
+        return file_id, file_path, session['total_size'], file_hash
+    
+    def expire_upload_sessions(self, ttl: int) -> int:
+        """
+        Delete upload sessions that have not received data for ttl seconds
+        
+        Args:
+            ttl: Session lifetime in seconds since the last chunk
+            
+        Returns:
+            Number of sessions deleted
+        """
+        if not os.path.exists(self.sessions_folder):
+            return 0
+        
+        cutoff_time = time.time() - ttl
+        expired = 0
+        for session_id in os.listdir(self.sessions_folder):
+            session_dir = os.path.join(self.sessions_folder, session_id)
+            if session_id.startswith('.'):
+                # Left over from a create_upload_session that crashed
+                try:
+                    if os.path.getmtime(session_dir) < cutoff_time:
+                        shutil.rmtree(session_dir, ignore_errors=True)
+                except OSError:
+                    pass
+                continue
+            
+            # Check and delete under the session lock: a chunk being
+            # written refreshes updated_at before the lock is released
+            try:
+                with self._locked_upload_session(session_id):
+                    session = self.get_upload_session(session_id)
+                    if session and session['updated_at'] >= cutoff_time:
+                        continue
+                    shutil.rmtree(session_dir, ignore_errors=True)
+            except KeyError:
+                continue  # Finalized or expired by another worker
+            self._forget_session_lock(session_id)
+            expired += 1
+        return expired
+    
+    def _create_upload_dir(self, user_id: str) -> Tuple[str, str]:
+        """
+        Create the directory for a new upload
+        
+        Returns:
+            Tuple of (file_id, file_dir)
+        """
         # Generate unique file ID
         file_id = str(uuid.uuid4())
         
-        # Secure the filename
-        safe_filename = secure_filename(filename)
-        
         # Create user upload directory
         user_dir = os.path.join(self.upload_folder, user_id)
         if not os.path.exists(user_dir):
@@ -66,30 +427,154 @@ class FileHandler:
         file_dir = os.path.join(user_dir, file_id)
         os.makedirs(file_dir)
         
-        # Save original file
+        return file_id, file_dir
+    
+    def _commit_upload(self, filename: str, user_id: str, file_size: int,
+                       file_hash: str, temp_path: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Create the upload directory and link the content from the blob store
+        
+        Args:
+            filename: Original filename
+            user_id: User who uploaded the file
+            file_size: Size of the content in bytes
+            file_hash: SHA-256 of the content
+            temp_path: File holding the content (consumed); without it the
+                       content must already be stored
+            
+        Returns:
+            Tuple of (file_id, file_path)
+            
+        Raises:
+            FileNotFoundError: If temp_path is None and the content is not stored
+        """
+        safe_filename = secure_filename(filename)
+        file_id, file_dir = self._create_upload_dir(user_id)
         file_path = os.path.join(file_dir, safe_filename)
-        with open(file_path, 'wb') as f:
-            f.write(file_data)
         
-        # Save metadata
-        metadata = {
-            'file_id': file_id,
-            'original_name': filename,
-            'safe_name': safe_filename,
-            'size': len(file_data),
-            'upload_time': datetime.now().isoformat(),
-            'user_id': user_id
-        }
+        try:
+            if temp_path:
+                self.blob_store.ingest(temp_path, file_hash, file_path)
+            elif not self.blob_store.link(file_hash, file_path):
+                raise FileNotFoundError(f"No stored content with hash {file_hash}")
+        except Exception:
+            shutil.rmtree(file_dir, ignore_errors=True)
+            raise
+        
+        # Record the upload; undo the files if the row can't be written
+        try:
+            db.session.add(UploadedFile(
+                file_id=file_id,
+                user_id=user_id,
+                original_name=filename,
+                safe_name=safe_filename,
+                file_path=file_path,
+                file_size=file_size,
+                file_hash=file_hash
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            shutil.rmtree(file_dir, ignore_errors=True)
+            self.blob_store.release(file_hash)
+            raise
         
-        metadata_path = os.path.join(file_dir, 'metadata.json')
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        self._track_expiry(file_dir)
         
-        return file_id, file_path, len(file_data)
+        return file_id, file_path
+    
+    def _iter_upload_dirs(self) -> Iterator[str]:
+        """Yield every uploads/<user>/<file_id> directory"""
+        for user_dir in _subdirs(self.upload_folder):
+            if os.path.basename(user_dir) not in self.RESERVED_FOLDERS:
+                yield from _subdirs(user_dir)
+    
+    def list_uploads(self, user_id: str, since: Optional[datetime] = None,
+                     before: Optional[datetime] = None,
+                     limit: int = 50) -> List[UploadedFile]:
+        """
+        Get a user's uploads, newest first
+        
+        Args:
+            user_id: User who uploaded the files
+            since: Only uploads created after this time
+            before: Only uploads created before this time (next page)
+            limit: Maximum number of uploads
+            
+        Returns:
+            List of UploadedFile rows
+        """
+        query = UploadedFile.query.filter_by(user_id=user_id)
+        if since:
+            query = query.filter(UploadedFile.created_at > since)
+        if before:
+            query = query.filter(UploadedFile.created_at < before)
+        
+        return query.order_by(UploadedFile.created_at.desc(),
+                              UploadedFile.id.desc()).limit(limit).all()
+    
+    def import_upload_sidecars(self, batch_size: int = 500) -> int:
+        """
+        Move the metadata.json of uploads stored before the UploadedFile
+        table existed into the database, then delete the sidecars
+        
+        Args:
+            batch_size: Rows inserted per transaction
+            
+        Returns:
+            Number of imported uploads
+        """
+        imported = 0
+        pending = []
+        
+        def flush():
+            file_ids = [metadata['file_id'] for metadata, _ in pending]
+            existing = {row.file_id for row in db.session.query(UploadedFile.file_id)
+                        .filter(UploadedFile.file_id.in_(file_ids))}
+            
+            for metadata, file_dir in pending:
+                if metadata['file_id'] in existing:
+                    continue
+                db.session.add(UploadedFile(
+                    file_id=metadata['file_id'],
+                    user_id=metadata['user_id'],
+                    original_name=metadata['original_name'],
+                    safe_name=metadata['safe_name'],
+                    file_path=os.path.join(file_dir, metadata['safe_name']),
+                    file_size=metadata['size'],
+                    file_hash=metadata.get('sha256'),
+                    # Sidecars store local time; the table stores UTC
+                    created_at=datetime.fromisoformat(metadata['upload_time'])
+                    .astimezone(timezone.utc).replace(tzinfo=None)
+                ))
+            db.session.commit()
+            
+            for _, file_dir in pending:
+                os.remove(os.path.join(file_dir, 'metadata.json'))
+            pending.clear()
+            return len(file_ids) - len(existing)
+        
+        for file_dir in self._iter_upload_dirs():
+            metadata_path = os.path.join(file_dir, 'metadata.json')
+            if not os.path.exists(metadata_path):
+                continue
+            
+            with open(metadata_path, 'r') as f:
+                pending.append((json.load(f), file_dir))
+            if len(pending) >= batch_size:
+                imported += flush()
+        
+        if pending:
+            imported += flush()
+        
+        return imported
     
     def save_encrypted_file(self, encrypted_data: dict, transfer_id: str) -> str:
         """
-        Save encrypted file data
+        Save encrypted file data as a binary container
+        
+        Packages that cannot be represented as a container (unknown format
+        or non-canonical fields) are stored as legacy JSON instead.
         
         Args:
             encrypted_data: Dictionary containing encrypted file data
@@ -103,13 +588,162 @@ class FileHandler:
         if not os.path.exists(encrypted_dir):
             os.makedirs(encrypted_dir)
         
-        # Save encrypted data as JSON
-        encrypted_path = os.path.join(encrypted_dir, 'encrypted_package.json')
-        with open(encrypted_path, 'w') as f:
-            json.dump(encrypted_data, f)
+        encrypted_path = os.path.join(encrypted_dir, CONTAINER_FILENAME)
+        try:
+            with open(encrypted_path, 'wb') as f:
+                CryptoUtils.write_container(f, encrypted_data)
+        except ValueError:
+            os.remove(encrypted_path)
+            
+            # Fall back to JSON
+            encrypted_path = os.path.join(encrypted_dir, LEGACY_PACKAGE_FILENAME)
+            with open(encrypted_path, 'w') as f:
+                json.dump(encrypted_data, f)
+        
+        self._track_expiry(encrypted_dir)
+        
+        return encrypted_path
+    
+    def save_shared_encrypted_file(self, shared_package: dict, batch_id: str,
+                                   transfer_ids: Dict[str, str]) -> str:
+        """
+        Save one ciphertext shared by several transfers
+        
+        The payload is written once under encrypted/shared/<batch_id>/ and
+        each transfer only gets a small key envelope with its wrapped key.
+        
+        Args:
+            shared_package: Package from encrypt_and_sign_multi
+            batch_id: Unique ID of the shared payload
+            transfer_ids: Mapping of recipient ID to transfer ID
+            
+        Returns:
+            Path to saved shared container
+        """
+        wrapped_keys = shared_package['encrypted_aes_keys']
+        package = {k: v for k, v in shared_package.items() if k != 'encrypted_aes_keys'}
+        package['encrypted_aes_key'] = ''
+        
+        shared_dir = os.path.join(self.upload_folder, 'encrypted', 'shared', batch_id)
+        if not os.path.exists(shared_dir):
+            os.makedirs(shared_dir)
+        
+        encrypted_path = os.path.join(shared_dir, CONTAINER_FILENAME)
+        with open(encrypted_path, 'wb') as f:
+            CryptoUtils.write_container(f, package)
+        
+        for recipient_id, transfer_id in transfer_ids.items():
+            envelope_dir = os.path.join(self.upload_folder, 'encrypted', transfer_id)
+            if not os.path.exists(envelope_dir):
+                os.makedirs(envelope_dir)
+            
+            envelope = {
+                'batch_id': batch_id,
+                'recipient_id': recipient_id,
+                'encrypted_aes_key': wrapped_keys[recipient_id]
+            }
+            with open(os.path.join(envelope_dir, KEY_ENVELOPE_FILENAME), 'w') as f:
+                json.dump(envelope, f)
+            self._track_expiry(envelope_dir)
+        
+        self._track_expiry(shared_dir)
+        
+        return encrypted_path
+    
+    def begin_encrypted_upload(self, package: dict, transfer_id: str,
+                               total_size: int) -> int:
+        """
+        Start receiving a container in chunks
+        
+        The header is written first and the file is preallocated, so
+        ciphertext chunks can be written at their offsets as they arrive.
+        
+        Args:
+            package: Encrypted package without the ciphertext
+            transfer_id: Unique transfer ID
+            total_size: Ciphertext size in bytes
+            
+        Returns:
+            Header size (file offset of ciphertext byte 0)
+            
+        Raises:
+            ValueError: If the package cannot be stored as a container
+        """
+        encrypted_dir = os.path.join(self.upload_folder, 'encrypted', transfer_id)
+        os.makedirs(encrypted_dir)
+        
+        part_path = os.path.join(encrypted_dir, CONTAINER_FILENAME + '.part')
+        try:
+            with open(part_path, 'wb') as f:
+                header_size = CryptoUtils.write_container_header(f, package)
+                f.truncate(header_size + total_size)
+        except Exception:
+            shutil.rmtree(encrypted_dir, ignore_errors=True)
+            raise
+        
+        return header_size
+    
+    def write_encrypted_chunk(self, transfer_id: str, position: int, data: bytes):
+        """Write a chunk of a container being received at a file position"""
+        part_path = os.path.join(self.upload_folder, 'encrypted', transfer_id,
+                                 CONTAINER_FILENAME + '.part')
+        with open(part_path, 'r+b') as f:
+            f.seek(position)
+            f.write(data)
+    
+    def commit_encrypted_upload(self, transfer_id: str) -> str:
+        """
+        Finish receiving a container
+        
+        Returns:
+            Path to the stored container
+        """
+        encrypted_dir = os.path.join(self.upload_folder, 'encrypted', transfer_id)
+        encrypted_path = os.path.join(encrypted_dir, CONTAINER_FILENAME)
+        os.replace(encrypted_path + '.part', encrypted_path)
+        self._track_expiry(encrypted_dir)
         
         return encrypted_path
     
+    def abort_encrypted_upload(self, transfer_id: str):
+        """Delete a partially received container"""
+        shutil.rmtree(os.path.join(self.upload_folder, 'encrypted', transfer_id),
+                      ignore_errors=True)
+    
+    def load_key_envelope(self, transfer_id: str) -> Optional[dict]:
+        """Load the key envelope of a transfer that uses a shared payload"""
+        envelope_path = os.path.join(self.upload_folder, 'encrypted', transfer_id,
+                                     KEY_ENVELOPE_FILENAME)
+        if os.path.exists(envelope_path):
+            with open(envelope_path, 'r') as f:
+                return json.load(f)
+        return None
+    
+    def _package_dir(self, transfer_id: str) -> str:
+        """Directory holding the package (and Merkle tree) of a transfer"""
+        envelope = self.load_key_envelope(transfer_id)
+        if envelope:
+            return os.path.join(self.upload_folder, 'encrypted', 'shared',
+                                envelope['batch_id'])
+        return os.path.join(self.upload_folder, 'encrypted', transfer_id)
+    
+    def get_encrypted_path(self, transfer_id: str) -> Optional[str]:
+        """
+        Find the stored package for a transfer
+        
+        Args:
+            transfer_id: Unique transfer ID
+            
+        Returns:
+            Path to the container or legacy JSON package, or None
+        """
+        encrypted_dir = self._package_dir(transfer_id)
+        for filename in (CONTAINER_FILENAME, LEGACY_PACKAGE_FILENAME):
+            encrypted_path = os.path.join(encrypted_dir, filename)
+            if os.path.exists(encrypted_path):
+                return encrypted_path
+        return None
+    
     def load_encrypted_file(self, transfer_id: str) -> Optional[dict]:
         """
         Load encrypted file data
@@ -120,13 +754,158 @@ class FileHandler:
         Returns:
             Encrypted data dictionary or None
         """
-        encrypted_path = os.path.join(self.upload_folder, 'encrypted', 
-                                     transfer_id, 'encrypted_package.json')
+        encrypted_path = self.get_encrypted_path(transfer_id)
+        if not encrypted_path:
+            return None
         
-        if os.path.exists(encrypted_path):
+        if not encrypted_path.endswith(CONTAINER_FILENAME):
             with open(encrypted_path, 'r') as f:
                 return json.load(f)
         
+        with open(encrypted_path, 'rb') as f:
+            encrypted_data = CryptoUtils.read_container(f)
+        
+        # Shared payload: add this recipient's wrapped key
+        envelope = self.load_key_envelope(transfer_id)
+        if envelope:
+            encrypted_data['encrypted_aes_key'] = envelope['encrypted_aes_key']
+            encrypted_data['recipient_id'] = envelope['recipient_id']
+        
+        return encrypted_data
+    
+    def open_encrypted_container(self, transfer_id: str) -> Optional[Tuple[dict, object]]:
+        """
+        Open a stored container without loading the ciphertext
+        
+        Args:
+            transfer_id: Unique transfer ID
+            
+        Returns:
+            Tuple of (header, file object positioned at the ciphertext) or
+            None. The caller must close the file object.
+        """
+        encrypted_path = self.get_encrypted_path(transfer_id)
+        if not encrypted_path or not encrypted_path.endswith(CONTAINER_FILENAME):
+            return None
+        
+        f = open(encrypted_path, 'rb')
+        try:
+            header = CryptoUtils.read_container_header(f)
+        except Exception:
+            f.close()
+            raise
+        
+        envelope = self.load_key_envelope(transfer_id)
+        if envelope:
+            header['encrypted_aes_key'] = base64.b64decode(envelope['encrypted_aes_key'])
+            header['metadata']['recipient_id'] = envelope['recipient_id']
+        
+        return header, f
+    
+    def convert_legacy_package(self, transfer_id: str) -> Optional[str]:
+        """
+        Convert a stored encrypted_package.json into a binary container
+        
+        Args:
+            transfer_id: Unique transfer ID
+            
+        Returns:
+            Path to the container, or None if there is nothing to convert
+            or the package cannot be represented as a container
+        """
+        encrypted_dir = os.path.join(self.upload_folder, 'encrypted', transfer_id)
+        legacy_path = os.path.join(encrypted_dir, LEGACY_PACKAGE_FILENAME)
+        if not os.path.exists(legacy_path):
+            return None
+        
+        with open(legacy_path, 'r') as f:
+            encrypted_data = json.load(f)
+        
+        # Write to a temp file and rename so readers never see a partial file
+        encrypted_path = os.path.join(encrypted_dir, CONTAINER_FILENAME)
+        temp_path = encrypted_path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                CryptoUtils.write_container(f, encrypted_data)
+        except ValueError:
+            os.remove(temp_path)
+            return None
+        
+        os.replace(temp_path, encrypted_path)
+        os.remove(legacy_path)
+        
+        # A Merkle tree of the JSON bytes no longer matches the package;
+        # the caller builds and signs the container's tree
+        tree_path = os.path.join(encrypted_dir, MERKLE_TREE_FILENAME)
+        if os.path.exists(tree_path):
+            os.remove(tree_path)
+        
+        return encrypted_path
+    
+    def convert_legacy_packages(self) -> List[str]:
+        """
+        Convert all stored JSON packages into binary containers
+        
+        Returns:
+            IDs of the converted transfers
+        """
+        encrypted_root = os.path.join(self.upload_folder, 'encrypted')
+        if not os.path.exists(encrypted_root):
+            return []
+        
+        return [transfer_id for transfer_id in os.listdir(encrypted_root)
+                if self.convert_legacy_package(transfer_id)]
+    
+    def build_merkle_tree(self, transfer_id: str) -> Optional[dict]:
+        """
+        Build the Merkle tree of a stored package
+        
+        Args:
+            transfer_id: Unique transfer ID
+            
+        Returns:
+            Merkle tree dictionary or None if the package does not exist
+        """
+        encrypted_path = self.get_encrypted_path(transfer_id)
+        if not encrypted_path:
+            return None
+        
+        with open(encrypted_path, 'rb') as f:
+            return CryptoUtils.build_merkle_tree(f)
+    
+    def save_merkle_tree(self, tree: dict, transfer_id: str) -> str:
+        """
+        Save a Merkle tree next to the stored package
+        
+        Args:
+            tree: Merkle tree dictionary
+            transfer_id: Unique transfer ID
+            
+        Returns:
+            Path to saved tree
+        """
+        tree_path = os.path.join(self._package_dir(transfer_id), MERKLE_TREE_FILENAME)
+        with open(tree_path, 'w') as f:
+            json.dump(tree, f)
+        
+        return tree_path
+    
+    def load_merkle_tree(self, transfer_id: str) -> Optional[dict]:
+        """
+        Load the Merkle tree of a stored package
+        
+        Args:
+            transfer_id: Unique transfer ID
+            
+        Returns:
+            Merkle tree dictionary or None
+        """
+        tree_path = os.path.join(self._package_dir(transfer_id), MERKLE_TREE_FILENAME)
+        
+        if os.path.exists(tree_path):
+            with open(tree_path, 'r') as f:
+                return json.load(f)
+        
         return None
     
     def save_decrypted_file(self, file_data: bytes, filename: str, 
@@ -156,6 +935,8 @@ class FileHandler:
         with open(file_path, 'wb') as f:
             f.write(file_data)
         
+        self._track_expiry(decrypted_dir)
+        
         return file_path
     
     def get_file_content(self, file_path: str) -> Optional[bytes]:
@@ -173,6 +954,46 @@ class FileHandler:
                 return f.read()
         return None
     
+    @contextmanager
+    def open_file_buffer(self, file_path: str) -> Iterator[Optional[Union[bytes, memoryview]]]:
+        """
+        Open a file as a read-only buffer for hashing and encryption
+        
+        Large files are memory-mapped and handed out as a memoryview, so
+        the hash and the cipher read the page cache directly instead of a
+        private copy of the whole file. Small files are read normally. The
+        buffer is only valid inside the with block.
+        
+        Args:
+            file_path: Path to file
+            
+        Yields:
+            File content as bytes or a read-only memoryview, or None if the
+            file does not exist
+        """
+        if not os.path.isfile(file_path):
+            yield None
+            return
+        
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < self.MMAP_MIN_SIZE:
+                yield f.read()
+                return
+            
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+                try:
+                    mapped.close()
+                except BufferError:
+                    # A slice of the view is still referenced (e.g. by an
+                    # exception traceback); the map is unmapped once the
+                    # last slice is freed
+                    pass
+    
     def delete_file(self, file_path: str) -> bool:
         """
         Delete a file
@@ -185,34 +1006,122 @@ class FileHandler:
         """
         try:
             if os.path.exists(file_path):
+                upload = UploadedFile.query.filter_by(
+                    file_id=os.path.basename(os.path.dirname(file_path))
+                ).first()
                 os.remove(file_path)
+                
+                if upload and upload.safe_name == os.path.basename(file_path):
+                    db.session.delete(upload)
+                    db.session.commit()
+                    if upload.file_hash:
+                        self.blob_store.release(upload.file_hash)
                 return True
         except Exception:
-            pass
+            db.session.rollback()
         return False
     
-    def cleanup_old_files(self, days: int = 7):
+    def _track_expiry(self, path: str):
+        """Record a newly written directory in the expiry index"""
+        self.expiry_index.add(os.path.relpath(path, self.upload_folder), time.time())
+    
+    def rebuild_expiry_index(self) -> int:
+        """
+        Add all existing upload, package and decrypted directories to the
+        expiry index, using their modification time as creation time
+        
+        Returns:
+            Number of indexed directories
         """
-        Clean up files older than specified days
+        encrypted_root = os.path.join(self.upload_folder, 'encrypted')
+        decrypted_root = os.path.join(self.upload_folder, 'decrypted')
+        
+        tracked = list(self._iter_upload_dirs())
+        for package_dir in _subdirs(encrypted_root):
+            if os.path.basename(package_dir) == 'shared':
+                tracked.extend(_subdirs(package_dir))
+            else:
+                tracked.append(package_dir)
+        for user_dir in _subdirs(decrypted_root):
+            tracked.extend(_subdirs(user_dir))
+        
+        for path in tracked:
+            self.expiry_index.add(os.path.relpath(path, self.upload_folder),
+                                  os.path.getmtime(path))
+        return len(tracked)
+    
+    def _delete_tracked(self, path: str, file_hash: Optional[str] = None):
+        """
+        Delete an expired directory and the parents it leaves empty
+        
+        Args:
+            path: Directory to delete
+            file_hash: Blob hash to release if path is an upload directory
+        """
+        shutil.rmtree(path, ignore_errors=True)
+        if file_hash:
+            self.blob_store.release(file_hash)
+        
+        # Remove uploads/<user>, decrypted/<user> etc. once empty
+        stop_dirs = {
+            os.path.abspath(self.upload_folder),
+            os.path.abspath(os.path.join(self.upload_folder, 'encrypted')),
+            os.path.abspath(os.path.join(self.upload_folder, 'encrypted', 'shared')),
+            os.path.abspath(os.path.join(self.upload_folder, 'decrypted'))
+        }
+        parent = os.path.dirname(os.path.abspath(path))
+        while parent not in stop_dirs:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+    
+    def cleanup_old_files(self, days: int = 7, batch_size: int = 100) -> int:
+        """
+        Clean up one batch of files older than specified days
+        
+        Only entries due in the expiry index are touched, so the cost
+        depends on the number of expired items, not on the store size.
         
         Args:
             days: Number of days to keep files
+            batch_size: Maximum number of directories deleted per call
+            
+        Returns:
+            Number of directories deleted (batch_size means more may be due)
         """
-        import time
+        cutoff_time = time.time() - (days * 24 * 60 * 60)
         
-        current_time = time.time()
-        cutoff_time = current_time - (days * 24 * 60 * 60)
+        due = self.expiry_index.pop_due(cutoff_time, batch_size)
+        if not due:
+            return 0
         
-        for root, dirs, files in os.walk(self.upload_folder):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_stat = os.stat(file_path)
-                
-                if file_stat.st_mtime < cutoff_time:
-                    try:
-                        os.remove(file_path)
-                    except Exception:
-                        pass
+        # Upload directories are <user>/<file_id>; fetch their rows at once
+        upload_ids = {}
+        for relative_path in due:
+            parts = relative_path.split(os.sep)
+            if len(parts) == 2 and parts[0] not in self.RESERVED_FOLDERS:
+                upload_ids[relative_path] = parts[1]
+        uploads = {}
+        if upload_ids:
+            uploads = {upload.file_id: upload for upload in UploadedFile.query.filter(
+                UploadedFile.file_id.in_(list(upload_ids.values()))
+            )}
+        
+        for relative_path in due:
+            upload = uploads.get(upload_ids.get(relative_path))
+            self._delete_tracked(os.path.join(self.upload_folder, relative_path),
+                                 upload.file_hash if upload else None)
+        
+        if uploads:
+            UploadedFile.query.filter(
+                UploadedFile.file_id.in_(list(uploads))
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        self.expiry_index.remove(due)
+        
+        return len(due)
     
     def get_file_info(self, file_path: str) -> dict:
         """
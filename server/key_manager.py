@@ -7,27 +7,173 @@ Handles generation, storage, and retrieval of RSA key pairs
 import os
 import json
 import base64
+import hashlib
+import shutil
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_OAEP
 from Crypto.Random import get_random_bytes
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, Iterator
+from shared.models import db, PublicKeyRegistry
+
+class KeyCache:
+    """Bounded LRU cache of parsed RSA keys, validated by file mtime"""
+    
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, cache_key: tuple, mtime_ns: int) -> Optional[RSA.RsaKey]:
+        """
+        Get a cached key if it was loaded from the same file version
+        
+        Args:
+            cache_key: (user_id, key type)
+            mtime_ns: Current modification time of the key file
+            
+        Returns:
+            RSA key object or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and entry[0] == mtime_ns:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+    
+    def put(self, cache_key: tuple, mtime_ns: int, key: RSA.RsaKey):
+        """Store a parsed key, evicting the least recently used entry"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[cache_key] = (mtime_ns, key)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, user_id: str):
+        """Drop all cached keys of a user"""
+        with self._lock:
+            for cache_key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[cache_key]
+    
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize
+            }
+
 
 class KeyManager:
-    def __init__(self, keys_directory: str = "keys"):
+    SHARDS_DIRNAME = "_shards"
+    
+    def __init__(self, keys_directory: str = "keys", cache_size: int = 256):
         """
         Initialize Key Manager
         
         Args:
             keys_directory: Directory to store keys
+            cache_size: Maximum number of parsed keys kept in memory
         """
         self.keys_directory = keys_directory
+        self.key_cache = KeyCache(cache_size)
         self._ensure_directory_exists()
         
     def _ensure_directory_exists(self):
         """Create keys directory if it doesn't exist"""
         if not os.path.exists(self.keys_directory):
             os.makedirs(self.keys_directory)
+    
+    def _sharded_user_dir(self, user_id: str) -> str:
+        """
+        Directory of a user in the sharded layout:
+        <keys>/_shards/<h[0:2]>/<h[2:4]>/<user_id> with h = sha256(user_id)
+        """
+        digest = hashlib.sha256(user_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.keys_directory, self.SHARDS_DIRNAME,
+                            digest[:2], digest[2:4], user_id)
+    
+    def _legacy_user_dir(self, user_id: str) -> str:
+        """Directory of a user in the old flat layout"""
+        return os.path.join(self.keys_directory, user_id)
+    
+    def _find_user_dir(self, user_id: str) -> Optional[str]:
+        """
+        Find a user's key directory in either layout
+        
+        The sharded path is checked again after the flat one, so a user
+        moved by migrate_to_sharded in between is still found.
+        """
+        sharded_dir = self._sharded_user_dir(user_id)
+        for user_dir in (sharded_dir, self._legacy_user_dir(user_id), sharded_dir):
+            if os.path.isdir(user_dir):
+                return user_dir
+        return None
+    
+    def _iter_user_dirs(self) -> Iterator[Tuple[str, str]]:
+        """Yield (user_id, directory) for every stored user in both layouts"""
+        shards_root = os.path.join(self.keys_directory, self.SHARDS_DIRNAME)
+        if os.path.isdir(shards_root):
+            for shard in os.listdir(shards_root):
+                shard_dir = os.path.join(shards_root, shard)
+                for sub_shard in os.listdir(shard_dir):
+                    sub_shard_dir = os.path.join(shard_dir, sub_shard)
+                    for user_id in os.listdir(sub_shard_dir):
+                        yield user_id, os.path.join(sub_shard_dir, user_id)
+        
+        for user_id in os.listdir(self.keys_directory):
+            user_dir = self._legacy_user_dir(user_id)
+            if os.path.exists(os.path.join(user_dir, "public_key.pem")):
+                yield user_id, user_dir
+    
+    def migrate_to_sharded(self, limit: Optional[int] = None) -> int:
+        """
+        Move users from the flat layout to the sharded layout
+        
+        Each user directory is moved with a single rename, and lookups
+        check both layouts, so this can run while the server is serving
+        requests.
+        
+        Args:
+            limit: Maximum number of users to move in this call
+            
+        Returns:
+            Number of users moved
+        """
+        moved = 0
+        for user_id in os.listdir(self.keys_directory):
+            if limit is not None and moved >= limit:
+                break
+            
+            legacy_dir = self._legacy_user_dir(user_id)
+            if not os.path.exists(os.path.join(legacy_dir, "public_key.pem")):
+                continue
+            
+            sharded_dir = self._sharded_user_dir(user_id)
+            os.makedirs(os.path.dirname(sharded_dir), exist_ok=True)
+            try:
+                os.rename(legacy_dir, sharded_dir)
+            except FileNotFoundError:
+                # Moved by a concurrent migration
+                continue
+            except OSError:
+                if not os.path.isdir(sharded_dir):
+                    raise
+                # Already saved in the new layout - the flat copy is stale
+                shutil.rmtree(legacy_dir, ignore_errors=True)
+            moved += 1
+        return moved
             
     def generate_key_pair(self, key_size: int = 2048) -> Tuple[bytes, bytes]:
         """
@@ -63,8 +209,10 @@ class KeyManager:
         Returns:
             Dictionary with file paths
         """
+        self.key_cache.invalidate(user_id)
+        
         # Create user directory
-        user_dir = os.path.join(self.keys_directory, user_id)
+        user_dir = self._sharded_user_dir(user_id)
         if not os.path.exists(user_dir):
             os.makedirs(user_dir)
             
@@ -78,23 +226,18 @@ class KeyManager:
         with open(public_key_path, 'wb') as f:
             f.write(public_key)
             
-        # Save metadata
-        metadata = {
-            "user_id": user_id,
-            "created_at": datetime.now().isoformat(),
-            "key_size": RSA.import_key(private_key).size_in_bits(),
-            "public_key_path": public_key_path,
-            "private_key_path": private_key_path
-        }
+        # Creation time lives in the registry, not in a sidecar
+        self._index_user(user_id, public_key)
+        db.session.commit()
         
-        metadata_path = os.path.join(user_dir, "metadata.json")
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        # Drop a stale copy left in the flat layout
+        legacy_dir = self._legacy_user_dir(user_id)
+        if os.path.isdir(legacy_dir):
+            shutil.rmtree(legacy_dir)
             
         return {
             "private_key_path": private_key_path,
-            "public_key_path": public_key_path,
-            "metadata_path": metadata_path
+            "public_key_path": public_key_path
         }
     
     def load_private_key(self, user_id: str) -> Optional[RSA.RsaKey]:
@@ -107,15 +250,7 @@ class KeyManager:
         Returns:
             RSA private key object or None if not found
         """
-        private_key_path = os.path.join(self.keys_directory, user_id, "private_key.pem")
-        
-        if not os.path.exists(private_key_path):
-            return None
-            
-        with open(private_key_path, 'rb') as f:
-            private_key = RSA.import_key(f.read())
-            
-        return private_key
+        return self._load_key(user_id, "private_key.pem")
     
     def load_public_key(self, user_id: str) -> Optional[RSA.RsaKey]:
         """
@@ -127,15 +262,37 @@ class KeyManager:
         Returns:
             RSA public key object or None if not found
         """
-        public_key_path = os.path.join(self.keys_directory, user_id, "public_key.pem")
+        return self._load_key(user_id, "public_key.pem")
+    
+    def _load_key(self, user_id: str, filename: str) -> Optional[RSA.RsaKey]:
+        """Load a key file through the cache"""
+        user_dir = self._find_user_dir(user_id)
+        if not user_dir:
+            return None
+        key_path = os.path.join(user_dir, filename)
         
-        if not os.path.exists(public_key_path):
+        try:
+            mtime_ns = os.stat(key_path).st_mtime_ns
+        except FileNotFoundError:
             return None
-            
-        with open(public_key_path, 'rb') as f:
-            public_key = RSA.import_key(f.read())
-            
-        return public_key
+        
+        cache_key = (user_id, filename)
+        key = self.key_cache.get(cache_key, mtime_ns)
+        if key is None:
+            with open(key_path, 'rb') as f:
+                key = RSA.import_key(f.read())
+            self.key_cache.put(cache_key, mtime_ns, key)
+        
+        return key
+    
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Get key cache counters
+        
+        Returns:
+            Dictionary with hits, misses, size and maxsize
+        """
+        return self.key_cache.stats()
     
     def get_public_key_pem(self, user_id: str) -> Optional[str]:
         """
@@ -164,22 +321,102 @@ class KeyManager:
         """
         return RSA.import_key(pem_key.encode('utf-8'))
     
-    def list_users(self) -> list:
+    def _index_user(self, user_id: str, public_key: bytes,
+                    created_at: Optional[datetime] = None):
+        """
+        Add or update a user's entry in the PublicKeyRegistry table
+        
+        The caller commits. Needs an application context.
+        """
+        entry = PublicKeyRegistry.query.filter_by(user_id=user_id).first()
+        if entry is None:
+            entry = PublicKeyRegistry(user_id=user_id, created_at=created_at or datetime.utcnow())
+            db.session.add(entry)
+        entry.public_key = public_key.decode('utf-8')
+        entry.fingerprint = hashlib.sha256(public_key).hexdigest()[:16]
+    
+    def rebuild_index(self) -> int:
+        """
+        Add every stored key to the PublicKeyRegistry table
+        
+        Only needed once for key stores created before save_key_pair
+        registered keys. Needs an application context.
+        
+        Returns:
+            Number of indexed users
+        """
+        count = 0
+        for user_id, user_dir in self._iter_user_dirs():
+            public_key_path = os.path.join(user_dir, "public_key.pem")
+            if not os.path.exists(public_key_path):
+                continue
+            
+            with open(public_key_path, 'rb') as f:
+                public_key = f.read()
+            
+            # Key stores written before the registry still have a metadata.json
+            metadata = {}
+            metadata_path = os.path.join(user_dir, "metadata.json")
+            if os.path.exists(metadata_path):
+                with open(metadata_path, 'r') as f:
+                    metadata = json.load(f)
+            created_at = datetime.fromisoformat(metadata["created_at"]) \
+                if metadata.get("created_at") \
+                else datetime.utcfromtimestamp(os.path.getmtime(public_key_path))
+            
+            self._index_user(user_id, public_key, created_at)
+            count += 1
+        db.session.commit()
+        return count
+    
+    @staticmethod
+    def _registry_page(after: Optional[str] = None, limit: Optional[int] = None,
+                       offset: int = 0):
+        """Registry query ordered by user_id, starting after a given user_id"""
+        query = PublicKeyRegistry.query
+        if after is not None:
+            query = query.filter(PublicKeyRegistry.user_id > after)
+        query = query.order_by(PublicKeyRegistry.user_id)
+        if offset:
+            query = query.offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+    
+    def list_users(self, offset: int = 0, limit: Optional[int] = None) -> list:
         """
         List all users with stored keys
         
+        Args:
+            offset: Number of users to skip
+            limit: Maximum number of users (None for all)
+            
         Returns:
-            List of user IDs
-        """
-        users = []
-        if os.path.exists(self.keys_directory):
-            for user_id in os.listdir(self.keys_directory):
-                user_dir = os.path.join(self.keys_directory, user_id)
-                if os.path.isdir(user_dir):
-                    metadata_path = os.path.join(user_dir, "metadata.json")
-                    if os.path.exists(metadata_path):
-                        users.append(user_id)
-        return users
+            List of user IDs sorted by user ID
+        """
+        query = self._registry_page(limit=limit, offset=offset)
+        return [row.user_id for row in query.with_entities(PublicKeyRegistry.user_id)]
+    
+    def list_users_page(self, after: Optional[str] = None,
+                        limit: int = 100) -> Tuple[list, Optional[str]]:
+        """
+        List users one page at a time
+        
+        Args:
+            after: Cursor returned by the previous page
+            limit: Page size
+            
+        Returns:
+            Tuple of (user IDs, cursor for the next page or None)
+        """
+        query = self._registry_page(after=after, limit=limit)
+        users = [row.user_id for row in query.with_entities(PublicKeyRegistry.user_id)]
+        next_cursor = users[-1] if len(users) == limit else None
+        return users, next_cursor
+    
+    def count_users(self) -> int:
+        """Number of users with stored keys"""
+        return PublicKeyRegistry.query.count()
     
     def delete_user_keys(self, user_id: str) -> bool:
         """
@@ -191,13 +428,16 @@ class KeyManager:
         Returns:
             True if successful, False otherwise
         """
-        user_dir = os.path.join(self.keys_directory, user_id)
+        self.key_cache.invalidate(user_id)
+        PublicKeyRegistry.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
         
-        if os.path.exists(user_dir):
-            import shutil
-            shutil.rmtree(user_dir)
-            return True
-        return False
+        deleted = False
+        for user_dir in (self._sharded_user_dir(user_id), self._legacy_user_dir(user_id)):
+            if os.path.exists(user_dir):
+                shutil.rmtree(user_dir)
+                deleted = True
+        return deleted
     
     def export_public_keys_registry(self) -> Dict[str, str]:
         """
@@ -206,12 +446,26 @@ class KeyManager:
         Returns:
             Dictionary mapping user_id to public key PEM
         """
-        registry = {}
-        for user_id in self.list_users():
-            public_key_pem = self.get_public_key_pem(user_id)
-            if public_key_pem:
-                registry[user_id] = public_key_pem
-        return registry
+        query = self._registry_page().with_entities(PublicKeyRegistry.user_id,
+                                                    PublicKeyRegistry.public_key)
+        return dict(query.all())
+    
+    def export_public_keys_with_fingerprints(self, after: Optional[str] = None,
+                                             limit: Optional[int] = None) -> Dict[str, dict]:
+        """
+        Export public keys with their fingerprints
+        
+        Args:
+            after: Only users sorted after this user ID
+            limit: Maximum number of users (None for all)
+            
+        Returns:
+            Dictionary mapping user_id to public_key and fingerprint
+        """
+        return {
+            entry.user_id: {'public_key': entry.public_key, 'fingerprint': entry.fingerprint}
+            for entry in self._registry_page(after=after, limit=limit)
+        }
 
 
 # Utility functions for key operations
@@ -0,0 +1,102 @@
+# server/key_pool.py
+"""
+Pool of pre-generated RSA key pairs
+Keeps fresh key pairs ready so registration never waits for key generation
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Tuple, Optional, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class KeyPool:
+    """Keeps a number of key pairs ready and refills them in the background"""
+    
+    # Seconds to wait after a failed key generation (doubles up to the max)
+    RETRY_DELAY = 1.0
+    RETRY_DELAY_MAX = 60.0
+    
+    def __init__(self, key_manager, cpu_executor, size: int = 4, key_size: int = 2048):
+        """
+        Initialize Key Pool
+        
+        Args:
+            key_manager: KeyManager used to generate key pairs
+            cpu_executor: CPUExecutor that runs key generation off the event
+                          loop (eventlet tpool or worker threads)
+            size: Number of key pairs to keep ready
+            key_size: RSA key size in bits
+        """
+        self.key_manager = key_manager
+        self.cpu_executor = cpu_executor
+        self.size = size
+        self.key_size = key_size
+        self.handed_out = 0
+        self.empty_hits = 0
+        self.failures = 0
+        self._pairs = deque()
+        self._lock = threading.Lock()
+        self._wakeup = cpu_executor.socketio.server.eio.create_event()
+        self._started = False
+    
+    def start(self):
+        """Start the background refill task"""
+        if self.size <= 0 or self._started:
+            return
+        
+        self._started = True
+        self.cpu_executor.socketio.start_background_task(self._refill_loop)
+    
+    def _refill_loop(self):
+        """Generate key pairs until the pool is full, then wait for a request"""
+        delay = self.RETRY_DELAY
+        while True:
+            while len(self._pairs) < self.size:
+                try:
+                    key_pair = self.cpu_executor.run(self.key_manager.generate_key_pair,
+                                                     self.key_size)
+                except Exception:
+                    self.failures += 1
+                    logger.exception("Key pool refill failed, retrying in %.1fs", delay)
+                    self.cpu_executor.socketio.sleep(delay)
+                    delay = min(delay * 2, self.RETRY_DELAY_MAX)
+                    continue
+                
+                delay = self.RETRY_DELAY
+                with self._lock:
+                    self._pairs.append(key_pair)
+            
+            self._wakeup.wait()
+            self._wakeup.clear()
+    
+    def acquire(self) -> Optional[Tuple[bytes, bytes]]:
+        """
+        Take a ready key pair from the pool
+        
+        Returns:
+            Tuple of (private_key, public_key) in PEM format, or None if the
+            pool is empty
+        """
+        with self._lock:
+            key_pair = self._pairs.popleft() if self._pairs else None
+            if key_pair:
+                self.handed_out += 1
+            else:
+                self.empty_hits += 1
+        
+        self._wakeup.set()
+        return key_pair
+    
+    def stats(self) -> Dict[str, int]:
+        """Get pool counters"""
+        with self._lock:
+            return {
+                'available': len(self._pairs),
+                'size': self.size,
+                'handed_out': self.handed_out,
+                'empty_hits': self.empty_hits,
+                'failures': self.failures
+            }
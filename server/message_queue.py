@@ -0,0 +1,64 @@
+# server/message_queue.py
+"""
+Socket.IO message queue selection
+With a message queue every worker publishes its emits (room=recipient_id,
+presence pushes, ...) to the other workers, so a user can be reached
+whichever worker holds their connection
+"""
+
+import pickle
+import threading
+from typing import Dict
+import socketio
+
+
+class LocalPubSubManager(socketio.PubSubManager):
+    """
+    In-process stand-in for a message queue backend
+    
+    Servers created in the same process with the same channel exchange
+    messages like separate workers on Redis would (for tests and local
+    runs, no broker needed). Messages are pickled, so emits carrying bytes
+    (binary chunks) pass through, and each server listens on a queue of
+    its async mode, so waiting for messages doesn't block the eventlet hub.
+    """
+    
+    name = 'local'
+    _channels = {}  # channel -> list of subscriber queues
+    _channels_lock = threading.Lock()
+    
+    def initialize(self):
+        self._queue = self.server.eio.create_queue()
+        with self._channels_lock:
+            self._channels.setdefault(self.channel, []).append(self._queue)
+        super().initialize()
+    
+    def _publish(self, data):
+        message = pickle.dumps(data)
+        with self._channels_lock:
+            subscribers = list(self._channels.get(self.channel, []))
+        for subscriber in subscribers:
+            subscriber.put(message)
+    
+    def _listen(self):
+        while True:
+            yield pickle.loads(self._queue.get())
+
+
+def socketio_queue_options(message_queue: str, channel: str = 'socketio') -> Dict:
+    """
+    Get SocketIO() keyword arguments for a message queue URL
+    
+    Args:
+        message_queue: '' (single worker), 'local://' (LocalPubSubManager)
+                       or a redis:// / amqp:// URL
+        channel: Channel name shared by the workers
+    
+    Returns:
+        Dictionary of SocketIO keyword arguments
+    """
+    if not message_queue:
+        return {}
+    if message_queue == 'local://':
+        return {'client_manager': LocalPubSubManager(channel=channel)}
+    return {'message_queue': message_queue, 'channel': channel}
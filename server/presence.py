@@ -0,0 +1,108 @@
+# server/presence.py
+"""
+Presence index
+Tracks which users are online (by user_id, across their connections, in
+a state store shared by the workers) and collects this worker's changes
+so they can be pushed to subscribers as small diffs
+"""
+
+import threading
+from typing import Optional, Dict, List
+from server.state_store import MemoryStateStore
+
+
+class PresenceIndex:
+    """Online users keyed by user_id, with pending changes for diff pushes"""
+    
+    def __init__(self, store=None):
+        """
+        Initialize Presence Index
+        
+        Args:
+            store: Shared state store holding connections and profiles
+                   (default: a process-local MemoryStateStore). Pending
+                   changes stay in the process and are pushed by it
+        """
+        self.store = store or MemoryStateStore()
+        self._pending = {}  # user_id -> profile dict (online/updated) or None (offline)
+        self._lock = threading.Lock()
+    
+    @property
+    def version(self) -> int:
+        """Version of the last pushed diff"""
+        return self.store.version()
+    
+    def add(self, user_id: str, client_id: str, username: str,
+            has_public_key: bool = False):
+        """
+        Record a connection of a user
+        
+        Args:
+            user_id: User identifier
+            client_id: Socket connection ID
+            username: Display name
+            has_public_key: Whether the user has keys
+        """
+        profile = {
+            'user_id': user_id,
+            'username': username,
+            'has_public_key': has_public_key
+        }
+        if self.store.add_presence(user_id, client_id, profile):
+            with self._lock:
+                self._pending[user_id] = profile
+    
+    def remove(self, user_id: str, client_id: str):
+        """Forget a connection; the user goes offline with its last one"""
+        if self.store.remove_presence(user_id, client_id):
+            with self._lock:
+                self._pending[user_id] = None
+    
+    def update(self, user_id: str, **fields):
+        """Change the profile of an online user (e.g. keys generated)"""
+        profile = self.store.update_profile(user_id, fields)
+        if profile is not None:
+            with self._lock:
+                self._pending[user_id] = profile
+    
+    def user_ids(self) -> List[str]:
+        """IDs of all online users"""
+        return [profile['user_id'] for profile in self.store.profiles()]
+    
+    def snapshot(self) -> Dict:
+        """
+        Get the full online list and the version it corresponds to
+        
+        Returns:
+            Dictionary with users (list of profiles) and version
+        """
+        # Read the version first: a diff racing with the snapshot then has
+        # a higher version and is applied on top (diffs are idempotent)
+        version = self.store.version()
+        return {
+            'users': self.store.profiles(),
+            'version': version
+        }
+    
+    def take_diff(self) -> Optional[Dict]:
+        """
+        Take the changes collected since the last call
+        
+        A user who went online and offline again in between shows up only
+        in its final state.
+        
+        Returns:
+            Dictionary with online (profiles), offline (user IDs) and
+            version, or None if nothing changed
+        """
+        with self._lock:
+            if not self._pending:
+                return None
+            pending, self._pending = self._pending, {}
+        
+        return {
+            'online': [dict(profile) for profile in pending.values() if profile],
+            'offline': [user_id for user_id, profile in pending.items()
+                        if profile is None],
+            'version': self.store.next_version()
+        }
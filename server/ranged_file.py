@@ -0,0 +1,47 @@
+# server/ranged_file.py
+"""
+File responses with HTTP Range / If-Range support
+Flask's send_file(conditional=True) answers Range, If-Range, 304 and 416
+and hands full responses to the server's wsgi.file_wrapper (sendfile on
+gunicorn); this module only adds the headers of stored packages
+"""
+
+import os
+import mimetypes
+from typing import Optional
+from flask import Response, send_file
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+
+def send_file_ranged(path: str, download_name: Optional[str] = None,
+                     as_attachment: bool = True,
+                     mimetype: Optional[str] = None) -> Response:
+    """
+    Send a file, honouring conditional and single-range requests
+    
+    Args:
+        path: Path of the file to send
+        download_name: File name in Content-Disposition (default: basename)
+        as_attachment: Send as attachment instead of inline
+        mimetype: Content type (default: guessed from the file name)
+    
+    Returns:
+        200, 206, 304 or 416 response
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    download_name = download_name or os.path.basename(path)
+    mimetype = mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    
+    try:
+        response = send_file(path, mimetype=mimetype, as_attachment=as_attachment,
+                             download_name=download_name, conditional=True,
+                             etag=f"{stat.st_mtime_ns:x}-{stat.st_size:x}", max_age=0)
+    except RequestedRangeNotSatisfiable as e:
+        # Returned rather than raised, so routes' catch-all handlers keep it a 416
+        return e.get_response()
+    # Packages belong to one sender and recipient: no shared caches, and
+    # clients revalidate with the ETag before reusing a copy
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers.pop('Expires', None)
+    return response
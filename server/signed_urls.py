@@ -0,0 +1,47 @@
+# server/signed_urls.py
+"""
+Short-lived signed download tokens
+A token names one transfer and one user and is only accepted for a few
+minutes, so download links handed out over the socket can be fetched over
+plain HTTP without another login
+"""
+
+from typing import Tuple
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+__all__ = ['DownloadSigner', 'BadSignature', 'SignatureExpired']
+
+
+class DownloadSigner:
+    """Signs and verifies (transfer_id, user_id) download tokens"""
+    
+    SALT = 'package-download'
+    
+    def __init__(self, secret_key: str, ttl: int = 300):
+        """
+        Initialize Download Signer
+        
+        Args:
+            secret_key: Application secret (SECRET_KEY)
+            ttl: Seconds a token stays valid
+        """
+        self.ttl = ttl
+        self._serializer = URLSafeTimedSerializer(secret_key, salt=self.SALT)
+    
+    def sign(self, transfer_id: str, user_id: str) -> str:
+        """Create a token for a user to download a transfer"""
+        return self._serializer.dumps({'t': transfer_id, 'u': user_id})
+    
+    def verify(self, token: str) -> Tuple[str, str]:
+        """
+        Check a token
+        
+        Returns:
+            Tuple of (transfer_id, user_id)
+        
+        Raises:
+            SignatureExpired: If the token is older than ttl
+            BadSignature: If the token was not made by this signer
+        """
+        data = self._serializer.loads(token, max_age=self.ttl)
+        return data['t'], data['u']
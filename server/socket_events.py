@@ -4,27 +4,273 @@ WebSocket event handlers
 """
 
 from flask_socketio import emit, join_room, leave_room
-from flask import request
+from flask import request, current_app, url_for
+import os
 import uuid
-import json
+import logging
 from datetime import datetime
-from shared.constants import SOCKET_EVENTS, STATUS, ERROR_MESSAGES
+from shared.constants import (
+    SOCKET_EVENTS, STATUS, ERROR_MESSAGES, SOCKET_CHUNK_SIZE, SOCKET_CHUNK_WINDOW
+)
 from shared.models import db, User, FileTransfer, PublicKeyRegistry
+from server.executor import CPUExecutor
+from server.presence import PresenceIndex
+from server.state_store import MemoryStateStore
+from server.signed_urls import DownloadSigner
+from server.transfer_history import (
+    query_transfer_history, encode_cursor, DIRECTIONS as HISTORY_DIRECTIONS
+)
+
+# Room of clients that receive presence_diff pushes
+PRESENCE_ROOM = 'presence'
+
+
+logger = logging.getLogger(__name__)
 
 
 class SocketEventHandlers:
     """Handles WebSocket events"""
     
-    def __init__(self, socketio, key_manager, file_handler, crypto_utils):
+    def __init__(self, socketio, key_manager, file_handler, crypto_utils,
+                 secure_transfer=None, key_pool=None, cpu_executor=None,
+                 state_store=None, download_signer=None):
         self.socketio = socketio
         self.key_manager = key_manager
         self.file_handler = file_handler
         self.crypto_utils = crypto_utils
-        self.active_connections = {}
+        self.secure_transfer = secure_transfer
+        self.key_pool = key_pool
+        self.cpu_executor = cpu_executor or CPUExecutor(socketio)
+        # Connections and presence live in the state store so that all
+        # workers see them; chunked transfers stay with the worker holding
+        # the connection (sticky sessions)
+        self.state_store = state_store or MemoryStateStore()
+        self.download_signer = download_signer
+        self.pending_registrations = set()
+        self.chunked_transfers = {}
+        self.presence = PresenceIndex(self.state_store)
         
         # Register event handlers
         self.register_handlers()
     
+    def _create_user(self, user_id, username, private_key, public_key):
+        """
+        Save a new key pair and create the user and registry entries
+        
+        Returns:
+            Public key PEM string
+        """
+        # Save keys (also adds the PublicKeyRegistry entry)
+        self.key_manager.save_key_pair(user_id, private_key, public_key)
+        
+        public_key_str = public_key.decode('utf-8')
+        user = User(user_id=user_id, username=username, public_key=public_key_str)
+        db.session.add(user)
+        db.session.commit()
+        
+        self.presence.update(user_id, has_public_key=True)
+        
+        return public_key_str
+    
+    def _start_registration(self, client_id, user_id, username):
+        """
+        Create a new user with a pooled key pair, or generate one in the
+        background when the pool is empty
+        """
+        key_pair = self.key_pool.acquire() if self.key_pool else None
+        
+        if key_pair:
+            public_key_str = self._create_user(user_id, username, *key_pair)
+            
+            emit('keys_generated', {
+                'status': STATUS['SUCCESS'],
+                'user_id': user_id,
+                'public_key': public_key_str,
+                'message': 'Keys generated successfully'
+            })
+        else:
+            self.pending_registrations.add(user_id)
+            self.socketio.start_background_task(
+                self._register_user_async,
+                current_app._get_current_object(),
+                client_id, user_id, username
+            )
+    
+    def _register_user_async(self, app, client_id, user_id, username):
+        """Generate keys for a new user off the request and notify the client"""
+        try:
+            # Same key size as pooled keys, however the pool is doing
+            key_size = self.key_pool.key_size if self.key_pool else app.config['RSA_KEY_SIZE']
+            private_key, public_key = self.cpu_executor.run(
+                self.key_manager.generate_key_pair, key_size
+            )
+            
+            with app.app_context():
+                public_key_str = self._create_user(user_id, username,
+                                                   private_key, public_key)
+            
+            self.socketio.emit('keys_generated', {
+                'status': STATUS['SUCCESS'],
+                'user_id': user_id,
+                'public_key': public_key_str,
+                'message': 'Keys generated successfully'
+            }, to=client_id)
+        except Exception as e:
+            self.socketio.emit('error', {
+                'message': f'Key generation failed: {e}'
+            }, to=client_id)
+        finally:
+            self.pending_registrations.discard(user_id)
+    
+    def _finish_send_multi(self, app, client_id, sender_id, recipient_ids,
+                           shared_package):
+        """Store an encrypted multi-recipient payload and notify everyone"""
+        # Runs as an executor callback: report failures to the sender
+        try:
+            batch_id = str(uuid.uuid4())
+            transfer_ids = {
+                recipient_id: str(uuid.uuid4()) for recipient_id in recipient_ids
+            }
+            encrypted_path = self.file_handler.save_shared_encrypted_file(
+                shared_package, batch_id, transfer_ids
+            )
+            self.cpu_executor.run(
+                self.store_merkle_tree, transfer_ids[recipient_ids[0]], sender_id
+            )
+        
+            # Create all transfer records in one transaction
+            file_name = shared_package['file_name']
+            file_size = os.path.getsize(encrypted_path)
+            with app.app_context():
+                db.session.add_all([
+                    FileTransfer(
+                        transfer_id=transfer_id,
+                        sender_id=sender_id,
+                        recipient_id=recipient_id,
+                        file_name=file_name,
+                        file_size=file_size,
+                        file_hash=shared_package['file_hash'],
+                        encrypted_file_path=encrypted_path,
+                        status=STATUS['PENDING']
+                    )
+                    for recipient_id, transfer_id in transfer_ids.items()
+                ])
+                db.session.commit()
+        
+            # Notify sender
+            self.socketio.emit('file_sent', {
+                'status': STATUS['SUCCESS'],
+                'batch_id': batch_id,
+                'transfer_ids': transfer_ids,
+                'message': 'File sent successfully'
+            }, to=client_id)
+        
+            # Notify recipients
+            timestamp = datetime.now().isoformat()
+            for recipient_id, transfer_id in transfer_ids.items():
+                self.socketio.emit('file_received', {
+                    'transfer_id': transfer_id,
+                    'sender_id': sender_id,
+                    'file_name': file_name,
+                    'timestamp': timestamp
+                }, room=recipient_id)
+        except Exception as e:
+            logger.exception("Failed to store multi-recipient send from %s", sender_id)
+            with app.app_context():
+                db.session.rollback()
+            self.socketio.emit('error', {
+                'message': f'Send failed: {e}'
+            }, to=client_id)
+    
+    def _finish_send(self, transfer_id, sender_id, recipient_id, encrypted_path,
+                     encrypted_package):
+        """Record a stored package and notify sender and recipient"""
+        # Before file_received, so the recipient can fetch the tree right away
+        self.cpu_executor.run(self.store_merkle_tree, transfer_id, sender_id)
+        
+        # Create transfer record
+        transfer = FileTransfer(
+            transfer_id=transfer_id,
+            sender_id=sender_id,
+            recipient_id=recipient_id,
+            file_name=encrypted_package.get('file_name', 'unknown'),
+            file_size=os.path.getsize(encrypted_path),
+            file_hash=encrypted_package.get('file_hash', ''),
+            encrypted_file_path=encrypted_path,
+            status=STATUS['PENDING']
+        )
+        
+        db.session.add(transfer)
+        db.session.commit()
+        
+        # Notify sender
+        emit('file_sent', {
+            'status': STATUS['SUCCESS'],
+            'transfer_id': transfer_id,
+            'message': 'File sent successfully'
+        })
+        
+        # Notify recipient if online
+        self.socketio.emit('file_received', {
+            'transfer_id': transfer_id,
+            'sender_id': sender_id,
+            'file_name': encrypted_package.get('file_name'),
+            'timestamp': datetime.now().isoformat()
+        }, room=recipient_id)
+    
+    def _chunked_transfer(self, data):
+        """Get the state of a chunked transfer owned by the calling client"""
+        transfer_id = (data or {}).get('transfer_id')
+        state = self.chunked_transfers.get(transfer_id)
+        if not state or state['client_id'] != request.sid:
+            emit('error', {
+                'transfer_id': transfer_id,
+                'message': 'Unknown transfer'
+            })
+            return None
+        return state
+    
+    def store_merkle_tree(self, transfer_id, sender_id) -> bool:
+        """
+        Store per-chunk hashes of a saved package so the recipient can
+        verify chunks and re-fetch only corrupt ranges
+        
+        The transfer works without a tree, so failures are only logged.
+        
+        Returns:
+            True if the tree was stored
+        """
+        try:
+            merkle_tree = self.file_handler.build_merkle_tree(transfer_id)
+            if merkle_tree is None:
+                logger.warning("No package to build a Merkle tree for transfer %s",
+                               transfer_id)
+                return False
+            
+            sender_private_key = self.key_manager.load_private_key(sender_id) \
+                if sender_id else None
+            if sender_private_key:
+                self.crypto_utils.sign_merkle_tree(merkle_tree, sender_private_key)
+            self.file_handler.save_merkle_tree(merkle_tree, transfer_id)
+            return True
+        except Exception:
+            logger.exception("Failed to store the Merkle tree of transfer %s", transfer_id)
+            return False
+    
+    def start_presence_updates(self, interval: float = 1.0):
+        """
+        Push collected presence changes to subscribed clients every
+        interval seconds (one presence_diff per interval at most)
+        """
+        def push_diffs():
+            while True:
+                self.socketio.sleep(interval)
+                diff = self.presence.take_diff()
+                if diff:
+                    self.socketio.emit('presence_diff', diff, room=PRESENCE_ROOM)
+        
+        self.socketio.start_background_task(push_diffs)
+    
     def register_handlers(self):
         """Register all socket event handlers"""
         
@@ -32,10 +278,7 @@ class SocketEventHandlers:
         def handle_connect():
             """Handle client connection"""
             client_id = request.sid
-            self.active_connections[client_id] = {
-                'connected_at': datetime.now(),
-                'user_id': None
-            }
+            self.state_store.set_connection(client_id)
             
             emit('connected', {
                 'status': STATUS['SUCCESS'],
@@ -49,8 +292,15 @@ class SocketEventHandlers:
         def handle_disconnect():
             """Handle client disconnection"""
             client_id = request.sid
-            if client_id in self.active_connections:
-                del self.active_connections[client_id]
+            user_id = self.state_store.delete_connection(client_id)
+            if user_id:
+                self.presence.remove(user_id, client_id)
+            
+            # Drop chunked transfers the client did not finish
+            for transfer_id, state in list(self.chunked_transfers.items()):
+                if state['client_id'] == client_id:
+                    del self.chunked_transfers[transfer_id]
+                    self.file_handler.abort_encrypted_upload(transfer_id)
             
             print(f"Client disconnected: {client_id}")
         
@@ -68,42 +318,23 @@ class SocketEventHandlers:
                 return
             
             # Update connection info
-            self.active_connections[client_id]['user_id'] = user_id
+            previous_user_id = self.state_store.get_connection(client_id)
+            if previous_user_id and previous_user_id != user_id:
+                self.presence.remove(previous_user_id, client_id)
+            self.state_store.set_connection(client_id, user_id)
             
             # Check if user exists
             user = User.query.filter_by(user_id=user_id).first()
+            self.presence.add(
+                user_id, client_id,
+                user.username if user else username,
+                bool(user and user.public_key)
+            )
             
             if not user:
-                # Create new user
-                user = User(user_id=user_id, username=username)
-                
-                # Generate key pair
-                private_key, public_key = self.key_manager.generate_key_pair()
-                
-                # Save keys
-                self.key_manager.save_key_pair(user_id, private_key, public_key)
-                
-                # Save public key to registry
-                public_key_str = public_key.decode('utf-8')
-                user.public_key = public_key_str
-                
-                # Create registry entry
-                registry = PublicKeyRegistry(
-                    user_id=user_id,
-                    public_key=public_key_str,
-                    fingerprint=self.crypto_utils.hash_file(public_key)[:16]
-                )
-                
-                db.session.add(user)
-                db.session.add(registry)
-                db.session.commit()
-                
-                emit('keys_generated', {
-                    'status': STATUS['SUCCESS'],
-                    'user_id': user_id,
-                    'public_key': public_key_str,
-                    'message': 'Keys generated successfully'
-                })
+                # Skip if keys are already being generated for this user
+                if user_id not in self.pending_registrations:
+                    self._start_registration(client_id, user_id, username)
             else:
                 # Update last active
                 user.last_active = datetime.utcnow()
@@ -152,7 +383,7 @@ class SocketEventHandlers:
         def handle_send_file(data):
             """Handle file sending"""
             client_id = request.sid
-            sender_id = self.active_connections[client_id].get('user_id')
+            sender_id = self.state_store.get_connection(client_id)
             
             if not sender_id:
                 emit('error', {
@@ -178,41 +409,221 @@ class SocketEventHandlers:
                 encrypted_package, transfer_id
             )
             
-            # Create transfer record
-            transfer = FileTransfer(
-                transfer_id=transfer_id,
-                sender_id=sender_id,
-                recipient_id=recipient_id,
-                file_name=encrypted_package.get('file_name', 'unknown'),
-                file_size=len(json.dumps(encrypted_package)),
-                file_hash=encrypted_package.get('file_hash', ''),
-                encrypted_file_path=encrypted_path,
-                status=STATUS['PENDING']
-            )
+            self._finish_send(transfer_id, sender_id, recipient_id,
+                              encrypted_path, encrypted_package)
+        
+        @self.socketio.on('transfer_start')
+        def handle_transfer_start(data):
+            """
+            Start a chunked transfer
+            
+            The package is sent without its ciphertext; the raw ciphertext
+            follows as binary transfer_chunk events. Errors echo the
+            client's request_id so it can tell them from unrelated ones.
+            """
+            client_id = request.sid
+            sender_id = self.state_store.get_connection(client_id)
+            request_id = data.get('request_id')
             
-            db.session.add(transfer)
-            db.session.commit()
+            if not sender_id:
+                emit('error', {
+                    'request_id': request_id,
+                    'message': 'User not registered'
+                })
+                return
             
-            # Notify sender
-            emit('file_sent', {
-                'status': STATUS['SUCCESS'],
+            recipient_id = data.get('recipient_id')
+            encrypted_package = data.get('package')
+            total_size = data.get('total_size')
+            
+            if not recipient_id or not encrypted_package or \
+                    not isinstance(total_size, int) or total_size <= 0:
+                emit('error', {
+                    'request_id': request_id,
+                    'message': 'Missing required data'
+                })
+                return
+            
+            is_valid, message = self.file_handler.validate_file_size(total_size)
+            if not is_valid:
+                emit('error', {
+                    'request_id': request_id,
+                    'message': message
+                })
+                return
+            
+            transfer_id = str(uuid.uuid4())
+            try:
+                header_size = self.file_handler.begin_encrypted_upload(
+                    encrypted_package, transfer_id, total_size
+                )
+            except ValueError as e:
+                emit('error', {
+                    'request_id': request_id,
+                    'message': str(e)
+                })
+                return
+            
+            self.chunked_transfers[transfer_id] = {
+                'client_id': client_id,
+                'sender_id': sender_id,
+                'recipient_id': recipient_id,
+                'package': encrypted_package,
+                'total_size': total_size,
+                'header_size': header_size,
+                'chunks': {},  # chunk index -> bytes written
+                'next_index': 0,  # first chunk not received yet
+                'received': 0
+            }
+            
+            emit('transfer_ready', {
+                'request_id': request_id,
                 'transfer_id': transfer_id,
-                'message': 'File sent successfully'
+                'chunk_size': SOCKET_CHUNK_SIZE,
+                'window': SOCKET_CHUNK_WINDOW
             })
+        
+        @self.socketio.on('transfer_chunk')
+        def handle_transfer_chunk(data):
+            """
+            Write one binary chunk to disk and acknowledge it
+            
+            Chunks may be handled out of order, so each one carries its
+            offset. Every chunk but the last must be exactly chunk_size
+            bytes, and only chunks below next_index + window (next_index
+            being the first chunk not received yet, sent with each ack)
+            are accepted. A chunk sent again replaces the earlier copy.
+            """
+            state = self._chunked_transfer(data)
+            if not state:
+                return
+            
+            transfer_id = data['transfer_id']
+            offset = data.get('offset')
+            chunk = data.get('data')
+            if not isinstance(offset, int) or not isinstance(chunk, bytes) or \
+                    offset < 0 or offset % SOCKET_CHUNK_SIZE or \
+                    offset >= state['total_size'] or \
+                    len(chunk) != min(SOCKET_CHUNK_SIZE, state['total_size'] - offset):
+                emit('error', {
+                    'transfer_id': transfer_id,
+                    'message': 'Invalid chunk'
+                })
+                return
             
-            # Notify recipient if online
-            self.socketio.emit('file_received', {
+            index = offset // SOCKET_CHUNK_SIZE
+            if index >= state['next_index'] + SOCKET_CHUNK_WINDOW:
+                emit('error', {
+                    'transfer_id': transfer_id,
+                    'message': 'Chunk outside the acknowledgement window'
+                })
+                return
+            
+            self.file_handler.write_encrypted_chunk(
+                transfer_id, state['header_size'] + offset, chunk
+            )
+            
+            state['received'] += len(chunk) - state['chunks'].get(index, 0)
+            state['chunks'][index] = len(chunk)
+            while state['next_index'] in state['chunks']:
+                state['next_index'] += 1
+            
+            emit('transfer_ack', {
                 'transfer_id': transfer_id,
-                'sender_id': sender_id,
-                'file_name': encrypted_package.get('file_name'),
-                'timestamp': datetime.now().isoformat()
-            }, room=recipient_id)
+                'offset': offset,
+                'next_index': state['next_index'],
+                'received': state['received']
+            })
+            emit(SOCKET_EVENTS['file_transfer_progress'], {
+                'transfer_id': transfer_id,
+                'received': state['received'],
+                'total_size': state['total_size'],
+                'progress': round(state['received'] * 100 / state['total_size'], 1)
+            })
+        
+        @self.socketio.on('transfer_commit')
+        def handle_transfer_commit(data):
+            """Finish a chunked transfer once every chunk has arrived"""
+            state = self._chunked_transfer(data)
+            if not state:
+                return
+            
+            transfer_id = data['transfer_id']
+            if state['received'] != state['total_size']:
+                emit('error', {
+                    'transfer_id': transfer_id,
+                    'message': 'Transfer is incomplete'
+                })
+                return
+            
+            del self.chunked_transfers[transfer_id]
+            encrypted_path = self.file_handler.commit_encrypted_upload(transfer_id)
+            
+            self._finish_send(transfer_id, state['sender_id'], state['recipient_id'],
+                              encrypted_path, state['package'])
+        
+        @self.socketio.on('send_file_multi')
+        def handle_send_file_multi(data):
+            """Encrypt an uploaded file once and send it to several recipients"""
+            client_id = request.sid
+            sender_id = self.state_store.get_connection(client_id)
+            
+            if not sender_id:
+                emit('error', {
+                    'message': 'User not registered'
+                })
+                return
+            
+            # Extract data (drop duplicate recipients, keep order)
+            recipient_ids = list(dict.fromkeys(data.get('recipient_ids') or []))
+            file_path = data.get('file_path')
+            
+            if not recipient_ids or not file_path:
+                emit('error', {
+                    'message': 'Missing required data'
+                })
+                return
+            
+            # Security check - only files from the upload folder can be sent
+            full_path = os.path.abspath(file_path)
+            upload_dir = os.path.abspath(self.file_handler.upload_folder)
+            
+            if not (full_path.startswith(upload_dir + os.sep)
+                    and os.path.isfile(full_path) and os.path.getsize(full_path)):
+                emit('error', {
+                    'message': 'File not found'
+                })
+                return
+            
+            def prepare():
+                # The mapped file is only valid inside the with block
+                with self.file_handler.open_file_buffer(full_path) as file_data:
+                    return self.secure_transfer.prepare_file_for_recipients(
+                        file_data, os.path.basename(full_path), sender_id, recipient_ids
+                    )
+            
+            # Encrypt once, wrap the key per recipient (off the event loop)
+            app = current_app._get_current_object()
+            self.cpu_executor.submit(
+                prepare,
+                callback=lambda shared_package: self._finish_send_multi(
+                    app, client_id, sender_id, recipient_ids, shared_package
+                ),
+                errback=lambda e: self.socketio.emit('error', {
+                    'message': str(e)
+                }, to=client_id)
+            )
         
         @self.socketio.on('download_file')
         def handle_download_file(data):
-            """Handle file download request"""
+            """
+            Handle file download request
+            
+            Replies with a short-lived signed URL; the package itself is
+            streamed over HTTP so the socket stays free for control events
+            """
             client_id = request.sid
-            user_id = self.active_connections[client_id].get('user_id')
+            user_id = self.state_store.get_connection(client_id)
             transfer_id = data.get('transfer_id')
             
             if not user_id or not transfer_id:
@@ -233,21 +644,20 @@ class SocketEventHandlers:
                 })
                 return
             
-            # Load encrypted package
-            encrypted_package = self.file_handler.load_encrypted_file(transfer_id)
-            
-            if not encrypted_package:
+            if not self.file_handler.get_encrypted_path(transfer_id):
                 emit('error', {
                     'message': 'Encrypted file not found'
                 })
                 return
             
-            # Send encrypted package to recipient
+            signer = self.download_signer or DownloadSigner(current_app.config['SECRET_KEY'])
             emit('file_download_response', {
                 'status': STATUS['SUCCESS'],
                 'transfer_id': transfer_id,
-                'encrypted_package': encrypted_package,
-                'sender_id': transfer.sender_id
+                'sender_id': transfer.sender_id,
+                'download_url': url_for('download_package_json', transfer_id=transfer_id,
+                                        token=signer.sign(transfer_id, user_id)),
+                'expires_in': signer.ttl
             })
         
         @self.socketio.on('report_decryption_result')
@@ -282,10 +692,18 @@ class SocketEventHandlers:
                 }, room=transfer.sender_id)
         
         @self.socketio.on('get_transfer_history')
-        def handle_get_transfer_history(data):
-            """Get transfer history for user"""
+        def handle_get_transfer_history(data=None):
+            """
+            Get transfer history for user
+            
+            Optional data: direction ('sent'/'received', default both),
+            status (string or list), before/since (cursors from a previous
+            response; only with a direction, since cursors of one direction
+            don't fit the other), cursors ({direction: {before/since}} to
+            page both directions at once) and limit
+            """
             client_id = request.sid
-            user_id = self.active_connections[client_id].get('user_id')
+            user_id = self.state_store.get_connection(client_id)
             
             if not user_id:
                 emit('error', {
@@ -293,39 +711,93 @@ class SocketEventHandlers:
                 })
                 return
             
-            # Get sent transfers
-            sent_transfers = FileTransfer.query.filter_by(
-                sender_id=user_id
-            ).order_by(FileTransfer.created_at.desc()).limit(50).all()
+            data = data or {}
+            direction = data.get('direction')
+            directions = [direction] if direction else list(HISTORY_DIRECTIONS)
+            statuses = data.get('status')
+            if isinstance(statuses, str):
+                statuses = [statuses]
             
-            # Get received transfers
-            received_transfers = FileTransfer.query.filter_by(
-                recipient_id=user_id
-            ).order_by(FileTransfer.created_at.desc()).limit(50).all()
+            if not direction and (data.get('before') or data.get('since')):
+                emit('error', {
+                    'message': 'Invalid history request: before/since need a direction '
+                               '(use cursors to page both directions)'
+                })
+                return
+            cursors = data.get('cursors') or {}
+            
+            response = {'cursors': {}}
+            try:
+                if not isinstance(cursors, dict):
+                    raise ValueError("cursors must be an object")
+                limit = min(max(int(data.get('limit', 50)), 1), 200)
+                for direction in directions:
+                    cursor = cursors.get(direction) or {}
+                    if not isinstance(cursor, dict):
+                        raise ValueError(f"cursors.{direction} must be an object")
+                    before = data.get('before') or cursor.get('before')
+                    since = data.get('since') or cursor.get('since')
+                    transfers = query_transfer_history(
+                        user_id, direction, statuses=statuses,
+                        before=before, since=since, limit=limit
+                    )
+                    response[direction] = [t.to_dict() for t in transfers]
+                    full = len(transfers) == limit
+                    response['cursors'][direction] = {
+                        # Older page (a since page is already the oldest new one)
+                        'before': encode_cursor(transfers[-1]) if full and not since else None,
+                        # Newer transfers from here; after a full since page
+                        # there are more right away
+                        'since': encode_cursor(transfers[0]) if transfers else since,
+                        'more': full
+                    }
+            except ValueError as e:
+                emit('error', {
+                    'message': f'Invalid history request: {str(e)}'
+                })
+                return
             
-            emit('transfer_history_response', {
-                'sent': [t.to_dict() for t in sent_transfers],
-                'received': [t.to_dict() for t in received_transfers]
-            })
+            emit('transfer_history_response', response)
         
         @self.socketio.on('get_online_users')
         def handle_get_online_users():
             """Get list of online users"""
-            online_users = []
-            
-            for conn_id, conn_info in self.active_connections.items():
-                if conn_info['user_id']:
-                    user = User.query.filter_by(
-                        user_id=conn_info['user_id']
-                    ).first()
-                    
-                    if user:
-                        online_users.append({
-                            'user_id': user.user_id,
-                            'username': user.username,
-                            'has_public_key': bool(user.public_key)
-                        })
+            snapshot = self.presence.snapshot()
+            
+            # Fill in the current profiles with one query
+            users = {
+                user.user_id: user for user in User.query.filter(
+                    User.user_id.in_([u['user_id'] for u in snapshot['users']])
+                )
+            } if snapshot['users'] else {}
+            
+            online_users = [
+                {
+                    'user_id': user.user_id,
+                    'username': user.username,
+                    'has_public_key': bool(user.public_key)
+                }
+                for user in (users.get(u['user_id']) for u in snapshot['users'])
+                if user
+            ]
             
             emit('online_users_response', {
-                'users': online_users
-            })
\ No newline at end of file
+                'users': online_users,
+                'version': snapshot['version']
+            })
+        
+        @self.socketio.on('subscribe_presence')
+        def handle_subscribe_presence():
+            """
+            Subscribe to presence_diff pushes and get the current list
+            
+            Diffs carry consecutive versions; a client that sees a gap
+            should request the full list again.
+            """
+            join_room(PRESENCE_ROOM)
+            handle_get_online_users()
+        
+        @self.socketio.on('unsubscribe_presence')
+        def handle_unsubscribe_presence():
+            """Stop presence_diff pushes"""
+            leave_room(PRESENCE_ROOM)
\ No newline at end of file
@@ -0,0 +1,258 @@
+# server/state_store.py
+"""
+Connection and presence state shared by Socket.IO workers
+MemoryStateStore keeps it in the process (one worker); RedisStateStore
+lets every worker behind the load balancer see the same online users
+"""
+
+import json
+import threading
+from typing import Optional, Dict, List
+
+
+class MemoryStateStore:
+    """Connection and presence state of a single process"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}  # client_id -> user_id ('' until registered)
+        self._user_connections = {}  # user_id -> set of client IDs
+        self._profiles = {}  # user_id -> profile dict
+        self._version = 0
+    
+    def set_connection(self, client_id: str, user_id: Optional[str] = None):
+        """Record a connection and the user registered on it"""
+        with self._lock:
+            self._connections[client_id] = user_id or ''
+    
+    def get_connection(self, client_id: str) -> Optional[str]:
+        """Get the user registered on a connection, or None"""
+        with self._lock:
+            return self._connections.get(client_id) or None
+    
+    def delete_connection(self, client_id: str) -> Optional[str]:
+        """Forget a connection; returns the user registered on it"""
+        with self._lock:
+            return self._connections.pop(client_id, None) or None
+    
+    def connection_count(self) -> int:
+        """Number of open connections"""
+        with self._lock:
+            return len(self._connections)
+    
+    def add_presence(self, user_id: str, client_id: str, profile: Dict) -> bool:
+        """
+        Attach a connection to a user
+        
+        Returns:
+            True if it is the user's first connection (user came online)
+        """
+        with self._lock:
+            connections = self._user_connections.setdefault(user_id, set())
+            connections.add(client_id)
+            if len(connections) == 1:
+                self._profiles[user_id] = dict(profile)
+                return True
+            return False
+    
+    def remove_presence(self, user_id: str, client_id: str) -> bool:
+        """
+        Detach a connection from a user
+        
+        Returns:
+            True if it was the user's last connection (user went offline)
+        """
+        with self._lock:
+            connections = self._user_connections.get(user_id)
+            if not connections or client_id not in connections:
+                return False
+            connections.discard(client_id)
+            if not connections:
+                del self._user_connections[user_id]
+                self._profiles.pop(user_id, None)
+                return True
+            return False
+    
+    def update_profile(self, user_id: str, fields: Dict) -> Optional[Dict]:
+        """Change the profile of an online user; returns it or None if offline"""
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is None:
+                return None
+            profile.update(fields)
+            return dict(profile)
+    
+    def profiles(self) -> List[Dict]:
+        """Profiles of all online users"""
+        with self._lock:
+            return [dict(profile) for profile in self._profiles.values()]
+    
+    def version(self) -> int:
+        """Current presence version"""
+        with self._lock:
+            return self._version
+    
+    def next_version(self) -> int:
+        """Increment and get the presence version"""
+        with self._lock:
+            self._version += 1
+            return self._version
+    
+    def clear(self):
+        """Drop all state"""
+        with self._lock:
+            self._connections.clear()
+            self._user_connections.clear()
+            self._profiles.clear()
+
+
+class RedisStateStore:
+    """Connection and presence state in Redis, shared by all workers"""
+    
+    # Add a connection and store the profile if it is the first one
+    _ADD_SCRIPT = """
+    redis.call('SADD', KEYS[1], ARGV[1])
+    if redis.call('SCARD', KEYS[1]) == 1 then
+        redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+        return 1
+    end
+    return 0
+    """
+    
+    # Remove a connection and the profile if it was the last one
+    _REMOVE_SCRIPT = """
+    if redis.call('SREM', KEYS[1], ARGV[1]) == 1 and redis.call('SCARD', KEYS[1]) == 0 then
+        redis.call('HDEL', KEYS[2], ARGV[2])
+        return 1
+    end
+    return 0
+    """
+    
+    def __init__(self, url: str, prefix: str = 'sftc:'):
+        """
+        Initialize Redis State Store
+        
+        Args:
+            url: redis:// URL
+            prefix: Key prefix (to share a Redis with other deployments)
+        
+        Raises:
+            ImportError: If the redis package is not installed
+        """
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("RedisStateStore requires the 'redis' package")
+        
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._connections_key = prefix + 'connections'
+        self._profiles_key = prefix + 'profiles'
+        self._version_key = prefix + 'presence_version'
+        self._add = self._redis.register_script(self._ADD_SCRIPT)
+        self._remove = self._redis.register_script(self._REMOVE_SCRIPT)
+    
+    def _presence_key(self, user_id: str) -> str:
+        return f"{self.prefix}presence:{user_id}"
+    
+    def set_connection(self, client_id: str, user_id: Optional[str] = None):
+        """Record a connection and the user registered on it"""
+        self._redis.hset(self._connections_key, client_id, user_id or '')
+    
+    def get_connection(self, client_id: str) -> Optional[str]:
+        """Get the user registered on a connection, or None"""
+        return self._redis.hget(self._connections_key, client_id) or None
+    
+    def delete_connection(self, client_id: str) -> Optional[str]:
+        """Forget a connection; returns the user registered on it"""
+        pipe = self._redis.pipeline()
+        pipe.hget(self._connections_key, client_id)
+        pipe.hdel(self._connections_key, client_id)
+        user_id, _ = pipe.execute()
+        return user_id or None
+    
+    def connection_count(self) -> int:
+        """Number of open connections"""
+        return self._redis.hlen(self._connections_key)
+    
+    def add_presence(self, user_id: str, client_id: str, profile: Dict) -> bool:
+        """
+        Attach a connection to a user
+        
+        Returns:
+            True if it is the user's first connection (user came online)
+        """
+        return bool(self._add(
+            keys=[self._presence_key(user_id), self._profiles_key],
+            args=[client_id, user_id, json.dumps(profile)]
+        ))
+    
+    def remove_presence(self, user_id: str, client_id: str) -> bool:
+        """
+        Detach a connection from a user
+        
+        Returns:
+            True if it was the user's last connection (user went offline)
+        """
+        return bool(self._remove(
+            keys=[self._presence_key(user_id), self._profiles_key],
+            args=[client_id, user_id]
+        ))
+    
+    def update_profile(self, user_id: str, fields: Dict) -> Optional[Dict]:
+        """Change the profile of an online user; returns it or None if offline"""
+        stored = self._redis.hget(self._profiles_key, user_id)
+        if stored is None:
+            return None
+        profile = json.loads(stored)
+        profile.update(fields)
+        self._redis.hset(self._profiles_key, user_id, json.dumps(profile))
+        return profile
+    
+    def profiles(self) -> List[Dict]:
+        """Profiles of all online users"""
+        return [json.loads(profile) for profile in self._redis.hvals(self._profiles_key)]
+    
+    def version(self) -> int:
+        """Current presence version"""
+        return int(self._redis.get(self._version_key) or 0)
+    
+    def next_version(self) -> int:
+        """Increment and get the presence version"""
+        return self._redis.incr(self._version_key)
+    
+    def clear(self):
+        """
+        Drop all connection and presence state (after a full restart, when
+        no worker holds connections any more)
+        """
+        keys = list(self._redis.scan_iter(self._presence_key('*')))
+        keys += [self._connections_key, self._profiles_key]
+        self._redis.delete(*keys)
+
+
+# Stores shared by the servers of one process, by local:// URL
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+
+def create_state_store(url: str = ''):
+    """
+    Create the state store for a URL
+    
+    Args:
+        url: '' for a store of this server only, local://<name> for a
+             store shared by the servers in this process (the
+             LocalPubSubManager counterpart), or a redis:// URL
+    
+    Returns:
+        MemoryStateStore or RedisStateStore
+    """
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStateStore(url)
+    if url.startswith('local://'):
+        with _local_stores_lock:
+            return _local_stores.setdefault(url, MemoryStateStore())
+    if url:
+        raise ValueError(f"Unsupported state store URL: {url}")
+    return MemoryStateStore()
@@ -0,0 +1,84 @@
+# server/transfer_history.py
+"""
+Keyset pagination of transfer history
+Pages are addressed by a cursor (created_at, id) of the last row seen
+instead of an offset, so every page is one range scan of the
+(sender_id|recipient_id, created_at, id) index however deep it is
+"""
+
+from datetime import datetime
+from typing import Optional, List, Tuple, Iterable
+from shared.models import FileTransfer
+
+DIRECTIONS = ('sent', 'received')
+
+
+def encode_cursor(transfer: FileTransfer) -> str:
+    """Get the cursor of a transfer row"""
+    return f"{transfer.created_at.isoformat()}_{transfer.id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Parse a cursor made by encode_cursor
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    created_at, _, row_id = str(cursor).rpartition('_')
+    return datetime.fromisoformat(created_at), int(row_id)
+
+
+def query_transfer_history(user_id: str, direction: str,
+                           statuses: Optional[Iterable[str]] = None,
+                           before: Optional[str] = None,
+                           since: Optional[str] = None,
+                           limit: int = 50) -> List[FileTransfer]:
+    """
+    Get one page of a user's transfers, newest first
+    
+    Args:
+        user_id: User whose history is read
+        direction: 'sent' or 'received'
+        statuses: Only transfers with one of these statuses
+        before: Cursor; only transfers older than it (next page)
+        since: Cursor; only transfers newer than it (new items). The page
+               holds the oldest new transfers, so repeating with the
+               newest returned cursor catches up without gaps
+        limit: Maximum number of transfers
+    
+    Returns:
+        List of FileTransfer rows
+    
+    Raises:
+        ValueError: If direction or a cursor is invalid
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Invalid direction: {direction}")
+    
+    column = FileTransfer.sender_id if direction == 'sent' else FileTransfer.recipient_id
+    query = FileTransfer.query.filter(column == user_id)
+    if statuses:
+        query = query.filter(FileTransfer.status.in_(list(statuses)))
+    
+    # created_at <= x AND (created_at < x OR id < y): the first term is the
+    # index range, the second drops the rows of the cursor's timestamp
+    # that were already returned
+    if before:
+        created_at, row_id = decode_cursor(before)
+        query = query.filter(
+            FileTransfer.created_at <= created_at,
+            (FileTransfer.created_at < created_at) | (FileTransfer.id < row_id)
+        )
+    if since:
+        created_at, row_id = decode_cursor(since)
+        query = query.filter(
+            FileTransfer.created_at >= created_at,
+            (FileTransfer.created_at > created_at) | (FileTransfer.id > row_id)
+        )
+        rows = query.order_by(FileTransfer.created_at.asc(),
+                              FileTransfer.id.asc()).limit(limit).all()
+        return rows[::-1]
+    
+    return query.order_by(FileTransfer.created_at.desc(),
+                          FileTransfer.id.desc()).limit(limit).all()
@@ -11,6 +11,13 @@ RSA_PUBLIC_EXPONENT = 65537
 CHUNK_SIZE = 1024 * 1024  # 1MB chunks for large files
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 
+# Chunked socket transfers: bytes per binary chunk and unacknowledged chunks in flight
+SOCKET_CHUNK_SIZE = 256 * 1024
+SOCKET_CHUNK_WINDOW = 8
+
+# Maximum user IDs per batch public key lookup
+MAX_BATCH_KEY_LOOKUP = 500
+
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {
     'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 
@@ -21,6 +28,33 @@ ALLOWED_EXTENSIONS = {
 HASH_ALGORITHM = 'SHA-256'
 ENCODING = 'utf-8'
 
+# Package ciphers (packages without a 'cipher' field are AES-256-CBC)
+CIPHER_AES_CBC = 'AES-256-CBC'
+CIPHER_AES_GCM_FRAMES = 'AES-256-GCM-FRAMES'
+
+# Compression before encryption (recorded in the package 'compression' field)
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_LEVEL = 6
+COMPRESSION_MIN_SIZE = 1024  # smaller files are sent as is
+COMPRESSION_MAX_ENTROPY = 7.5  # bits per byte in the sample; above this data is already compressed
+COMPRESSION_SAMPLE_SIZE = 16 * 1024  # bytes taken from start, middle and end
+INCOMPRESSIBLE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'docx'}
+
+# Streaming encryption (chunked AES-GCM frames)
+STREAM_MAGIC = b'SFTS'
+STREAM_VERSION = 1
+STREAM_NONCE_PREFIX_SIZE = 8  # + 4-byte frame counter = 96-bit GCM nonce
+GCM_TAG_SIZE = 16
+
+# Binary transfer container (replaces encrypted_package.json)
+CONTAINER_MAGIC = b'SFTC'
+CONTAINER_VERSION = 1
+CONTAINER_FILENAME = 'encrypted_package.bin'
+LEGACY_PACKAGE_FILENAME = 'encrypted_package.json'
+MERKLE_TREE_FILENAME = 'merkle_tree.json'
+KEY_ENVELOPE_FILENAME = 'key_envelope.json'
+SESSION_LOCK_FILENAME = '.lock'  # flock'd while an upload session changes
+
 # WebSocket Events
 SOCKET_EVENTS = {
     'connect': 'connect',
@@ -40,6 +40,10 @@ class User(db.Model):
 class FileTransfer(db.Model):
     """File transfer history"""
     __tablename__ = 'file_transfers'
+    __table_args__ = (
+        db.Index('ix_file_transfers_sender_created', 'sender_id', 'created_at', 'id'),
+        db.Index('ix_file_transfers_recipient_created', 'recipient_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     transfer_id = db.Column(db.String(100), unique=True, nullable=False)
@@ -97,4 +101,34 @@ class PublicKeyRegistry(db.Model):
             'fingerprint': self.fingerprint,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+
+class UploadedFile(db.Model):
+    """Uploaded file (replaces the per-upload metadata.json)"""
+    __tablename__ = 'uploaded_files'
+    __table_args__ = (
+        db.Index('ix_uploaded_files_user_created', 'user_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.String(36), unique=True, nullable=False)
+    user_id = db.Column(db.String(100), nullable=False)
+    
+    original_name = db.Column(db.String(255), nullable=False)
+    safe_name = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    file_hash = db.Column(db.String(64), nullable=True, index=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'file_id': self.file_id,
+            'user_id': self.user_id,
+            'original_name': self.original_name,
+            'safe_name': self.safe_name,
+            'file_size': self.file_size,
+            'file_hash': self.file_hash,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
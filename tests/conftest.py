@@ -0,0 +1,33 @@
+# tests/conftest.py
+"""Shared test fixtures"""
+
+import pytest
+from Crypto.PublicKey import RSA
+from flask import Flask
+from shared.models import db
+from server.file_handler import FileHandler
+
+
+@pytest.fixture(scope='session')
+def rsa_key():
+    """RSA key pair used as both sender and recipient"""
+    return RSA.generate(2048)
+
+
+@pytest.fixture
+def app():
+    """Flask app with an empty in-memory database, inside an app context"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def file_handler(app, tmp_path):
+    """FileHandler storing under a temporary directory"""
+    return FileHandler(str(tmp_path / 'uploads'))
@@ -0,0 +1,75 @@
+# tests/test_app.py
+"""Tests for the HTTP API in server.app"""
+
+import pytest
+from server.app import create_app
+from server.config import config, TestingConfig
+from server.key_manager import KeyManager
+
+
+@pytest.fixture
+def server_app(tmp_path, monkeypatch):
+    """App from create_app storing under a temporary directory"""
+    class TmpConfig(TestingConfig):
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        SERVER_KEYS_DIR = str(tmp_path / 'keys')
+        KEY_POOL_SIZE = 0
+        UPLOAD_SESSION_SWEEP_INTERVAL = 0
+        EXPIRY_SWEEP_INTERVAL = 0
+        LOOP_LAG_INTERVAL = 0
+    
+    monkeypatch.setitem(config, 'tmp', TmpConfig)
+    app, _ = create_app('tmp')
+    return app
+
+
+def add_user(app, user_id: str, rsa_key):
+    with app.app_context():
+        key_manager = KeyManager(app.config['SERVER_KEYS_DIR'])
+        key_manager.save_key_pair(user_id, rsa_key.export_key(),
+                                  rsa_key.publickey().export_key())
+
+
+# Public key ETags
+
+def test_public_keys_etag(server_app, rsa_key):
+    add_user(server_app, 'alice', rsa_key)
+    client = server_app.test_client()
+    
+    response = client.get('/api/public_keys')
+    etag = response.headers['ETag']
+    
+    assert response.status_code == 200
+    assert list(response.get_json()['keys']) == ['alice']
+    assert etag
+    
+    response = client.get('/api/public_keys', headers={'If-None-Match': etag})
+    
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.data == b''
+
+
+def test_public_keys_etag_changes_when_key_added(server_app, rsa_key):
+    add_user(server_app, 'alice', rsa_key)
+    client = server_app.test_client()
+    etag = client.get('/api/public_keys').headers['ETag']
+    
+    add_user(server_app, 'bob', rsa_key)
+    response = client.get('/api/public_keys', headers={'If-None-Match': etag})
+    
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert sorted(response.get_json()['keys']) == ['alice', 'bob']
+
+
+def test_public_keys_etag_covers_missing_ids(server_app, rsa_key):
+    client = server_app.test_client()
+    etag = client.get('/api/public_keys?user_ids=alice').headers['ETag']
+    
+    add_user(server_app, 'alice', rsa_key)
+    response = client.get('/api/public_keys?user_ids=alice',
+                          headers={'If-None-Match': etag})
+    
+    assert response.status_code == 200
+    assert list(response.get_json()['keys']) == ['alice']
@@ -0,0 +1,77 @@
+# tests/test_blob_store.py
+"""Tests for server.blob_store"""
+
+import os
+import hashlib
+import threading
+from server.blob_store import BlobStore
+
+
+def write_temp(store: BlobStore, data: bytes) -> str:
+    temp_path = store.temp_path()
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    return temp_path
+
+
+def test_ingest_deduplicates(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    data = os.urandom(1000)
+    file_hash = hashlib.sha256(data).hexdigest()
+    
+    assert not store.ingest(write_temp(store, data), file_hash, str(tmp_path / 'a'))
+    assert store.ingest(write_temp(store, data), file_hash, str(tmp_path / 'b'))
+    
+    assert store.refcount(file_hash) == 2
+    assert store.stats()['deduplicated'] == 1
+    assert os.listdir(store.temp_dir) == []
+
+
+def test_concurrent_ingests_of_same_content(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    data = os.urandom(1000)
+    file_hash = hashlib.sha256(data).hexdigest()
+    uploads = 8
+    temp_paths = [write_temp(store, data) for _ in range(uploads)]
+    targets = [str(tmp_path / f'upload{i}') for i in range(uploads)]
+    barrier = threading.Barrier(uploads)
+    results = []
+    
+    def ingest(temp_path, target):
+        barrier.wait()
+        results.append(store.ingest(temp_path, file_hash, target))
+    
+    threads = [threading.Thread(target=ingest, args=args)
+               for args in zip(temp_paths, targets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    # Exactly one upload stored the blob and every upload links that inode
+    assert sorted(results) == [False] + [True] * (uploads - 1)
+    assert store.refcount(file_hash) == uploads
+    for target in targets:
+        assert os.path.samefile(target, store.blob_path(file_hash))
+    
+    for target in targets[:-1]:
+        os.remove(target)
+        assert not store.release(file_hash)
+    os.remove(targets[-1])
+    assert store.release(file_hash)
+
+
+def test_release_keeps_referenced_blob(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    data = os.urandom(1000)
+    file_hash = hashlib.sha256(data).hexdigest()
+    store.ingest(write_temp(store, data), file_hash, str(tmp_path / 'a'))
+    
+    assert not store.release(file_hash)
+    os.remove(tmp_path / 'a')
+    assert store.release(file_hash)
+    assert not store.exists(file_hash)
+    
+    # Stored again after it was released
+    assert not store.ingest(write_temp(store, data), file_hash, str(tmp_path / 'b'))
+    assert store.refcount(file_hash) == 1
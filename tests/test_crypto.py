@@ -0,0 +1,376 @@
+# tests/test_crypto.py
+"""Tests for server.crypto_utils"""
+
+import io
+import os
+import json
+import base64
+import hashlib
+import pytest
+from server.crypto_utils import CryptoUtils, _STREAM_HEADER, _FRAME_HEADER
+from shared.constants import (
+    GCM_TAG_SIZE, STREAM_NONCE_PREFIX_SIZE, COMPRESSION_MIN_SIZE, COMPRESSION_ZLIB,
+    CIPHER_AES_CBC
+)
+
+STREAM_CHUNK = 1024
+
+
+def encrypt_stream(data: bytes, key, chunk_size: int = STREAM_CHUNK) -> bytes:
+    out = io.BytesIO()
+    CryptoUtils.encrypt_stream(io.BytesIO(data), out, key.publickey(), chunk_size)
+    return out.getvalue()
+
+
+def decrypt_stream(stream: bytes, key) -> bytes:
+    out = io.BytesIO()
+    CryptoUtils.decrypt_stream(io.BytesIO(stream), out, key)
+    return out.getvalue()
+
+
+def split_frames(stream: bytes, key):
+    """Split an encrypted stream into (prefix, list of frames)"""
+    prefix_size = _STREAM_HEADER.size + key.size_in_bytes() + STREAM_NONCE_PREFIX_SIZE
+    frames = []
+    position = prefix_size
+    while position < len(stream):
+        _, length = _FRAME_HEADER.unpack_from(stream, position)
+        end = position + _FRAME_HEADER.size + length + GCM_TAG_SIZE
+        frames.append(stream[position:end])
+        position = end
+    return stream[:prefix_size], frames
+
+
+# Hashed AES-CBC
+
+@pytest.mark.parametrize('size', [0, 1, 15, 16, 100, 1000])
+def test_hashed_round_trip(rsa_key, size):
+    data = os.urandom(size)
+    
+    encrypted, wrapped_key, iv, file_hash = CryptoUtils.encrypt_file_hashed(
+        data, rsa_key.publickey(), chunk_size=32
+    )
+    decrypted, decrypted_hash = CryptoUtils.decrypt_file_hashed(
+        encrypted, wrapped_key, iv, rsa_key, chunk_size=32
+    )
+    
+    assert type(decrypted) is bytes
+    assert decrypted == data
+    assert file_hash == decrypted_hash == hashlib.sha256(data).hexdigest()
+
+
+def test_hashed_rejects_bad_padding(rsa_key):
+    # A whole-block plaintext ends in a full block of 0x10 padding
+    encrypted, wrapped_key, iv, _ = CryptoUtils.encrypt_file_hashed(
+        os.urandom(64), rsa_key.publickey()
+    )
+    # Flipping a bit of the previous ciphertext block flips it in the padding
+    tampered = bytearray(encrypted)
+    tampered[-17] ^= 0x10
+    
+    with pytest.raises(ValueError):
+        CryptoUtils.decrypt_file_hashed(bytes(tampered), wrapped_key, iv, rsa_key)
+    with pytest.raises(ValueError):
+        CryptoUtils.decrypt_file_hashed(encrypted[:-1], wrapped_key, iv, rsa_key)
+
+
+def test_hashed_detects_hash_mismatch(rsa_key):
+    data = os.urandom(1000)
+    package = CryptoUtils.encrypt_and_sign(data, rsa_key, rsa_key.publickey())
+    encrypted = bytearray(base64.b64decode(package['encrypted_file']))
+    encrypted[0] ^= 0xff
+    package['encrypted_file'] = base64.b64encode(bytes(encrypted)).decode()
+    
+    decrypted, is_valid, _ = CryptoUtils.decrypt_and_verify(package, rsa_key,
+                                                            rsa_key.publickey())
+    
+    assert package['cipher'] == CIPHER_AES_CBC
+    assert not is_valid
+    assert decrypted != data
+    assert hashlib.sha256(decrypted).hexdigest() != package['file_hash']
+
+
+# Streaming encryption
+
+@pytest.mark.parametrize('size', [0, 1, STREAM_CHUNK - 1, STREAM_CHUNK,
+                                  3 * STREAM_CHUNK, 3 * STREAM_CHUNK + 7])
+def test_stream_round_trip(rsa_key, size):
+    data = os.urandom(size)
+    
+    stream = encrypt_stream(data, rsa_key)
+    
+    assert decrypt_stream(stream, rsa_key) == data
+
+
+def test_stream_hashes_plaintext_in_both_directions(rsa_key):
+    data = os.urandom(5 * STREAM_CHUNK + 3)
+    encrypt_hash, decrypt_hash = hashlib.sha256(), hashlib.sha256()
+    
+    out = io.BytesIO()
+    written = CryptoUtils.encrypt_stream(io.BytesIO(data), out, rsa_key.publickey(),
+                                         STREAM_CHUNK, hasher=encrypt_hash)
+    read = CryptoUtils.decrypt_stream(io.BytesIO(out.getvalue()), io.BytesIO(), rsa_key,
+                                      hasher=decrypt_hash)
+    
+    assert written == read == len(data)
+    assert encrypt_hash.hexdigest() == decrypt_hash.hexdigest() == \
+        hashlib.sha256(data).hexdigest()
+
+
+def test_stream_detects_modified_ciphertext(rsa_key):
+    prefix, frames = split_frames(encrypt_stream(os.urandom(3 * STREAM_CHUNK), rsa_key),
+                                  rsa_key)
+    frame = bytearray(frames[1])
+    frame[_FRAME_HEADER.size] ^= 1
+    frames[1] = bytes(frame)
+    
+    with pytest.raises(ValueError):
+        decrypt_stream(prefix + b''.join(frames), rsa_key)
+
+
+def test_stream_detects_reordered_frames(rsa_key):
+    prefix, frames = split_frames(encrypt_stream(os.urandom(3 * STREAM_CHUNK), rsa_key),
+                                  rsa_key)
+    frames[0], frames[1] = frames[1], frames[0]
+    
+    with pytest.raises(ValueError):
+        decrypt_stream(prefix + b''.join(frames), rsa_key)
+
+
+def test_stream_detects_dropped_final_frame(rsa_key):
+    prefix, frames = split_frames(encrypt_stream(os.urandom(3 * STREAM_CHUNK), rsa_key),
+                                  rsa_key)
+    
+    with pytest.raises(ValueError):
+        decrypt_stream(prefix + b''.join(frames[:-1]), rsa_key)
+
+
+def test_stream_detects_early_final_flag(rsa_key):
+    prefix, frames = split_frames(encrypt_stream(os.urandom(3 * STREAM_CHUNK), rsa_key),
+                                  rsa_key)
+    # Mark the first frame as the last one and drop the rest
+    frame = bytearray(frames[0])
+    frame[0] = 1
+    
+    with pytest.raises(ValueError):
+        decrypt_stream(prefix + bytes(frame), rsa_key)
+
+
+def test_stream_rejects_trailing_data(rsa_key):
+    stream = encrypt_stream(os.urandom(STREAM_CHUNK), rsa_key)
+    
+    with pytest.raises(ValueError):
+        decrypt_stream(stream + b'\x00', rsa_key)
+
+
+# Binary container
+
+def browser_package() -> dict:
+    """Package in the field layout built by client/static/js/crypto.js"""
+    return {
+        'encryptedFile': base64.b64encode(os.urandom(1000)).decode(),
+        'encryptedAESKey': base64.b64encode(os.urandom(256)).decode(),
+        'iv': os.urandom(16).hex(),
+        'signature': base64.b64encode(os.urandom(256)).decode(),
+        'fileHash': hashlib.sha256(b'file').hexdigest(),
+        'fileName': 'report.pdf',
+        'senderId': 'alice'
+    }
+
+
+def test_container_round_trip_server_layout(rsa_key):
+    package = CryptoUtils.encrypt_and_sign(os.urandom(5000), rsa_key, rsa_key.publickey())
+    package['file_name'] = 'report.pdf'
+    
+    out = io.BytesIO()
+    written = CryptoUtils.write_container(out, package)
+    
+    assert written == len(out.getvalue())
+    assert CryptoUtils.read_container(io.BytesIO(out.getvalue())) == package
+
+
+def test_container_round_trip_browser_layout():
+    package = browser_package()
+    
+    out = io.BytesIO()
+    CryptoUtils.write_container(out, package)
+    
+    assert CryptoUtils.read_container(io.BytesIO(out.getvalue())) == package
+
+
+def test_container_stores_raw_ciphertext():
+    package = browser_package()
+    
+    out = io.BytesIO()
+    CryptoUtils.write_container(out, package)
+    header = CryptoUtils.read_container_header(io.BytesIO(out.getvalue()))
+    
+    assert header['layout'] == 1
+    assert out.getvalue()[header['ciphertext_offset']:] == \
+        base64.b64decode(package['encryptedFile'])
+
+
+@pytest.mark.parametrize('make_package', [browser_package, lambda: {
+    'encrypted_file': base64.b64encode(os.urandom(999)).decode(),
+    'encrypted_aes_key': base64.b64encode(os.urandom(256)).decode(),
+    'iv': base64.b64encode(os.urandom(16)).decode(),
+    'signature': base64.b64encode(os.urandom(256)).decode(),
+    'file_hash': hashlib.sha256(b'file').hexdigest(),
+    'recipient_id': 'bob'
+}])
+def test_iter_package_json_matches_package(make_package):
+    package = make_package()
+    out = io.BytesIO()
+    CryptoUtils.write_container(out, package)
+    
+    in_file = io.BytesIO(out.getvalue())
+    header = CryptoUtils.read_container_header(in_file)
+    streamed = b''.join(CryptoUtils.iter_package_json(header, in_file, block_size=100))
+    
+    assert json.loads(streamed) == package
+
+
+def test_container_rejects_non_canonical_fields():
+    package = browser_package()
+    package['iv'] = package['iv'].upper()
+    
+    with pytest.raises(ValueError):
+        CryptoUtils.write_container(io.BytesIO(), package)
+
+
+def test_container_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        CryptoUtils.read_container_header(io.BytesIO(b'JSON' + b'\x00' * 64))
+
+
+# Merkle trees
+
+MERKLE_CHUNK = 100
+
+
+def merkle_tree(data: bytes) -> dict:
+    return CryptoUtils.build_merkle_tree(io.BytesIO(data), chunk_size=MERKLE_CHUNK)
+
+
+@pytest.mark.parametrize('chunks', [1, 2, 5, 8])
+def test_merkle_proof_verifies_every_chunk(chunks):
+    data = os.urandom(chunks * MERKLE_CHUNK - 30)
+    tree = merkle_tree(data)
+    
+    for index in range(chunks):
+        chunk = data[index * MERKLE_CHUNK:(index + 1) * MERKLE_CHUNK]
+        proof = CryptoUtils.merkle_proof(tree, index)
+        assert CryptoUtils.verify_merkle_chunk(chunk, proof, tree['root'])
+
+
+def test_merkle_proof_rejects_wrong_chunk():
+    data = os.urandom(5 * MERKLE_CHUNK)
+    tree = merkle_tree(data)
+    proof = CryptoUtils.merkle_proof(tree, 2)
+    
+    # Another chunk, or the right chunk with one byte changed
+    assert not CryptoUtils.verify_merkle_chunk(data[:MERKLE_CHUNK], proof, tree['root'])
+    chunk = bytearray(data[2 * MERKLE_CHUNK:3 * MERKLE_CHUNK])
+    chunk[0] ^= 1
+    assert not CryptoUtils.verify_merkle_chunk(bytes(chunk), proof, tree['root'])
+
+
+def test_merkle_proof_rejects_wrong_root():
+    data = os.urandom(4 * MERKLE_CHUNK)
+    other = merkle_tree(os.urandom(4 * MERKLE_CHUNK))
+    proof = CryptoUtils.merkle_proof(merkle_tree(data), 0)
+    
+    assert not CryptoUtils.verify_merkle_chunk(data[:MERKLE_CHUNK], proof, other['root'])
+
+
+def test_merkle_leaf_cannot_pose_as_node():
+    # A leaf over the concatenation of two child hashes must not match their parent
+    data = os.urandom(2 * MERKLE_CHUNK)
+    tree = merkle_tree(data)
+    fake_chunk = b''.join(bytes.fromhex(leaf) for leaf in tree['leaves'])
+    
+    assert not CryptoUtils.verify_merkle_chunk(fake_chunk, [], tree['root'])
+
+
+def test_signed_merkle_tree(rsa_key):
+    tree = CryptoUtils.sign_merkle_tree(merkle_tree(os.urandom(3 * MERKLE_CHUNK)), rsa_key)
+    
+    assert CryptoUtils.verify_merkle_tree(tree, rsa_key.publickey())
+    
+    tree['leaves'][1] = tree['leaves'][0]
+    assert not CryptoUtils.verify_merkle_tree(tree, rsa_key.publickey())
+
+
+def test_find_corrupt_ranges():
+    data = bytearray(os.urandom(6 * MERKLE_CHUNK + 10))
+    tree = merkle_tree(bytes(data))
+    for position in (150, 250, 605):
+        data[position] ^= 1
+    
+    ranges = CryptoUtils.find_corrupt_ranges(io.BytesIO(bytes(data)), tree)
+    
+    assert ranges == [(100, 300), (600, 610)]
+
+
+# Compression
+
+def test_should_compress():
+    text = b'all work and no play makes jack a dull boy\n' * 1000
+    
+    assert CryptoUtils.should_compress(text, 'notes.txt')
+    assert not CryptoUtils.should_compress(text, 'photo.JPG')
+    assert not CryptoUtils.should_compress(os.urandom(100000), 'data.bin')
+    assert not CryptoUtils.should_compress(text[:COMPRESSION_MIN_SIZE - 1], 'notes.txt')
+
+
+def test_compress_round_trip_hashes_original():
+    data = os.urandom(1000) * 3000
+    compress_hash, decompress_hash = hashlib.sha256(), hashlib.sha256()
+    
+    compressed = CryptoUtils.compress_data(data, hasher=compress_hash)
+    decompressed = CryptoUtils.decompress_data(compressed, len(data), hasher=decompress_hash)
+    
+    assert len(compressed) < len(data)
+    assert decompressed == data
+    assert compress_hash.hexdigest() == decompress_hash.hexdigest() == \
+        hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize('declared', [0, 1000, 3 * 1024 * 1024 - 1])
+def test_decompress_rejects_data_larger_than_declared(declared):
+    # Compresses to several input chunks, so the limit is checked across chunks
+    data = os.urandom(3 * 1024 * 1024)
+    
+    with pytest.raises(ValueError):
+        CryptoUtils.decompress_data(CryptoUtils.compress_data(data), declared)
+
+
+def test_decompress_rejects_data_smaller_than_declared():
+    data = b'x' * 10000
+    
+    with pytest.raises(ValueError):
+        CryptoUtils.decompress_data(CryptoUtils.compress_data(data), len(data) + 1)
+
+
+@pytest.mark.parametrize('corrupt', [
+    lambda compressed: compressed[:len(compressed) // 2],
+    lambda compressed: compressed[:10] + bytes(b ^ 0xff for b in compressed[10:20])
+    + compressed[20:],
+    lambda compressed: b'not zlib data',
+])
+def test_decompress_rejects_corrupt_data(corrupt):
+    data = b'all work and no play makes jack a dull boy\n' * 1000
+    
+    with pytest.raises(ValueError):
+        CryptoUtils.decompress_data(corrupt(CryptoUtils.compress_data(data)), len(data))
+
+
+def test_compressed_package_round_trip(rsa_key):
+    data = b'all work and no play makes jack a dull boy\n' * 1000
+    
+    package = CryptoUtils.encrypt_and_sign(data, rsa_key, rsa_key.publickey(), compress=True)
+    decrypted, is_valid, _ = CryptoUtils.decrypt_and_verify(package, rsa_key,
+                                                            rsa_key.publickey())
+    
+    assert package['compression'] == COMPRESSION_ZLIB
+    assert (decrypted, is_valid) == (data, True)
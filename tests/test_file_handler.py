@@ -0,0 +1,383 @@
+# tests/test_file_handler.py
+"""Tests for server.file_handler"""
+
+import io
+import os
+import json
+import base64
+import time
+import hashlib
+import multiprocessing
+import pytest
+from shared.constants import (
+    CONTAINER_FILENAME, LEGACY_PACKAGE_FILENAME, MERKLE_TREE_FILENAME
+)
+from shared.models import UploadedFile
+from server.file_handler import FileHandler
+
+
+def server_package() -> dict:
+    return {
+        'encrypted_file': base64.b64encode(os.urandom(4000)).decode(),
+        'encrypted_aes_key': base64.b64encode(os.urandom(256)).decode(),
+        'iv': base64.b64encode(os.urandom(16)).decode(),
+        'signature': base64.b64encode(os.urandom(256)).decode(),
+        'file_hash': hashlib.sha256(b'file').hexdigest(),
+        'file_name': 'report.pdf'
+    }
+
+
+def write_legacy_package(file_handler, transfer_id: str, package: dict) -> str:
+    """Store a package the way releases before the binary container did"""
+    encrypted_dir = os.path.join(file_handler.upload_folder, 'encrypted', transfer_id)
+    os.makedirs(encrypted_dir)
+    with open(os.path.join(encrypted_dir, LEGACY_PACKAGE_FILENAME), 'w') as f:
+        json.dump(package, f)
+    return encrypted_dir
+
+
+# Encrypted packages
+
+def test_save_encrypted_file_writes_container(file_handler):
+    package = server_package()
+    
+    path = file_handler.save_encrypted_file(package, 't1')
+    
+    assert path.endswith(CONTAINER_FILENAME)
+    assert file_handler.load_encrypted_file('t1') == package
+
+
+def test_save_encrypted_file_falls_back_to_json(file_handler):
+    package = server_package()
+    package['signature'] = False
+    
+    path = file_handler.save_encrypted_file(package, 't1')
+    
+    assert path.endswith(LEGACY_PACKAGE_FILENAME)
+    assert file_handler.load_encrypted_file('t1') == package
+
+
+def test_convert_legacy_package(file_handler):
+    package = server_package()
+    encrypted_dir = write_legacy_package(file_handler, 't1', package)
+    with open(os.path.join(encrypted_dir, MERKLE_TREE_FILENAME), 'w') as f:
+        json.dump({'root': 'stale'}, f)
+    
+    path = file_handler.convert_legacy_package('t1')
+    
+    assert path == os.path.join(encrypted_dir, CONTAINER_FILENAME)
+    assert sorted(os.listdir(encrypted_dir)) == [CONTAINER_FILENAME]
+    assert file_handler.load_encrypted_file('t1') == package
+
+
+def test_convert_legacy_package_keeps_unconvertible_json(file_handler):
+    package = server_package()
+    package['signature'] = False
+    encrypted_dir = write_legacy_package(file_handler, 't1', package)
+    
+    assert file_handler.convert_legacy_package('t1') is None
+    assert os.listdir(encrypted_dir) == [LEGACY_PACKAGE_FILENAME]
+    assert file_handler.load_encrypted_file('t1') == package
+
+
+def test_convert_legacy_packages(file_handler):
+    write_legacy_package(file_handler, 't1', server_package())
+    write_legacy_package(file_handler, 't2', server_package())
+    file_handler.save_encrypted_file(server_package(), 't3')
+    
+    assert sorted(file_handler.convert_legacy_packages()) == ['t1', 't2']
+    assert file_handler.convert_legacy_packages() == []
+
+
+# Chunked encrypted uploads
+
+def test_encrypted_upload_commit(file_handler):
+    package = server_package()
+    ciphertext = base64.b64decode(package['encrypted_file'])
+    
+    header_size = file_handler.begin_encrypted_upload(package, 't1', len(ciphertext))
+    # Chunks may arrive out of order
+    for offset in (2000, 0, 3000, 1000):
+        file_handler.write_encrypted_chunk('t1', header_size + offset,
+                                           ciphertext[offset:offset + 1000])
+    
+    assert file_handler.get_encrypted_path('t1') is None
+    
+    path = file_handler.commit_encrypted_upload('t1')
+    
+    assert path == file_handler.get_encrypted_path('t1')
+    assert os.listdir(os.path.dirname(path)) == [CONTAINER_FILENAME]
+    assert file_handler.load_encrypted_file('t1') == package
+    assert file_handler.expiry_index.count() == 1
+
+
+def test_encrypted_upload_abort(file_handler):
+    package = server_package()
+    header_size = file_handler.begin_encrypted_upload(package, 't1', 4000)
+    file_handler.write_encrypted_chunk('t1', header_size, os.urandom(1000))
+    
+    file_handler.abort_encrypted_upload('t1')
+    
+    assert not os.path.exists(os.path.join(file_handler.upload_folder, 'encrypted', 't1'))
+    assert file_handler.get_encrypted_path('t1') is None
+    assert file_handler.expiry_index.count() == 0
+    # Aborting twice (e.g. on disconnect after an error) is harmless
+    file_handler.abort_encrypted_upload('t1')
+
+
+def test_encrypted_upload_rejects_unstorable_package(file_handler):
+    package = server_package()
+    package['signature'] = False
+    
+    with pytest.raises(ValueError):
+        file_handler.begin_encrypted_upload(package, 't1', 4000)
+    
+    assert not os.path.exists(os.path.join(file_handler.upload_folder, 'encrypted', 't1'))
+
+
+# Resumable upload sessions
+
+def test_upload_session_resume(file_handler):
+    data = os.urandom(10000)
+    session_id = file_handler.create_upload_session('alice', 'a.txt', len(data))['session_id']
+    
+    session = file_handler.write_upload_chunk(session_id, 6000, data[6000:])
+    assert session['missing'] == [[0, 6000]]
+    session = file_handler.write_upload_chunk(session_id, 0, data[:2000])
+    assert session['missing'] == [[2000, 6000]]
+    
+    # After a restart the session is read back from disk; a re-sent chunk
+    # overlapping received data is accepted
+    restarted = FileHandler(file_handler.upload_folder)
+    assert restarted.get_upload_session(session_id)['received'] == [[0, 2000], [6000, 10000]]
+    session = restarted.write_upload_chunk(session_id, 1000, data[1000:6500])
+    assert session['received'] == [[0, 10000]]
+    assert session['missing'] == []
+    
+    file_id, file_path, file_size, file_hash = restarted.finalize_upload_session(session_id)
+    
+    with open(file_path, 'rb') as f:
+        assert f.read() == data
+    assert (file_size, file_hash) == (len(data), hashlib.sha256(data).hexdigest())
+    assert UploadedFile.query.filter_by(file_id=file_id).one().user_id == 'alice'
+    assert restarted.get_upload_session(session_id) is None
+
+
+def test_upload_session_rejects_incomplete_finalize(file_handler):
+    session_id = file_handler.create_upload_session('alice', 'a.txt', 100)['session_id']
+    file_handler.write_upload_chunk(session_id, 0, b'x' * 50)
+    
+    with pytest.raises(ValueError):
+        file_handler.finalize_upload_session(session_id)
+    assert file_handler.get_upload_session(session_id)['missing'] == [[50, 100]]
+
+
+def test_upload_session_rejects_chunk_outside_file(file_handler):
+    session_id = file_handler.create_upload_session('alice', 'a.txt', 100)['session_id']
+    
+    with pytest.raises(ValueError):
+        file_handler.write_upload_chunk(session_id, 90, b'x' * 11)
+    with pytest.raises(ValueError):
+        file_handler.write_upload_chunk(session_id, -1, b'x')
+    with pytest.raises(KeyError):
+        file_handler.write_upload_chunk('unknown', 0, b'x')
+
+
+def test_expire_upload_sessions(file_handler):
+    stale = file_handler.create_upload_session('alice', 'a.txt', 100)
+    active = file_handler.create_upload_session('alice', 'b.txt', 100)
+    stale['updated_at'] = time.time() - 7200
+    file_handler._save_session(stale)
+    
+    assert file_handler.expire_upload_sessions(3600) == 1
+    
+    assert file_handler.get_upload_session(stale['session_id']) is None
+    assert not os.path.exists(os.path.join(file_handler.sessions_folder,
+                                           stale['session_id']))
+    assert file_handler.get_upload_session(active['session_id']) is not None
+
+
+def test_upload_session_locks_are_only_kept_for_live_sessions(file_handler):
+    session_id = file_handler.create_upload_session('alice', 'a.txt', 10)['session_id']
+    expired_id = file_handler.create_upload_session('alice', 'b.txt', 10)['session_id']
+    
+    with pytest.raises(KeyError):
+        file_handler.write_upload_chunk('unknown', 0, b'x')
+    file_handler.write_upload_chunk(session_id, 0, b'x' * 10)
+    file_handler.write_upload_chunk(expired_id, 0, b'x')
+    assert sorted(file_handler._session_locks) == sorted([session_id, expired_id])
+    
+    file_handler.finalize_upload_session(session_id)
+    file_handler.expire_upload_sessions(-1)
+    
+    assert file_handler._session_locks == {}
+
+
+def _write_chunks(upload_folder: str, session_id: str, offsets: list, data: bytes):
+    handler = FileHandler(upload_folder)
+    for offset in offsets:
+        handler.write_upload_chunk(session_id, offset, data[offset:offset + 100])
+
+
+def test_upload_session_chunks_from_several_workers(file_handler):
+    data = os.urandom(100 * 100)
+    session_id = file_handler.create_upload_session('alice', 'a.txt', len(data))['session_id']
+    offsets = list(range(0, len(data), 100))
+    
+    # Two worker processes write alternate chunks of the same session
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_write_chunks,
+                               args=(file_handler.upload_folder, session_id,
+                                     offsets[start::2], data))
+               for start in (0, 1)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    
+    assert [worker.exitcode for worker in workers] == [0, 0]
+    assert file_handler.get_upload_session(session_id)['received'] == [[0, len(data)]]
+    _, file_path, _, _ = file_handler.finalize_upload_session(session_id)
+    with open(file_path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_chunk_keeps_session_alive(file_handler):
+    session = file_handler.create_upload_session('alice', 'a.txt', 100)
+    session['updated_at'] = time.time() - 7200
+    file_handler._save_session(session)
+    
+    file_handler.write_upload_chunk(session['session_id'], 0, b'x' * 10)
+    
+    assert file_handler.expire_upload_sessions(3600) == 0
+
+
+# Deduplicated blob store
+
+def test_identical_uploads_share_one_blob(file_handler):
+    data = os.urandom(5000)
+    file_hash = hashlib.sha256(data).hexdigest()
+    
+    _, first_path, _ = file_handler.save_uploaded_file(data, 'a.txt', 'alice')
+    _, second_path, _ = file_handler.save_uploaded_file(data, 'b.txt', 'bob')
+    
+    assert file_handler.blob_store.refcount(file_hash) == 2
+    assert os.path.samefile(first_path, second_path)
+    assert os.path.samefile(first_path, file_handler.blob_store.blob_path(file_hash))
+
+
+def test_delete_releases_blob_after_last_reference(file_handler):
+    data = os.urandom(5000)
+    file_hash = hashlib.sha256(data).hexdigest()
+    _, first_path, _ = file_handler.save_uploaded_file(data, 'a.txt', 'alice')
+    _, second_path, _ = file_handler.save_uploaded_file(data, 'b.txt', 'bob')
+    
+    assert file_handler.delete_file(first_path)
+    assert file_handler.blob_store.refcount(file_hash) == 1
+    assert file_handler.blob_store.exists(file_hash)
+    with open(second_path, 'rb') as f:
+        assert f.read() == data
+    
+    assert file_handler.delete_file(second_path)
+    assert not file_handler.blob_store.exists(file_hash)
+    assert UploadedFile.query.count() == 0
+
+
+def test_streamed_upload_links_stored_blob(file_handler):
+    data = os.urandom(5000)
+    file_hash = hashlib.sha256(data).hexdigest()
+    file_handler.save_uploaded_file(data, 'a.txt', 'alice')
+    
+    _, file_path, file_size, stream_hash = file_handler.save_uploaded_stream(
+        io.BytesIO(data), 'b.txt', 'bob', chunk_size=1000
+    )
+    
+    assert (file_size, stream_hash) == (len(data), file_hash)
+    assert file_handler.blob_store.refcount(file_hash) == 2
+    # The streamed copy was dropped in favour of the stored blob
+    assert os.listdir(file_handler.blob_store.temp_dir) == []
+
+
+# Expiry index cleanup
+
+DAY = 24 * 60 * 60
+
+
+def backdate(file_handler, path: str, days: float):
+    """Make a tracked directory look days old to the expiry index"""
+    file_handler.expiry_index.add(os.path.relpath(path, file_handler.upload_folder),
+                                  time.time() - days * DAY)
+
+
+def test_cleanup_deletes_expired_upload(file_handler):
+    data = os.urandom(1000)
+    file_hash = hashlib.sha256(data).hexdigest()
+    old_id, old_path, _ = file_handler.save_uploaded_file(data, 'a.txt', 'alice')
+    _, new_path, _ = file_handler.save_uploaded_file(os.urandom(1000), 'b.txt', 'bob')
+    backdate(file_handler, os.path.dirname(old_path), 8)
+    
+    assert file_handler.cleanup_old_files(days=7) == 1
+    
+    assert not os.path.exists(os.path.join(file_handler.upload_folder, 'alice'))
+    assert os.path.exists(new_path)
+    assert UploadedFile.query.filter_by(file_id=old_id).first() is None
+    assert not file_handler.blob_store.exists(file_hash)
+    assert file_handler.expiry_index.count() == 1
+
+
+def test_cleanup_deletes_expired_package(file_handler):
+    old_path = file_handler.save_encrypted_file(server_package(), 't1')
+    file_handler.save_encrypted_file(server_package(), 't2')
+    backdate(file_handler, os.path.dirname(old_path), 8)
+    
+    assert file_handler.cleanup_old_files(days=7) == 1
+    
+    assert file_handler.get_encrypted_path('t1') is None
+    assert file_handler.get_encrypted_path('t2') is not None
+
+
+def test_cleanup_works_in_batches(file_handler):
+    for index in range(3):
+        path = file_handler.save_encrypted_file(server_package(), f't{index}')
+        backdate(file_handler, os.path.dirname(path), 8 + index)
+    
+    assert file_handler.cleanup_old_files(days=7, batch_size=2) == 2
+    # Oldest first
+    assert file_handler.get_encrypted_path('t0') is not None
+    assert file_handler.cleanup_old_files(days=7, batch_size=2) == 1
+    assert file_handler.cleanup_old_files(days=7, batch_size=2) == 0
+
+
+def test_rewritten_entry_is_not_expired(file_handler):
+    path = file_handler.save_encrypted_file(server_package(), 't1')
+    backdate(file_handler, os.path.dirname(path), 8)
+    file_handler.save_encrypted_file(server_package(), 't1')
+    
+    assert file_handler.cleanup_old_files(days=7) == 0
+    assert file_handler.get_encrypted_path('t1') is not None
+
+
+def test_expiry_index_survives_restart(file_handler):
+    path = file_handler.save_encrypted_file(server_package(), 't1')
+    file_handler.save_encrypted_file(server_package(), 't2')
+    backdate(file_handler, os.path.dirname(path), 8)
+    
+    restarted = FileHandler(file_handler.upload_folder)
+    
+    assert restarted.expiry_index.count() == 2
+    assert restarted.cleanup_old_files(days=7) == 1
+    assert restarted.get_encrypted_path('t1') is None
+
+
+def test_expiry_index_rebuilt_from_existing_files(file_handler):
+    _, upload_path, _ = file_handler.save_uploaded_file(os.urandom(1000), 'a.txt', 'alice')
+    file_handler.save_encrypted_file(server_package(), 't1')
+    old = time.time() - 8 * DAY
+    os.utime(os.path.dirname(upload_path), (old, old))
+    os.remove(file_handler.expiry_index.index_path)
+    
+    restarted = FileHandler(file_handler.upload_folder)
+    
+    assert restarted.expiry_index.count() == 2
+    assert restarted.cleanup_old_files(days=7) == 1
+    assert not os.path.exists(upload_path)
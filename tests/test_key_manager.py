@@ -0,0 +1,91 @@
+# tests/test_key_manager.py
+"""Tests for server.key_manager"""
+
+import os
+from Crypto.PublicKey import RSA
+from server.key_manager import KeyCache, KeyManager
+
+
+def write_legacy_user(key_manager: KeyManager, user_id: str, public_key: bytes) -> str:
+    user_dir = os.path.join(key_manager.keys_directory, user_id)
+    os.makedirs(user_dir)
+    with open(os.path.join(user_dir, "public_key.pem"), 'wb') as f:
+        f.write(public_key)
+    return user_dir
+
+
+def test_migrate_moves_legacy_users(tmp_path):
+    key_manager = KeyManager(str(tmp_path / 'keys'))
+    legacy_dir = write_legacy_user(key_manager, 'alice', b'alice key')
+    
+    assert key_manager.migrate_to_sharded() == 1
+    
+    sharded_dir = key_manager._sharded_user_dir('alice')
+    assert not os.path.exists(legacy_dir)
+    with open(os.path.join(sharded_dir, "public_key.pem"), 'rb') as f:
+        assert f.read() == b'alice key'
+    assert key_manager._find_user_dir('alice') == sharded_dir
+    assert key_manager.migrate_to_sharded() == 0
+
+
+def test_migrate_keeps_already_migrated_copy(tmp_path):
+    key_manager = KeyManager(str(tmp_path / 'keys'))
+    sharded_dir = key_manager._sharded_user_dir('bob')
+    os.makedirs(sharded_dir)
+    with open(os.path.join(sharded_dir, "public_key.pem"), 'wb') as f:
+        f.write(b'new key')
+    legacy_dir = write_legacy_user(key_manager, 'bob', b'stale key')
+    write_legacy_user(key_manager, 'carol', b'carol key')
+    
+    assert key_manager.migrate_to_sharded() == 2
+    
+    assert not os.path.exists(legacy_dir)
+    with open(os.path.join(sharded_dir, "public_key.pem"), 'rb') as f:
+        assert f.read() == b'new key'
+    assert os.path.isdir(key_manager._sharded_user_dir('carol'))
+    assert sorted(user_id for user_id, _ in key_manager._iter_user_dirs()) == ['bob', 'carol']
+
+
+# Key cache
+
+def test_cache_evicts_least_recently_used():
+    cache = KeyCache(maxsize=2)
+    cache.put(('a', 'public_key.pem'), 1, 'key a')
+    cache.put(('b', 'public_key.pem'), 1, 'key b')
+    assert cache.get(('a', 'public_key.pem'), 1) == 'key a'
+    
+    cache.put(('c', 'public_key.pem'), 1, 'key c')
+    
+    assert cache.get(('b', 'public_key.pem'), 1) is None
+    assert cache.get(('a', 'public_key.pem'), 1) == 'key a'
+    assert cache.get(('c', 'public_key.pem'), 1) == 'key c'
+    assert cache.stats()['size'] == 2
+
+
+def test_cache_counts_hits_and_misses(tmp_path, rsa_key):
+    key_manager = KeyManager(str(tmp_path / 'keys'))
+    write_legacy_user(key_manager, 'alice', rsa_key.publickey().export_key())
+    
+    assert key_manager.load_public_key('alice') == rsa_key.publickey()
+    assert key_manager.load_public_key('alice') == rsa_key.publickey()
+    assert key_manager.load_public_key('alice') == rsa_key.publickey()
+    
+    assert key_manager.cache_stats() == {'hits': 2, 'misses': 1, 'size': 1, 'maxsize': 256}
+
+
+def test_cache_reloads_changed_key_file(tmp_path, rsa_key):
+    key_manager = KeyManager(str(tmp_path / 'keys'))
+    user_dir = write_legacy_user(key_manager, 'alice', rsa_key.publickey().export_key())
+    key_path = os.path.join(user_dir, "public_key.pem")
+    assert key_manager.load_public_key('alice') == rsa_key.publickey()
+    
+    # Replaced behind the cache's back, e.g. by another worker
+    new_key = RSA.generate(1024).publickey()
+    mtime_ns = os.stat(key_path).st_mtime_ns
+    with open(key_path, 'wb') as f:
+        f.write(new_key.export_key())
+    os.utime(key_path, ns=(mtime_ns + 1, mtime_ns + 1))
+    
+    assert key_manager.load_public_key('alice') == new_key
+    assert key_manager.cache_stats()['misses'] == 2
+    assert key_manager.cache_stats()['size'] == 1
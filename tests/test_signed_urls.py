@@ -0,0 +1,53 @@
+# tests/test_signed_urls.py
+"""Tests for server.signed_urls"""
+
+import time
+import pytest
+from server.signed_urls import DownloadSigner, BadSignature, SignatureExpired
+
+
+def flip_signature_char(token: str) -> str:
+    # The first character is fully significant, unlike the last one
+    payload, signature = token.rsplit('.', 1)
+    return payload + '.' + ('A' if signature[0] != 'A' else 'B') + signature[1:]
+
+
+def test_token_round_trip():
+    signer = DownloadSigner('secret')
+    
+    assert signer.verify(signer.sign('t1', 'bob')) == ('t1', 'bob')
+
+
+def test_rejects_expired_token(monkeypatch):
+    signer = DownloadSigner('secret', ttl=300)
+    token = signer.sign('t1', 'bob')
+    now = time.time()
+    
+    monkeypatch.setattr(time, 'time', lambda: now + 299)
+    assert signer.verify(token) == ('t1', 'bob')
+    
+    monkeypatch.setattr(time, 'time', lambda: now + 302)
+    with pytest.raises(SignatureExpired):
+        signer.verify(token)
+
+
+@pytest.mark.parametrize('tamper', [
+    # Payload swapped for another transfer, signature kept
+    lambda token, signer: signer.sign('t2', 'bob').split('.')[0] + '.' + token.split('.', 1)[1],
+    lambda token, signer: flip_signature_char(token),
+    lambda token, signer: token + 'x',
+    lambda token, signer: 'not a token',
+])
+def test_rejects_tampered_token(tamper):
+    signer = DownloadSigner('secret')
+    token = signer.sign('t1', 'bob')
+    
+    with pytest.raises(BadSignature):
+        signer.verify(tamper(token, signer))
+
+
+def test_rejects_token_from_other_secret():
+    token = DownloadSigner('other secret').sign('t1', 'bob')
+    
+    with pytest.raises(BadSignature):
+        DownloadSigner('secret').verify(token)
@@ -0,0 +1,99 @@
+# tests/test_transfer_history.py
+"""Tests for server.transfer_history"""
+
+from datetime import datetime, timedelta
+import pytest
+from shared.models import db, FileTransfer
+from server.transfer_history import query_transfer_history, encode_cursor, decode_cursor
+
+T0 = datetime(2026, 1, 1)
+
+
+def add_transfers(count: int, sender_id: str = 'alice', recipient_id: str = 'bob',
+                  status: str = 'completed', same_time: bool = False) -> list:
+    """Insert transfers, one second apart unless same_time"""
+    start = FileTransfer.query.count()
+    transfers = []
+    for i in range(start, start + count):
+        transfers.append(FileTransfer(
+            transfer_id=f't{i}', sender_id=sender_id, recipient_id=recipient_id,
+            file_name='file.bin', file_size=1024, file_hash='0' * 64, status=status,
+            created_at=T0 if same_time else T0 + timedelta(seconds=i)
+        ))
+    db.session.add_all(transfers)
+    db.session.commit()
+    return transfers
+
+
+def page_through(user_id: str, direction: str, limit: int, **kwargs) -> list:
+    """Follow before cursors until a short page; returns the pages' transfer IDs"""
+    pages = []
+    cursor = None
+    while True:
+        page = query_transfer_history(user_id, direction, before=cursor, limit=limit, **kwargs)
+        pages.append([transfer.transfer_id for transfer in page])
+        if len(page) < limit:
+            return pages
+        cursor = encode_cursor(page[-1])
+
+
+def newest_first(transfers: list) -> list:
+    return [transfer.transfer_id for transfer in
+            sorted(transfers, key=lambda t: (t.created_at, t.id), reverse=True)]
+
+
+def test_cursor_round_trip(app):
+    transfer = add_transfers(1)[0]
+    
+    assert decode_cursor(encode_cursor(transfer)) == (transfer.created_at, transfer.id)
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+
+
+def test_pages_cover_history_once(app):
+    transfers = add_transfers(23)
+    add_transfers(5, sender_id='carol')
+    
+    pages = page_through('alice', 'sent', limit=5)
+    
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert sum(pages, []) == newest_first(transfers)
+
+
+def test_pages_split_rows_with_the_same_timestamp(app):
+    transfers = add_transfers(7, same_time=True)
+    
+    pages = page_through('alice', 'sent', limit=3)
+    
+    assert sum(pages, []) == newest_first(transfers)
+
+
+def test_direction_and_status_filters(app):
+    sent = add_transfers(4)
+    received = add_transfers(3, sender_id='bob', recipient_id='alice')
+    add_transfers(2, status='failed')
+    
+    assert sum(page_through('alice', 'received', limit=2), []) == newest_first(received)
+    assert sum(page_through('alice', 'sent', limit=2, statuses=['completed']), []) == \
+        newest_first(sent)
+
+
+def test_since_catches_up_without_gaps(app):
+    add_transfers(3)
+    cursor = encode_cursor(query_transfer_history('alice', 'sent', limit=1)[0])
+    new = add_transfers(5)
+    
+    seen = []
+    while True:
+        page = query_transfer_history('alice', 'sent', since=cursor, limit=2)
+        if not page:
+            break
+        seen += [transfer.transfer_id for transfer in page]
+        cursor = encode_cursor(page[0])
+    
+    assert sorted(seen) == sorted(transfer.transfer_id for transfer in new)
+
+
+def test_invalid_direction(app):
+    with pytest.raises(ValueError):
+        query_transfer_history('alice', 'both')